@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark: runtime of the lookup as the gazetteer grows.
+
+For every gazetteer size, a synthetic gazetteer and a fixed synthetic corpus
+are generated. Then, the time to retrieve the annotations of every candidate
+token with a linear scan of annot2annot_processed (old behaviour) and with
+the inverted index returned by format_ann_info is measured, together with the
+whole find_predictions run.
+
+Usage:
+$> python benchmarks/gazetteer_size.py --sizes 1000 10000 100000 --n_docs 500
+"""
+import os
+import sys
+import time
+import random
+import tempfile
+import argparse
+import contextlib
+import io
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils import format_ann_info, format_text_info
+from lookup import find_predictions
+
+SYLLABLES = ['ma', 'ri', 'con', 'ta', 'dor', 'en', 'fer', 'me', 'ra', 'pro', 'fe',
+             'sor', 'lo', 'gis', 'ca', 'ni', 'co', 'ju', 'bi', 'la', 'des', 'pe']
+CONNECTORS = ['de', 'del', 'en', 'de la']
+FILLER = ('el la que y en un una los se del las por con no para es al lo como '
+          'más pero sus le ya o este porque esta entre cuando muy sin sobre '
+          'hoy gente vida trabajo calle ciudad #COVID19 @usuario').split()
+
+
+def make_word(rnd):
+    return ''.join(rnd.choice(SYLLABLES) for _ in range(rnd.randint(2, 4)))
+
+
+def make_gazetteer(n_entries, rnd):
+    entries = set()
+    while len(entries) < n_entries:
+        if rnd.random() < 0.5:
+            entries.add(make_word(rnd))
+        else:
+            entries.add(' '.join([make_word(rnd), rnd.choice(CONNECTORS), make_word(rnd)]))
+    entries = sorted(entries)
+    labels = [rnd.choice(['PROFESION', 'SITUACION_LABORAL']) for _ in entries]
+    return pd.DataFrame({'tweet_id': range(len(entries)), 'begin': 0,
+                         'end': [len(e) for e in entries], 'type': labels,
+                         'extraction': entries})
+
+
+def make_corpus(datapath, n_docs, entries, rnd):
+    for i in range(n_docs):
+        words = []
+        for _ in range(rnd.randint(10, 40)):
+            if rnd.random() < 0.1:
+                words.append(rnd.choice(entries))
+            else:
+                words.append(rnd.choice(FILLER))
+        with open(os.path.join(datapath, '{}.txt'.format(i)), 'w') as f:
+            f.write(' '.join(words))
+
+
+def time_candidates(datapath, min_upper, annot2annot_processed, annotations_final,
+                    token2annots):
+    '''
+    DESCRIPTION: time the retrieval of the annotations of every candidate
+              token with a linear scan and with the inverted index.
+    '''
+    candidates = []
+    for filename in os.listdir(datapath):
+        txt = open(os.path.join(datapath, filename)).read()
+        words_final, _ = format_text_info(txt, min_upper)
+        candidates.extend(words_final.intersection(annotations_final))
+
+    start = time.time()
+    for match in candidates:
+        [k for k,v in annot2annot_processed.items() if match in v]
+    t_scan = time.time() - start
+
+    start = time.time()
+    for match in candidates:
+        token2annots[match]
+    t_index = time.time() - start
+    return t_scan, t_index
+
+
+def main():
+    parser = argparse.ArgumentParser(description='gazetteer size benchmark')
+    parser.add_argument("--sizes", nargs='+', type=int, default=[1000, 10000, 100000],
+                        help="number of gazetteer entries")
+    parser.add_argument("--n_docs", type=int, default=500, help="number of documents")
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+    args = parser.parse_args()
+    min_upper = 3
+
+    print('{:>10} {:>12} {:>12} {:>12} {:>12} {:>12}'.format(
+        'entries', 'format_ann', 'scan', 'index', 'legacy', 'trie'))
+    for size in args.sizes:
+        rnd = random.Random(args.seed)
+        df_annot = make_gazetteer(size, rnd)
+        with tempfile.TemporaryDirectory() as datapath:
+            make_corpus(datapath, args.n_docs, list(df_annot.extraction), rnd)
+
+            start = time.time()
+            annot2label, annot2annot_processed, annotations_final, token2annots = \
+                format_ann_info(df_annot, min_upper)
+            t_format = time.time() - start
+
+            t_scan, t_index = time_candidates(datapath, min_upper, annot2annot_processed,
+                                              annotations_final, token2annots)
+            times = []
+            for engine in ['legacy', 'trie']:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    total_t, _ = find_predictions(datapath, min_upper, annot2label,
+                                                  annot2annot_processed, annotations_final,
+                                                  token2annots, df_annot, engine)
+                times.append(total_t)
+        print('{:>10} {:>11.3f}s {:>11.3f}s {:>11.3f}s {:>11.3f}s {:>11.3f}s'.format(
+            size, t_format, t_scan, t_index, *times))
+
+
+if __name__ == '__main__':
+    main()
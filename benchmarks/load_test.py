@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Load test of the matching server (server.py): latency percentiles and
+throughput of batches of synthetic tweets (see synthetic.py) sent by
+concurrent clients over keep-alive connections.
+
+Without --address, a server is started on a free port with the synthetic
+gazetteer and stopped at the end. Requests rejected by backpressure (503)
+are counted apart and not included in the latencies.
+
+Usage:
+$> python benchmarks/load_test.py --requests 500 --concurrency 8 --batch 20 --workers 2
+$> python benchmarks/load_test.py --address 127.0.0.1:8000
+"""
+import os
+import sys
+import json
+import time
+import signal
+import argparse
+import tempfile
+import threading
+import statistics
+import subprocess
+import http.client
+
+import synthetic
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+from corpus import iter_documents
+
+SERVER = os.path.join(REPO, 'server.py')
+
+
+def start_server(gs_path, args):
+    '''
+    DESCRIPTION: start server.py on a free port.
+
+    OUTPUT: process: subprocess.Popen.
+            address: (host, port).
+    '''
+    process = subprocess.Popen([sys.executable, SERVER, '-gs', gs_path, '--port', '0',
+                                '-w', str(args.workers), '-e', args.engine,
+                                '--max_pending', str(args.max_pending)],
+                               stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                               universal_newlines=True)
+    for line in process.stdout:
+        if line.startswith('Listening on '):
+            host, port = line.split()[-1].rsplit(':', 1)
+            return process, (host, int(port))
+    raise RuntimeError('The server did not start')
+
+
+def run_clients(address, batches, sub_track, concurrency):
+    '''
+    DESCRIPTION: send every batch once, from concurrency threads.
+
+    OUTPUT: latencies: list of seconds of the answered requests.
+            statuses: python dict {HTTP status: number of requests}.
+            wall: seconds from the first request to the last answer.
+    '''
+    latencies = []
+    statuses = {}
+    lock = threading.Lock()
+    next_batch = iter(batches)
+
+    def client():
+        connection = http.client.HTTPConnection(*address)
+        while True:
+            with lock:
+                batch = next(next_batch, None)
+            if batch is None:
+                break
+            body = json.dumps({'sub_track': sub_track, 'documents': batch})
+            start = time.perf_counter()
+            connection.request('POST', '/match', body,
+                               {'Content-Type': 'application/json'})
+            response = connection.getresponse()
+            response.read()
+            elapsed = time.perf_counter() - start
+            with lock:
+                statuses[response.status] = statuses.get(response.status, 0) + 1
+                if response.status == 200:
+                    latencies.append(elapsed)
+        connection.close()
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, statuses, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='matching server load test')
+    synthetic.add_arguments(parser)
+    parser.add_argument("--address", default="", help="host:port of a running server "
+                        "(default: start one with the synthetic gazetteer)")
+    parser.add_argument("--requests", type=int, default=500, help="number of requests")
+    parser.add_argument("--concurrency", type=int, default=8, help="concurrent clients")
+    parser.add_argument("--batch", type=int, default=20, help="tweets per request")
+    parser.add_argument("--sub_track", type=int, default=2, choices=[1, 2])
+    parser.add_argument("--workers", type=int, default=1, help="server worker processes")
+    parser.add_argument("--engine", default="legacy", choices=["legacy", "trie"])
+    parser.add_argument("--max_pending", type=int, default=10000,
+                        help="server backpressure limit (documents being matched)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        gs_path, data_path = synthetic.generate(args, tmp_dir, 'jsonl')
+        docs = [{'tweet_id': doc_id, 'text': txt} for doc_id, txt in iter_documents(data_path)]
+        batches = [[docs[(i * args.batch + j) % len(docs)] for j in range(args.batch)]
+                   for i in range(args.requests)]
+
+        process = None
+        if args.address != '':
+            host, port = args.address.rsplit(':', 1)
+            address = (host, int(port))
+        else:
+            process, address = start_server(gs_path, args)
+        try:
+            latencies, statuses, wall = run_clients(address, batches, args.sub_track,
+                                                    args.concurrency)
+        finally:
+            if process is not None:
+                process.send_signal(signal.SIGTERM)
+                process.wait()
+
+    print('server {}:{}  gazetteer {}'.format(
+        address[0], address[1], 'of the running server' if process is None else
+        '{} synthetic entries'.format(args.n_entries)))
+    print('requests {}  concurrency {}  batch {}  statuses {}'.format(
+        args.requests, args.concurrency, args.batch,
+        ' '.join('{}:{}'.format(k, v) for k, v in sorted(statuses.items()))))
+    if len(latencies) < 2:
+        print('Not enough answered requests to compute percentiles')
+        return
+    cuts = statistics.quantiles(latencies, n=100, method='inclusive')
+    print('latency  p50 {:.1f} ms  p90 {:.1f} ms  p99 {:.1f} ms  max {:.1f} ms'.format(
+        cuts[49] * 1000, cuts[89] * 1000, cuts[98] * 1000, max(latencies) * 1000))
+    print('throughput  {:.1f} requests/s  {:.1f} tweets/s'.format(
+        len(latencies) / wall, len(latencies) * args.batch / wall))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark suite: time every stage of the lookup on a synthetic ProfNER-shaped
+dataset (see synthetic.py) and compare with a stored baseline.
+
+Stages:
++ parse_tsv: read the GS file.
++ format_ann_info: extract the lookup structures from the annotations.
++ build_trie: build the structures of the trie engine.
++ read: read the documents.
++ prefilter: build the prefilter keys and reject the documents without any
+  gazetteer token (see prefilter.py). The rejected documents are not
+  matched by either engine.
++ format_text_info, intersection, check_surroundings: legacy engine, per
+  document (check_surroundings is the whole match_candidates step).
++ trie_match: trie engine, per document.
++ output: write the predictions TSV.
+
+Throughput (docs/sec) is reported for both engines (prefilter included) and
+for the whole legacy run (read + prefilter + legacy engine + output),
+together with the peak RSS of the process and the prefilter rejection rate. Every stage keeps the best time of --repeat runs.
+
+With the stored baseline (benchmarks/baseline.json by default), stages more
+than --tolerance slower, throughputs that drop or a peak RSS that grows are
+reported as regressions, and the script exits with status 1. Timings depend
+on the machine: record the baseline on the machine where it is compared.
+
+Usage:
+$> python benchmarks/pipeline.py
+$> python benchmarks/pipeline.py --save_baseline
+$> python benchmarks/pipeline.py --n_entries 50000 --n_docs 10000 --baseline ''
+"""
+import os
+import sys
+import json
+import time
+import platform
+import tempfile
+import argparse
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from parse_inputs import parse_tsv
+from utils import format_ann_info, format_text_info, clear_normalization_cache
+from trie import build_trie, find_matches
+from spans import SpanSet
+from records import label_table
+from matcher import match_candidates
+from prefilter import prefilter_keys, may_match
+from corpus import iter_documents
+from output import PredictionWriter
+from gazetteer import MIN_UPPER, LABELS
+import synthetic
+
+STAGES = ['parse_tsv', 'format_ann_info', 'build_trie', 'read', 'prefilter',
+          'format_text_info', 'intersection', 'check_surroundings', 'trie_match', 'output']
+
+# Stages faster than this (seconds) are too noisy to report regressions
+MIN_TIME = 0.05
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes in macOS, kilobytes in Linux
+    return rss / (1 << 20) if sys.platform == 'darwin' else rss / (1 << 10)
+
+
+def run_stages(gs_path, data_path, out_path, min_upper):
+    '''
+    DESCRIPTION: run the whole lookup on a dataset, timing every stage.
+
+    OUTPUT: times: python dict {stage: seconds}.
+            n_docs, n_predictions, n_rejected: int.
+    '''
+    clear_normalization_cache()
+    times = dict.fromkeys(STAGES, 0.0)
+    clock = time.perf_counter
+
+    start = clock()
+    df_annot = parse_tsv(gs_path, 2)
+    df_annot = df_annot.loc[df_annot['type'].isin(LABELS)]
+    times['parse_tsv'] = clock() - start
+
+    start = clock()
+    annot2label, annot2annot_processed, annotations_final, token2annots = \
+        format_ann_info(df_annot, min_upper)
+    times['format_ann_info'] = clock() - start
+    labels = label_table(annot2label)
+
+    start = clock()
+    trie, unigrams = build_trie(annot2label, annot2annot_processed, min_upper)
+    times['build_trie'] = clock() - start
+
+    start = clock()
+    docs = list(iter_documents(data_path))
+    times['read'] = clock() - start
+
+    start = clock()
+    keys = prefilter_keys(annotations_final)
+    candidates = [(doc_id, txt) for doc_id, txt in docs if may_match(txt, keys)]
+    times['prefilter'] = clock() - start
+
+    predictions = []
+    for doc_id, txt in candidates:
+        t0 = clock()
+        words_final, words_processed2pos = format_text_info(txt, min_upper)
+        t1 = clock()
+        words_in_annots = words_final.intersection(annotations_final)
+        t2 = clock()
+        spans = SpanSet(txt, labels)
+        match_candidates(txt, words_in_annots, words_processed2pos, token2annots,
+                         min_upper, spans)
+        t3 = clock()
+        times['format_text_info'] += t1 - t0
+        times['intersection'] += t2 - t1
+        times['check_surroundings'] += t3 - t2
+        predictions.append((doc_id, spans.predictions()))
+
+    start = clock()
+    for doc_id, txt in candidates:
+        find_matches(txt, trie, unigrams, min_upper, SpanSet(txt, labels))
+    times['trie_match'] = clock() - start
+
+    start = clock()
+    with PredictionWriter(out_path, 2) as writer:
+        for doc_id, doc_predictions in predictions:
+            writer.write(doc_id, doc_predictions)
+    times['output'] = clock() - start
+
+    return (times, len(docs), sum(len(p) for _, p in predictions),
+            len(docs) - len(candidates))
+
+
+def throughput(times, n_docs):
+    legacy = (times['prefilter'] + times['format_text_info'] + times['intersection'] +
+              times['check_surroundings'])
+    trie = times['prefilter'] + times['trie_match']
+    end_to_end = times['read'] + legacy + times['output']
+    return {'legacy': n_docs / legacy if legacy else None,
+            'trie': n_docs / trie if trie else None,
+            'end_to_end': n_docs / end_to_end if end_to_end else None}
+
+
+def compare(result, baseline, tolerance):
+    '''
+    DESCRIPTION: print the results next to the baseline.
+
+    OUTPUT: regressions: list of str with the regressed metrics.
+    '''
+    regressions = []
+    if baseline is not None and baseline['config'] != result['config']:
+        print('Baseline recorded with a different configuration, not compared.\n')
+        baseline = None
+
+    def row(name, value, base, unit, higher_is_better=False, min_value=None):
+        if (base is None) or (value is None):
+            print('{:>20} {:>12.4f}{}'.format(name, value or 0, unit))
+            return
+        ratio = value / base if base else float('inf')
+        worse = (ratio < 1 / (1 + tolerance)) if higher_is_better else (ratio > 1 + tolerance)
+        if (min_value is not None) and (max(value, base) < min_value):
+            worse = False
+        flag = 'REGRESSION' if worse else ''
+        if worse:
+            regressions.append(name)
+        print('{:>20} {:>12.4f}{} {:>12.4f}{} {:>7.2f}x {}'.format(
+            name, value, unit, base, unit, ratio, flag))
+
+    print('{:>20} {:>13} {:>13} {:>8}'.format('stage', 'current', 'baseline', 'ratio'))
+    for stage in STAGES:
+        row(stage, result['stages'][stage],
+            baseline['stages'].get(stage) if baseline else None, 's', min_value=MIN_TIME)
+    print()
+    for engine, value in result['docs_per_sec'].items():
+        row('docs/sec ' + engine, value,
+            baseline['docs_per_sec'].get(engine) if baseline else None, '',
+            higher_is_better=True)
+    row('peak RSS (MB)', result['peak_rss_mb'],
+        baseline.get('peak_rss_mb') if baseline else None, '')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='lookup stages benchmark')
+    synthetic.add_arguments(parser)
+    parser.add_argument("--format", dest="corpus_format", default="dir",
+                        choices=["dir", "jsonl"], help="corpus format")
+    parser.add_argument("--repeat", type=int, default=3, help="repetitions (best is kept)")
+    parser.add_argument("--baseline", default=BASELINE_PATH,
+                        help="baseline JSON to compare with ('' to skip)")
+    parser.add_argument("--save_baseline", action='store_true',
+                        help="store the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.3,
+                        help="relative slowdown reported as a regression")
+    parser.add_argument("--json_out", default='', help="path to write the results JSON")
+    args = parser.parse_args()
+
+    config = {k: getattr(args, k) for k in ['n_entries', 'n_docs', 'multiword_ratio',
+                                             'word_decay', 'max_words', 'accent_density',
+                                             'mention_rate', 'seed', 'corpus_format']}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        gs_path, data_path = synthetic.generate(args, tmp_dir, args.corpus_format)
+        out_path = os.path.join(tmp_dir, 'predictions.tsv')
+        best = None
+        for _ in range(args.repeat):
+            times, n_docs, n_predictions, n_rejected = run_stages(gs_path, data_path,
+                                                                  out_path, MIN_UPPER)
+            best = times if best is None else {k: min(v, times[k]) for k, v in best.items()}
+
+    result = {'config': config,
+              'python': platform.python_version(),
+              'platform': platform.platform(),
+              'n_docs': n_docs,
+              'n_predictions': n_predictions,
+              'prefilter_rejection_rate': n_rejected / n_docs if n_docs else None,
+              'stages': best,
+              'docs_per_sec': throughput(best, n_docs),
+              'peak_rss_mb': peak_rss_mb()}
+
+    print('{} documents, {} predictions, {} rejected by the prefilter\n'.format(
+        n_docs, n_predictions, n_rejected))
+    baseline = None
+    if (args.baseline != '') and os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    regressions = compare(result, baseline, args.tolerance)
+
+    if args.json_out != '':
+        with open(args.json_out, 'w') as f:
+            json.dump(result, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline or BASELINE_PATH, 'w') as f:
+            json.dump(result, f, indent=2)
+        print('\nBaseline stored in {}'.format(args.baseline or BASELINE_PATH))
+    if regressions:
+        print('\nRegressions: {}'.format(', '.join(regressions)))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark: startup time of short CLI invocations.
+
+The vendored stopword list and the lazy pandas import (only needed to parse
+the GS files, not with a compiled gazetteer) are compared with the previous
+eager imports of spacy.lang.es and pandas. Every measure is the median of
+--repeat fresh Python processes:
++ import: import lookup.
++ batch: whole lookup.py run with a compiled gazetteer on a small batch of
+  synthetic tweets (see synthetic.py).
+
+Usage:
+$> python benchmarks/startup.py --n_docs 50 --repeat 5
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+import importlib.util
+
+import synthetic
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LOOKUP = os.path.join(REPO, 'lookup.py')
+
+# Imports done by utils.py and lookup.py before they were lazy
+EAGER = 'import spacy.lang.es, pandas; '
+
+
+def run_python(code, repeat):
+    '''
+    DESCRIPTION: median wall time of running code in a fresh Python process.
+    '''
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], cwd=REPO, check=True,
+                       stdout=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def loaded_modules(code):
+    '''
+    DESCRIPTION: heavy modules (pandas, spacy) loaded after running code.
+    '''
+    check = (code + '; import sys; print("loaded:" + " ".join(m for m in '
+             '["pandas", "spacy"] if m in sys.modules))')
+    out = subprocess.run([sys.executable, '-c', check], cwd=REPO, check=True,
+                         stdout=subprocess.PIPE, universal_newlines=True).stdout
+    return out.rsplit('loaded:', 1)[1].strip() or '-'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='CLI startup benchmark')
+    synthetic.add_arguments(parser)
+    parser.add_argument("--repeat", type=int, default=5, help="processes per measure")
+    parser.set_defaults(n_entries=2000, n_docs=50)
+    args = parser.parse_args()
+    eager_available = ((importlib.util.find_spec('spacy') is not None) &
+                       (importlib.util.find_spec('pandas') is not None))
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        gs_path, data_path = synthetic.generate(args, tmp_dir, 'jsonl')
+        gazetteer_path = os.path.join(tmp_dir, 'gazetteer.pkl')
+        out_path = os.path.join(tmp_dir, 'predictions.tsv')
+        subprocess.run([sys.executable, LOOKUP, 'compile', '-gs', gs_path,
+                        '-out', gazetteer_path], check=True, stdout=subprocess.DEVNULL)
+
+        run = ('import sys, runpy; sys.argv = {!r}; '
+               'runpy.run_path({!r}, run_name="__main__")').format(
+                   [LOOKUP, '-gs', gs_path, '-gz', gazetteer_path, '-data', data_path,
+                    '-out', out_path, '-t', '2'], LOOKUP)
+        measures = [('import', 'import lookup'), ('batch', run)]
+
+        print('{:>8} {:>10} {:>10} {:>8}  {}'.format('measure', 'lazy', 'eager',
+                                                      'speedup', 'loaded (lazy)'))
+        for name, code in measures:
+            t_lazy = run_python(code, args.repeat)
+            if eager_available:
+                t_eager = run_python(EAGER + code, args.repeat)
+                print('{:>8} {:>9.3f}s {:>9.3f}s {:>7.1f}x  {}'.format(
+                    name, t_lazy, t_eager, t_eager / t_lazy, loaded_modules(code)))
+            else:
+                print('{:>8} {:>9.3f}s {:>10} {:>8}  {}'.format(
+                    name, t_lazy, 'n/a', 'n/a', loaded_modules(code)))
+
+
+if __name__ == '__main__':
+    main()
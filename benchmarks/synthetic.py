@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Generate synthetic ProfNER-shaped data: a Gold Standard TSV with PROFESION
+and SITUACION_LABORAL annotations and a corpus of Spanish-like tweets that
+mention them.
+
+The shape of the gazetteer is configurable: number of entries, ratio of
+multi-word entries, distribution of the number of words of multi-word
+entries and density of accented characters. Tweets mention the entries with
+case and accent variations, as real tweets do.
+
+Usage (write a dataset to disk):
+$> python benchmarks/synthetic.py --out_dir /tmp/synthetic --n_entries 5000 --n_docs 2000
+"""
+import os
+import csv
+import json
+import random
+import argparse
+
+HEADS = ['médico', 'enfermera', 'enfermero', 'auxiliar', 'técnico', 'profesor',
+         'maestra', 'policía', 'bombero', 'camarero', 'abogado', 'periodista',
+         'farmacéutico', 'cajera', 'repartidor', 'agricultor', 'limpiadora',
+         'conductor', 'celador', 'investigadora', 'sanitario', 'militar']
+SITUATIONS = ['paro', 'ERTE', 'desempleo', 'jubilado', 'autónomo', 'parado',
+              'despedido', 'teletrabajo', 'baja laboral', 'contrato temporal']
+CONNECTORS = ['de', 'del', 'en', 'y']
+SYLLABLES = ['ma', 'ri', 'con', 'ta', 'dor', 'en', 'fer', 'me', 'ra', 'pro', 'fe',
+             'sor', 'lo', 'gis', 'ca', 'ni', 'co', 'ju', 'bi', 'la', 'des', 'pe',
+             'tra', 'ba', 'jo', 'sa', 'ni', 'ta', 'rio', 'cien']
+ACCENTS = {'a': 'á', 'e': 'é', 'i': 'í', 'o': 'ó', 'u': 'ú'}
+FILLER = ('el la que y en un una los se del las por con no para es al lo como '
+          'más pero sus le ya o este porque esta entre cuando muy sin sobre '
+          'hoy gente vida calle ciudad casa hospital gobierno mañana semana '
+          'gracias todos nunca siempre ahora').split()
+NOISE = ['#COVID19', '#QuedateEnCasa', '@usuario', 'https://t.co/abc123', '😷',
+         '!!', '...', '(', ')', '?']
+
+
+def add_accent(word, rnd):
+    vowels = [i for i, c in enumerate(word) if c in ACCENTS]
+    if not vowels:
+        return word
+    i = rnd.choice(vowels)
+    return word[:i] + ACCENTS[word[i]] + word[i+1:]
+
+
+def make_word(rnd, accent_density):
+    word = ''.join(rnd.choice(SYLLABLES) for _ in range(rnd.randint(2, 4)))
+    if rnd.random() < accent_density:
+        word = add_accent(word, rnd)
+    return word
+
+
+def make_entry(rnd, multiword_ratio, word_decay, max_words, accent_density):
+    '''
+    DESCRIPTION: generate one gazetteer entry. Multi-word entries have 2 
+              content words plus a geometric number of extra ones (continue
+              with probability word_decay), up to max_words. Content words 
+              are joined with a connector or just whitespace.
+    '''
+    if rnd.random() < 0.2:
+        head = rnd.choice(HEADS)
+    else:
+        head = make_word(rnd, accent_density)
+    if rnd.random() >= multiword_ratio:
+        return head
+    n_words = 2
+    while (n_words < max_words) & (rnd.random() < word_decay):
+        n_words = n_words + 1
+    words = [head]
+    for _ in range(n_words - 1):
+        if rnd.random() < 0.5:
+            words.append(rnd.choice(CONNECTORS))
+        words.append(make_word(rnd, accent_density))
+    return ' '.join(words)
+
+
+def make_gazetteer(n_entries, rnd, multiword_ratio=0.5, word_decay=0.4, max_words=6,
+                   accent_density=0.3):
+    '''
+    DESCRIPTION: generate a gazetteer of distinct entries.
+
+    OUTPUT: entries: list of (extraction, type) tuples, sorted.
+    '''
+    entries = {}
+    for situation in SITUATIONS[:min(len(SITUATIONS), n_entries // 10)]:
+        entries[situation] = 'SITUACION_LABORAL'
+    while len(entries) < n_entries:
+        entry = make_entry(rnd, multiword_ratio, word_decay, max_words, accent_density)
+        if (entry.split(' ')[0] in HEADS) | (rnd.random() < 0.8):
+            label = 'PROFESION'
+        else:
+            label = 'SITUACION_LABORAL'
+        entries.setdefault(entry, label)
+    return sorted(entries.items())
+
+
+def vary(entry, rnd):
+    '''
+    DESCRIPTION: surface variation of an entry mention: capitalized, upper
+              case or without accents.
+    '''
+    r = rnd.random()
+    if r < 0.15:
+        return entry.capitalize()
+    if r < 0.2:
+        return entry.upper()
+    if r < 0.3:
+        for plain, accented in ACCENTS.items():
+            entry = entry.replace(accented, plain)
+    return entry
+
+
+def make_tweet(entries, rnd, min_words=10, max_words=40, mention_rate=0.1):
+    words = []
+    for _ in range(rnd.randint(min_words, max_words)):
+        r = rnd.random()
+        if r < mention_rate:
+            words.append(vary(rnd.choice(entries)[0], rnd))
+        elif r < mention_rate + 0.05:
+            words.append(rnd.choice(NOISE))
+        else:
+            words.append(rnd.choice(FILLER))
+    return ' '.join(words)
+
+
+def make_corpus(n_docs, entries, rnd, min_words=10, max_words=40, mention_rate=0.1):
+    '''
+    OUTPUT: generator of (tweet_id, text) tuples.
+    '''
+    for i in range(n_docs):
+        yield str(1240000000000000000 + i), make_tweet(entries, rnd, min_words,
+                                                       max_words, mention_rate)
+
+
+def write_gs(path, entries):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f, delimiter='\t', lineterminator='\n')
+        writer.writerow(['tweet_id', 'begin', 'end', 'type', 'extraction'])
+        for i, (entry, label) in enumerate(entries):
+            writer.writerow([i, 0, len(entry), label, entry])
+
+
+def write_corpus(path, docs, corpus_format='dir'):
+    '''
+    DESCRIPTION: write the documents as a directory of text files
+              (corpus_format 'dir') or as a JSONL corpus file ('jsonl').
+    '''
+    if corpus_format == 'jsonl':
+        with open(path, 'w', encoding='utf-8') as f:
+            for tweet_id, txt in docs:
+                f.write(json.dumps({'tweet_id': tweet_id, 'text': txt},
+                                   ensure_ascii=False) + '\n')
+        return
+    os.makedirs(path, exist_ok=True)
+    for tweet_id, txt in docs:
+        with open(os.path.join(path, tweet_id + '.txt'), 'w', encoding='utf-8') as f:
+            f.write(txt)
+
+
+def add_arguments(parser):
+    parser.add_argument("--n_entries", type=int, default=5000, help="gazetteer entries")
+    parser.add_argument("--n_docs", type=int, default=2000, help="number of tweets")
+    parser.add_argument("--multiword_ratio", type=float, default=0.5,
+                        help="ratio of multi-word gazetteer entries")
+    parser.add_argument("--word_decay", type=float, default=0.4,
+                        help="probability of one more word in multi-word entries")
+    parser.add_argument("--max_words", type=int, default=6,
+                        help="maximum number of words of an entry")
+    parser.add_argument("--accent_density", type=float, default=0.3,
+                        help="probability of an accented character in a generated word")
+    parser.add_argument("--mention_rate", type=float, default=0.1,
+                        help="probability of a gazetteer mention per tweet word")
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+
+
+def generate(args, out_dir, corpus_format='dir'):
+    '''
+    DESCRIPTION: write gs.tsv and the corpus (txt/ or corpus.jsonl) to out_dir.
+
+    OUTPUT: gs_path, data_path: paths to the written GS and corpus.
+    '''
+    rnd = random.Random(args.seed)
+    entries = make_gazetteer(args.n_entries, rnd, args.multiword_ratio, args.word_decay,
+                             args.max_words, args.accent_density)
+    gs_path = os.path.join(out_dir, 'gs.tsv')
+    data_path = os.path.join(out_dir, 'corpus.jsonl' if corpus_format == 'jsonl' else 'txt')
+    write_gs(gs_path, entries)
+    write_corpus(data_path, make_corpus(args.n_docs, entries, rnd,
+                                        mention_rate=args.mention_rate), corpus_format)
+    return gs_path, data_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='generate a synthetic ProfNER dataset')
+    parser.add_argument("--out_dir", required=True, help="output directory")
+    parser.add_argument("--format", dest="corpus_format", default="dir",
+                        choices=["dir", "jsonl"], help="corpus format")
+    add_arguments(parser)
+    args = parser.parse_args()
+    os.makedirs(args.out_dir, exist_ok=True)
+    gs_path, data_path = generate(args, args.out_dir, args.corpus_format)
+    print(gs_path)
+    print(data_path)
+
+
+if __name__ == '__main__':
+    main()
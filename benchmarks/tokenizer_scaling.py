@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Microbenchmark: format_text_info on documents of growing length.
+
+The single-pass tokenizer is compared with the previous implementation, which
+searched every distinct word in the whole text with re.finditer
+(O(distinct words x text length)). Documents go from tweet size to long
+articles, so that the linear scaling of the tokenizer is visible.
+
+Usage:
+$> python benchmarks/tokenizer_scaling.py --lengths 300 3000 30000 300000
+"""
+import os
+import re
+import sys
+import time
+import random
+import string
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils import format_text_info, remove_accents, STOP_WORDS
+
+WORDS = ('el la de que y en un una los se del las por con no para médico '
+         'enfermera hospital trabajo paro gobierno ciudad calle vida gente '
+         'España Madrid #COVID19 @usuario (ERTE) policía, auxiliar.').split()
+
+
+def format_text_info_finditer(txt, min_upper):
+    '''
+    DESCRIPTION: previous implementation of format_text_info, kept as
+              reference.
+    '''
+    words = txt.split()
+    words_no_punctuation = list(map(lambda x: x.strip(string.punctuation + ' '), words))
+    large_words = list(filter(lambda x: len(x) > 1, words_no_punctuation))
+    words_no_stw = set(filter(lambda x: x.lower() not in STOP_WORDS, large_words))
+    words2pos = {}
+    for word in words_no_stw:
+        words2pos[word] = list(map(lambda x: x.span(), re.finditer(re.escape(word), txt)))
+    words_processed2pos = dict((remove_accents(k.lower()), v) if len(k) > min_upper else
+                               (k,v) for k,v in words2pos.items())
+    return set(words_processed2pos), words_processed2pos
+
+
+def make_text(n_chars, rnd):
+    words = []
+    length = 0
+    while length < n_chars:
+        # Long documents have a growing vocabulary
+        if rnd.random() < 0.3:
+            word = 'palabra{}'.format(rnd.randint(0, n_chars // 20))
+        else:
+            word = rnd.choice(WORDS)
+        words.append(word)
+        length = length + len(word) + 1
+    return ' '.join(words)
+
+
+def best_time(func, txt, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(txt, 3)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='tokenizer scaling microbenchmark')
+    parser.add_argument("--lengths", nargs='+', type=int,
+                        default=[300, 3000, 30000, 300000],
+                        help="document lengths in characters")
+    parser.add_argument("--repeat", type=int, default=3, help="repetitions per length")
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+    args = parser.parse_args()
+    rnd = random.Random(args.seed)
+
+    print('{:>10} {:>14} {:>14} {:>16}'.format('chars', 'finditer', 'single-pass',
+                                                 'single-pass/char'))
+    for n_chars in args.lengths:
+        txt = make_text(n_chars, rnd)
+        t_old = best_time(format_text_info_finditer, txt, args.repeat)
+        t_new = best_time(format_text_info, txt, args.repeat)
+        print('{:>10} {:>13.4f}s {:>13.4f}s {:>14.1f}ns'.format(
+            len(txt), t_old, t_new, 1e9 * t_new / len(txt)))
+
+
+if __name__ == '__main__':
+    main()
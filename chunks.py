@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Split long documents (news articles, transcripts) into overlapping chunks,
+so that they are matched chunk by chunk instead of as one large string.
+
+Every chunk has a core, and the cores split the document at whitespaces.
+The predictions of a chunk are kept if they start in its core, so none is
+duplicated. Around its core, a chunk has the tokens whose window (the text
+that check_surroundings, or the trie engine, explores around a token
+occurrence) reaches the core, and their windows: every prediction starting
+in the core, or containing one that does, is found in the chunk as in the
+whole document, so none is lost either. A window spans the length of the
+longest gazetteer entry around its token, whatever the token length (e.g.
+URLs, or words followed by emojis, that are removed when they are
+normalized). Chunks start and end at a whitespace, so that no token is cut.
+
+Text files can also be memory-mapped (MappedText): they are decoded chunk
+by chunk, without reading the whole file into memory.
+"""
+import mmap
+import hashlib
+
+# Chunk size (characters, or bytes for memory-mapped files) when it is not
+# given
+DEFAULT_CHUNK_SIZE = 1 << 20
+
+
+def chunk_overlap(max_chars):
+    '''
+    DESCRIPTION: characters of context needed on each side of a token
+              occurrence: a window spans n_chars (at most max_chars) on each
+              side of it.
+
+    INPUT: max_chars: number of characters of the longest gazetteer entry.
+    '''
+    return max(max_chars, 1)
+
+
+def next_break(buf, pos, space, newline):
+    '''
+    DESCRIPTION: position of the first space or newline at or after pos, or
+              len(buf) if there is none.
+    '''
+    if pos >= len(buf):
+        return len(buf)
+    found = [i for i in (buf.find(space, pos), buf.find(newline, pos)) if i >= 0]
+    return min(found) if found else len(buf)
+
+
+def prev_break(buf, pos, space, newline):
+    '''
+    DESCRIPTION: position of the last space or newline at or before pos, or
+              0 if there is none.
+    '''
+    if pos <= 0:
+        return 0
+    return max(buf.rfind(space, 0, pos + 1), buf.rfind(newline, 0, pos + 1), 0)
+
+
+def token_start(buf, pos):
+    '''
+    DESCRIPTION: start of the token (run of non-whitespace characters) at
+              pos, or pos if buf[pos] is a whitespace.
+    '''
+    n = 64
+    while True:
+        lo = max(0, pos + 1 - n)
+        piece = buf[lo:pos + 1]
+        if (not piece) or piece[-1:].isspace():
+            return pos
+        start = pos + 1 - len(piece.split()[-1])
+        if (start > lo) | (lo == 0):
+            return start
+        n = 2 * n
+
+
+def token_end(buf, pos):
+    '''
+    DESCRIPTION: end of the token (run of non-whitespace characters) at pos,
+              or pos if buf[pos] is a whitespace.
+    '''
+    n = 64
+    while True:
+        hi = min(len(buf), pos + n)
+        piece = buf[pos:hi]
+        if (not piece) or piece[:1].isspace():
+            return pos
+        end = pos + len(piece.split()[0])
+        if (end < hi) | (hi == len(buf)):
+            return end
+        n = 2 * n
+
+
+def chunk_bounds(buf, chunk_size, overlap, space=' ', newline='\n'):
+    '''
+    DESCRIPTION: split a text in overlapping chunks.
+
+    INPUT: buf: str, or bytes-like object (bytes, mmap) with UTF-8 text.
+           chunk_size: minimum size of a chunk core.
+           overlap: size of the window on each side of a token occurrence
+              (see chunk_overlap). The tokens whose window reaches the core
+              are within overlap of it, and the chunk holds their windows.
+           space, newline: whitespaces of buf (str or bytes).
+
+    OUTPUT: generator of (s, a, b, e) positions: the chunk is buf[s:e] and
+              its core is buf[a:b]. Cores are consecutive and cover buf.
+    '''
+    a = 0
+    while a < len(buf):
+        b = next_break(buf, a + max(chunk_size, 1), space, newline)
+        s = 0
+        if a > 0:
+            s = prev_break(buf, token_start(buf, max(a - overlap, 0)) - overlap,
+                           space, newline)
+        e = len(buf)
+        if b < len(buf):
+            e = token_end(buf, min(b + overlap, len(buf)) - 1)
+            e = min(next_break(buf, e + overlap, space, newline) + 1, len(buf))
+        yield s, a, b, e
+        a = b
+
+
+def iter_chunks(txt, chunk_size, overlap):
+    '''
+    DESCRIPTION: chunks of a text to match.
+
+    INPUT: txt: str with the text.
+           chunk_size, overlap: see chunk_bounds.
+
+    OUTPUT: generator of (offset, chunk, core0, core1): offset of the chunk
+              in txt, str with the chunk, and offsets of its core in the
+              chunk.
+    '''
+    for s, a, b, e in chunk_bounds(txt, chunk_size, overlap):
+        chunk = txt[s:e]
+        if (s == 0) & (e < len(txt)):
+            # The boundary check of a word at the start of a text looks at
+            # its last character (txt[-1]): end the first chunk with the last
+            # character of the document, as in the whole document.
+            chunk = chunk + txt[-1]
+        yield s, chunk, a - s, b - s
+
+
+def iter_mapped_chunks(buf, chunk_size, overlap):
+    '''
+    DESCRIPTION: chunks of the UTF-8 text of a bytes-like object. It is
+              split at whitespace bytes, which are never part of a multibyte
+              character, and offsets are converted to characters.
+
+    INPUT: buf: bytes-like object (bytes, mmap).
+           chunk_size: minimum size of a chunk core, in bytes.
+           overlap: see chunk_bounds, in characters.
+
+    OUTPUT: see iter_chunks.
+    '''
+    # Last character of the document (see iter_chunks)
+    last = buf[max(0, len(buf) - 4):].decode('utf-8', 'ignore')[-1:]
+    # Offset (characters) of the current core
+    n_chars = 0
+    # A character has at most 4 bytes in UTF-8
+    for s, a, b, e in chunk_bounds(buf, chunk_size, 4 * overlap, b' ', b'\n'):
+        before = buf[s:a].decode('utf-8')
+        core = buf[a:b].decode('utf-8')
+        chunk = before + core + buf[b:e].decode('utf-8')
+        if (s == 0) & (e < len(buf)):
+            chunk = chunk + last
+        yield n_chars - len(before), chunk, len(before), len(before) + len(core)
+        n_chars = n_chars + len(core)
+
+
+class MappedText():
+    '''
+    DESCRIPTION: UTF-8 text file that is memory-mapped when it is matched,
+              instead of read. Only its path is pickled (e.g. sent to a
+              worker process). Newlines are not translated.
+
+    INPUT: path: str with the path to the text file.
+    '''
+    def __init__(self, path):
+        self.path = path
+
+    def chunks(self, chunk_size, overlap):
+        '''
+        OUTPUT: chunks of the text (see iter_mapped_chunks).
+        '''
+        with open(self.path, 'rb') as f:
+            # Empty files cannot be mapped
+            if f.seek(0, 2) == 0:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                yield from iter_mapped_chunks(buf, chunk_size, overlap)
+
+    def content_hash(self):
+        '''
+        OUTPUT: hexadecimal SHA-1 digest of the file contents (the same as
+                  manifest.content_hash of its text).
+        '''
+        h = hashlib.sha1()
+        with open(self.path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                h.update(block)
+        return h.hexdigest()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Read the documents where annotations are predicted.
+
+data_path may be a directory with one text file per document, or a single
+corpus file read as a stream:
++ JSONL (.jsonl): one JSON object per line with the keys tweet_id (or id)
+  and text.
++ TSV (.tsv): header with the columns tweet_id (or id) and text. Texts with
+  tabs or newlines must be quoted.
+Corpus files may be gzip-compressed (.jsonl.gz, .tsv.gz).
+The text files of a directory may be memory-mapped instead of read (see
+chunks.MappedText).
+"""
+import os
+import csv
+import gzip
+import json
+from chunks import MappedText
+
+ID_COLUMNS = ['tweet_id', 'id']
+
+
+def walk_files(datapath):
+    for root, dirs, files in os.walk(datapath):
+        for filename in files:
+            yield os.path.join(root, filename)
+
+
+def read_files(datapath):
+    '''
+    DESCRIPTION: read the text files under datapath lazily.
+
+    OUTPUT: generator of (filename, text) tuples, in os.walk order. Files
+              are decoded as UTF-8 and newlines are not translated, so that
+              offsets are the same as with MappedText.
+    '''
+    for path in walk_files(datapath):
+        with open(path, encoding='utf-8', newline='') as f:
+            txt = f.read()
+        yield os.path.basename(path), txt
+
+
+def get_id(record, path):
+    for column in ID_COLUMNS:
+        if column in record:
+            return str(record[column])
+    raise ValueError('Document without {} in {}'.format(' or '.join(ID_COLUMNS), path))
+
+
+def read_jsonl(f, path):
+    for line in f:
+        if line.strip():
+            record = json.loads(line)
+            yield get_id(record, path), record['text']
+
+
+def read_tsv(f, path):
+    # Long documents are larger than the default csv field limit
+    csv.field_size_limit(2**31 - 1)
+    for record in csv.DictReader(f, delimiter='\t'):
+        yield get_id(record, path), record['text']
+
+
+def corpus_format(path):
+    '''
+    DESCRIPTION: format of a corpus file ('jsonl' or 'tsv') from its
+              extension, ignoring the .gz compression extension.
+    '''
+    name = path[:-3] if path.endswith('.gz') else path
+    extension = os.path.splitext(name)[1].lower()
+    if extension == '.jsonl':
+        return 'jsonl'
+    if extension == '.tsv':
+        return 'tsv'
+    raise ValueError('Unknown corpus format: {}'.format(path))
+
+
+def iter_documents(data_path, mapped=False):
+    '''
+    DESCRIPTION: read the documents of a directory or a corpus file lazily.
+
+    INPUT: data_path: path to a directory with text files, or to a JSONL or
+              TSV corpus file (optionally gzip-compressed).
+           mapped: bool. Whether the text files of a directory are yielded
+              as chunks.MappedText instead of read. Not used for corpus
+              files.
+
+    OUTPUT: generator of (doc_id, text) tuples. The doc_id of a text file is
+              its name without extension.
+    '''
+    if os.path.isdir(data_path) & mapped:
+        for path in walk_files(data_path):
+            yield os.path.splitext(os.path.basename(path))[0], MappedText(path)
+        return
+    if os.path.isdir(data_path):
+        for filename, txt in read_files(data_path):
+            yield os.path.splitext(filename)[0], txt
+        return
+
+    read = read_jsonl if corpus_format(data_path) == 'jsonl' else read_tsv
+    if data_path.endswith('.gz'):
+        f = gzip.open(data_path, 'rt', encoding='utf-8', newline='')
+    else:
+        f = open(data_path, encoding='utf-8', newline='')
+    with f:
+        yield from read(f, data_path)
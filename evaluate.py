@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Score predictions against the Gold Standard: precision, recall and F1.
+
++ Sub-track 1 (tweet classification): scores of the positive class. A
+  document is positive in the GS if it has a label 1 (GS with a label
+  column) or an annotation of the kept labels (GS with the columns
+  tweet_id, begin, end, type), and it is predicted positive if it has
+  predictions.
++ Sub-track 2 (NER): micro-averaged scores of the exact (tweet_id, begin,
+  end, type) spans, and scores of every label.
+
+The GS is read once into a python dict of hashed span sets, and documents
+are scored as soon as they are matched (Scorer), from the in-memory
+predictions. Only the matched documents are scored: the number of GS
+documents that were not matched is reported apart (missing_documents).
+
+Usage:
+$> python evaluate.py -gs gold_standard.tsv -pred predictions.tsv -t 2
+"""
+import csv
+import sys
+import json
+import argparse
+from gazetteer import LABELS
+
+
+def prf(tp, fp, fn):
+    '''
+    OUTPUT: scores: python dict with precision, recall, f1 (0 when
+              undefined), tp, fp and fn.
+    '''
+    precision = tp / (tp + fp) if tp + fp else 0.0
+    recall = tp / (tp + fn) if tp + fn else 0.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return {'precision': precision, 'recall': recall, 'f1': f1,
+            'tp': tp, 'fp': fp, 'fn': fn}
+
+
+def read_gold(gs_paths, sub_track, labels=LABELS):
+    '''
+    DESCRIPTION: read the GS files.
+
+    INPUT: gs_paths: list of paths to GS TSV files.
+           sub_track: 1 or 2.
+           labels: list of the annotation types kept.
+
+    OUTPUT: gold: python dict {tweet_id: set of (begin, end, type)} for
+              sub-track 2, or {tweet_id: 0 or 1} for sub-track 1.
+    '''
+    import pandas as pd
+    from parse_inputs import parse_tsv
+
+    if sub_track not in [1, 2]:
+        raise ValueError('Incorrect sub-track value')
+    df_annot = pd.concat([parse_tsv(path, sub_track) for path in gs_paths],
+                         ignore_index=True)
+    tweet_ids = df_annot['tweet_id'].astype(str)
+
+    if (sub_track == 1) & ('label' in df_annot.columns):
+        return dict(zip(tweet_ids, df_annot['label'].astype(int).clip(0, 1)))
+
+    kept = df_annot['type'].isin(labels)
+    gold = {}
+    for tweet_id, begin, end, label in zip(tweet_ids[kept], df_annot['begin'][kept].astype(int),
+                                           df_annot['end'][kept].astype(int),
+                                           df_annot['type'][kept]):
+        gold.setdefault(tweet_id, set()).add((begin, end, label))
+    if sub_track == 1:
+        return dict.fromkeys(gold, 1)
+    return gold
+
+
+class Scorer():
+    '''
+    DESCRIPTION: precision, recall and F1 of predictions added document by
+              document.
+
+    INPUT: gold: output of read_gold.
+           sub_track: 1 or 2.
+    '''
+    def __init__(self, gold, sub_track=2):
+        if sub_track not in [1, 2]:
+            raise ValueError('Incorrect sub-track value')
+        self.gold = gold
+        self.sub_track = sub_track
+        self.seen = set()
+        # {label: [tp, fp, fn]} (sub-track 2) or {1: [tp, fp, fn]}
+        self.counts = {}
+
+    def counter(self, label):
+        counts = self.counts.get(label)
+        if counts is None:
+            counts = self.counts[label] = [0, 0, 0]
+        return counts
+
+    def add(self, doc_id, predictions):
+        '''
+        INPUT: doc_id: str with the document identifier (tweet_id).
+               predictions: records.Predictions (or list of [ref, off0,
+                  off1, label]).
+        '''
+        self.seen.add(doc_id)
+        if self.sub_track == 1:
+            predicted, gold = int(len(predictions) > 0), self.gold.get(doc_id, 0)
+            counts = self.counter(1)
+            counts[0] = counts[0] + (predicted & gold)
+            counts[1] = counts[1] + (predicted & (1 - gold))
+            counts[2] = counts[2] + ((1 - predicted) & gold)
+            return
+
+        spans = set((off0, off1, label) for _, off0, off1, label in predictions)
+        gold = self.gold.get(doc_id, set())
+        for index, found in ((0, spans & gold), (1, spans - gold), (2, gold - spans)):
+            for _, _, label in found:
+                self.counter(label)[index] += 1
+
+    def result(self):
+        '''
+        OUTPUT: scores: python dict with the sub-track, the number of scored
+                  documents and of GS documents not scored (missing_documents),
+                  the overall scores (see prf) and, for sub-track 2, the
+                  scores of every label.
+        '''
+        total = [sum(counts[i] for counts in self.counts.values()) for i in range(3)]
+        scores = {'sub_track': self.sub_track,
+                  'documents': len(self.seen),
+                  'missing_documents': sum(1 for doc_id in self.gold
+                                           if doc_id not in self.seen),
+                  'overall': prf(*total)}
+        if self.sub_track == 2:
+            scores['labels'] = {label: prf(*counts)
+                                for label, counts in sorted(self.counts.items())}
+        return scores
+
+
+def score_predictions(gold, results, sub_track=2):
+    '''
+    DESCRIPTION: score the predictions of a set of documents.
+
+    INPUT: gold: output of read_gold.
+           results: iterable of (doc_id, predictions) tuples (e.g. the output
+              of Matcher.match_batch).
+           sub_track: 1 or 2.
+
+    OUTPUT: scores: see Scorer.result.
+    '''
+    scorer = Scorer(gold, sub_track)
+    for doc_id, predictions in results:
+        scorer.add(doc_id, predictions)
+    return scorer.result()
+
+
+def read_predictions(pred_path, sub_track):
+    '''
+    DESCRIPTION: read an output TSV of lookup.py.
+
+    OUTPUT: generator of (doc_id, predictions) tuples, in file order.
+              Sub-track 1 predictions are [1] for positive documents.
+    '''
+    doc_id, predictions = None, []
+    with open(pred_path, newline='', encoding='utf-8') as f:
+        reader = csv.reader(f, delimiter='\t')
+        next(reader, None)
+        for row in reader:
+            if row[0] != doc_id:
+                if doc_id is not None:
+                    yield doc_id, predictions
+                doc_id, predictions = row[0], []
+            if sub_track == 1:
+                if row[1] == '1':
+                    predictions.append(1)
+            elif row[1] != '-':
+                predictions.append([row[4], int(row[1]), int(row[2]), row[3]])
+    if doc_id is not None:
+        yield doc_id, predictions
+
+
+def format_scores(scores):
+    '''
+    OUTPUT: str with one line per label and one line with the overall
+              scores.
+    '''
+    rows = list(scores.get('labels', {}).items()) + [('overall', scores['overall'])]
+    return '\n'.join('{:>20} P {:.4f}  R {:.4f}  F1 {:.4f}  (tp {}, fp {}, fn {})'.format(
+        name, s['precision'], s['recall'], s['f1'], s['tp'], s['fp'], s['fn'])
+        for name, s in rows)
+
+
+def parse_arguments():
+
+    # DESCRIPTION: Parse command line arguments
+
+    parser = argparse.ArgumentParser(description='score predictions')
+    parser.add_argument("-gs", "--gs_path", required = True, dest = "gs_path",
+                        help = "path to GS file")
+    parser.add_argument("-gs2", "--gs_path2", required = False, dest = "gs_path2",
+                        default = "", help = "path to a second GS file")
+    parser.add_argument("-pred", "--pred_path", required = True, dest = "pred_path",
+                        help = "path to the predictions TSV (output of lookup.py)")
+    parser.add_argument("-t", "--sub_track", required = True, dest = "sub_track",
+                        type = int, choices = [1, 2], help = "sub_track number")
+    parser.add_argument("-out", "--out_path", required = False, dest = "out_path",
+                        default = "", help = "path to output JSON with the scores")
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_arguments()
+    gs_paths = [args.gs_path] + ([args.gs_path2] if args.gs_path2 != "" else [])
+
+    gold = read_gold(gs_paths, args.sub_track)
+    scores = score_predictions(gold, read_predictions(args.pred_path, args.sub_track),
+                               args.sub_track)
+    print(format_scores(scores))
+    if scores['missing_documents'] > 0:
+        print('{} GS documents without predictions rows were not scored'.format(
+            scores['missing_documents']), file=sys.stderr)
+    if args.out_path != "":
+        with open(args.out_path, 'w', encoding='utf-8') as f:
+            json.dump(scores, f, indent=2)
@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Build, save and load the compiled gazetteer: the lookup structures extracted
+from the GS files by format_ann_info and build_trie.
+
+The compiled gazetteer is stored on disk together with a fingerprint of the
+GS files contents, min_upper and the kept labels. When any of them changes,
+the stored gazetteer is not used and it is compiled again.
+
+Annotations can also be added to or removed from a compiled gazetteer
+(update_gazetteer). Only the index entries of the affected annotations are
+updated, in a new version of the gazetteer that shares everything else with
+the previous one, which is left untouched: texts being matched with it are
+not affected, and the new version is swapped in at once (Matcher.swap).
+"""
+import os
+import json
+import pickle
+import hashlib
+
+# Increase when the stored structures change
+CACHE_VERSION = 7
+
+# Minimum number of characters of a word to lowercase it
+MIN_UPPER = 3
+
+# Annotation types kept from the GS
+LABELS = ['PROFESION', 'SITUACION_LABORAL']
+
+
+def max_chars(gazetteer):
+    '''
+    DESCRIPTION: number of characters of the longest annotation (an upper
+              bound after annotations are removed).
+    '''
+    if 'max_chars' in gazetteer:
+        return gazetteer['max_chars']
+    return max(map(len, gazetteer['annot2label']), default=0)
+
+
+def gazetteer_fingerprint(gs_paths, min_upper, labels):
+    '''
+    DESCRIPTION: hash of everything the compiled gazetteer depends on.
+
+    INPUT: gs_paths: list of paths to GS files.
+           min_upper: int. Specifies the minimum number of characters of a word
+               to lowercase it (to prevent mistakes with acronyms).
+           labels: list of annotation types kept.
+
+    OUTPUT: fingerprint: str (hexadecimal SHA-256 digest).
+    '''
+    h = hashlib.sha256()
+    h.update(json.dumps([CACHE_VERSION, min_upper, sorted(labels)]).encode('utf-8'))
+    for path in gs_paths:
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                h.update(block)
+        h.update(b'\0')
+    return h.hexdigest()
+
+
+def compile_annotations(df_annot, min_upper, with_trie=True, stopwords=None):
+    '''
+    DESCRIPTION: build all lookup structures from the GS annotations.
+
+    INPUT: df_annot: pandas DataFrame with the GS annotations.
+           min_upper: int. Specifies the minimum number of characters of a word
+               to lowercase it (to prevent mistakes with acronyms).
+           with_trie: bool. Whether to build the structures of the trie engine.
+           stopwords: set of words that are not indexed (default:
+               stopwords.STOP_WORDS).
+
+    OUTPUT: gazetteer: python dict with min_upper, stopwords, annot2label, 
+              annot2annot_processed, annotations_final, token2annots (see 
+              format_ann_info), labels (see records.label_table), max_chars
+              (see max_chars), version (0, increased by update_gazetteer),
+              prefilter (see prefilter.prefilter_keys) and trie, unigrams
+              (see build_trie, None if with_trie is False).
+    '''
+    from utils import format_ann_info
+    from trie import build_trie
+    from records import label_table
+    from prefilter import prefilter_keys
+    from stopwords import STOP_WORDS
+
+    if stopwords is None:
+        stopwords = STOP_WORDS
+    annot2label, annot2annot_processed, annotations_final, token2annots = \
+        format_ann_info(df_annot, min_upper, stopwords)
+    trie, unigrams = None, None
+    if with_trie:
+        trie, unigrams = build_trie(annot2label, annot2annot_processed, min_upper)
+
+    return {'min_upper': min_upper,
+            'stopwords': stopwords,
+            'annot2label': annot2label,
+            'annot2annot_processed': annot2annot_processed,
+            'annotations_final': annotations_final,
+            'token2annots': token2annots,
+            'labels': label_table(annot2label),
+            'max_chars': max(map(len, annot2label), default=0),
+            'version': 0,
+            'prefilter': prefilter_keys(annotations_final),
+            'trie': trie,
+            'unigrams': unigrams}
+
+
+def update_gazetteer(gazetteer, add=(), remove=()):
+    '''
+    DESCRIPTION: new version of a gazetteer with some annotations added and
+              removed. The result is the same as compiling the updated
+              annotations again.
+
+    INPUT: gazetteer: python dict (see compile_annotations). It is not
+              modified.
+           add: iterable of (annotation, label) tuples. The label of an
+              annotation already in the gazetteer is replaced.
+           remove: iterable of annotations. Annotations not in the
+              gazetteer are ignored.
+
+    OUTPUT: gazetteer: python dict (see compile_annotations) with a version
+              number one higher.
+    '''
+    from bisect import bisect
+    from utils import annotation_words, annotation_record
+    from records import label_table, Annotation
+    from prefilter import prefilter_keys
+    from stopwords import STOP_WORDS
+    from trie import END
+
+    add = list(add)
+    min_upper = gazetteer['min_upper']
+    stopwords = gazetteer.get('stopwords', STOP_WORDS)
+    new = dict(gazetteer)
+    annot2label = new['annot2label'] = dict(gazetteer['annot2label'])
+    annot2annot_processed = new['annot2annot_processed'] = dict(gazetteer['annot2annot_processed'])
+    annotations_final = new['annotations_final'] = set(gazetteer['annotations_final'])
+    token2annots = new['token2annots'] = dict(gazetteer['token2annots'])
+    labels = list(gazetteer.get('labels') or label_table(gazetteer['annot2label']))
+    trie, unigrams = gazetteer['trie'], gazetteer['unigrams']
+    if trie is not None:
+        trie = new['trie'] = dict(trie)
+        unigrams = new['unigrams'] = dict(unigrams)
+    # Trie nodes of the new version (copied from the previous version)
+    owned = {id(trie)}
+
+    def trie_path(tokens):
+        # Copy the nodes of the path of tokens, creating the missing ones
+        path = [trie]
+        for token in tokens:
+            child = path[-1].get(token)
+            if child is None:
+                child = {}
+            elif id(child) not in owned:
+                child = dict(child)
+            owned.add(id(child))
+            path[-1][token] = child
+            path.append(child)
+        return path
+
+    def update_unigram(token):
+        # First label of the single-word annotations of the token (see
+        # build_trie)
+        candidates = [a for a in token2annots.get(token, []) if a.n_words == 1]
+        if candidates:
+            unigrams[token] = min(a.label for a in candidates)
+        else:
+            unigrams.pop(token, None)
+
+    def remove_annotation(annot):
+        del annot2label[annot]
+        words = annot2annot_processed.pop(annot)
+        annotation = None
+        for token in dict.fromkeys(words):
+            annotations = []
+            for a in token2annots[token]:
+                if a.text == annot:
+                    annotation = a
+                else:
+                    annotations.append(a)
+            if annotations:
+                token2annots[token] = annotations
+            else:
+                del token2annots[token]
+                annotations_final.discard(token)
+        if (trie is None) | (annotation is None):
+            return
+        if annotation.n_words == 1:
+            for token in words:
+                update_unigram(token)
+            return
+        tokens = annotation.processed.split(' ')
+        path = trie_path(tokens)
+        path[-1][END] = [a for a in path[-1][END] if a.text != annot]
+        if not path[-1][END]:
+            del path[-1][END]
+        # Remove the nodes left empty
+        for depth in range(len(tokens), 0, -1):
+            if path[depth]:
+                break
+            del path[depth - 1][tokens[depth - 1]]
+
+    def add_annotation(annot, label):
+        if label not in labels:
+            labels.append(label)
+        words = annotation_words(annot, min_upper, stopwords)
+        annot2label[annot] = label
+        annot2annot_processed[annot] = words
+        annotation = annotation_record(annot, labels.index(label), words, min_upper)
+        for token in dict.fromkeys(words):
+            token2annots[token] = token2annots.get(token, []) + [annotation]
+            annotations_final.add(token)
+        if (trie is None) | (not words):
+            return
+        if annotation.n_words == 1:
+            for token in words:
+                update_unigram(token)
+            return
+        node = trie_path(annotation.processed.split(' '))[-1]
+        ends = list(node.get(END, []))
+        ends.insert(bisect([a.text for a in ends], annot), annotation)
+        node[END] = ends
+
+    def relabel(table):
+        # Copy the records with the label ids of table. The same record is
+        # in the lists of all its tokens and in the trie.
+        ids = {i: table.index(label) for i, label in enumerate(labels) if label in table}
+        records = {}
+
+        def record(a):
+            if id(a) not in records:
+                records[id(a)] = Annotation(a.text, ids[a.label], a.n_chars, a.n_words,
+                                            a.processed, a.anchors)
+            return records[id(a)]
+
+        def copy(node):
+            return {key: [record(a) for a in child] if key is END else copy(child)
+                    for key, child in node.items()}
+
+        for token, annotations in token2annots.items():
+            token2annots[token] = [record(a) for a in annotations]
+        if trie is not None:
+            new['trie'] = copy(trie)
+            for token in list(unigrams):
+                update_unigram(token)
+
+    for annot in remove:
+        if annot in annot2label:
+            remove_annotation(annot)
+    for annot, label in add:
+        if annot in annot2label:
+            remove_annotation(annot)
+        add_annotation(annot, label)
+
+    # The label table stays sorted, as in a compiled gazetteer: label ids
+    # decide the label of equal spans (see spans.py)
+    table = label_table(annot2label)
+    if table != tuple(labels):
+        relabel(table)
+    new['labels'] = table
+    new['max_chars'] = max([max_chars(gazetteer)] + [len(annot) for annot, _ in add])
+    new['version'] = gazetteer.get('version', 0) + 1
+    # Keys of removed tokens are kept: they only let some documents through
+    keys = gazetteer.get('prefilter', prefilter_keys(gazetteer['annotations_final']))
+    added = prefilter_keys(token for annot, _ in add for token in annot2annot_processed[annot])
+    new['prefilter'] = None if (keys is None) | (added is None) else keys | added
+    return new
+
+
+def build_gazetteer(gs_paths, sub_track, min_upper, labels, with_trie=True):
+    '''
+    DESCRIPTION: parse the GS files and build all lookup structures.
+
+    INPUT: gs_paths: list of paths to GS files.
+           sub_track: int. Sub-track number.
+           min_upper: int. Specifies the minimum number of characters of a word
+               to lowercase it (to prevent mistakes with acronyms).
+           labels: list of annotation types kept.
+           with_trie: bool. Whether to build the structures of the trie engine.
+
+    OUTPUT: gazetteer: python dict (see compile_annotations).
+    '''
+    import pandas as pd
+    from parse_inputs import parse_tsv
+
+    df_annot = pd.concat([parse_tsv(path, sub_track) for path in gs_paths],
+                         ignore_index=True)
+    df_annot = df_annot.loc[df_annot['type'].isin(labels)]
+
+    return compile_annotations(df_annot, min_upper, with_trie)
+
+
+def save_gazetteer(path, gazetteer, fingerprint):
+    '''
+    DESCRIPTION: store the compiled gazetteer. It is written to a temporary
+              file first, so that a reader never finds a half-written file.
+    '''
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        pickle.dump({'version': CACHE_VERSION, 'fingerprint': fingerprint,
+                     'gazetteer': gazetteer}, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+
+def load_gazetteer(path, fingerprint):
+    '''
+    DESCRIPTION: load a compiled gazetteer.
+
+    OUTPUT: gazetteer: python dict (see build_gazetteer), or None if the file
+              does not exist or was compiled from different inputs.
+    '''
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'rb') as f:
+            content = pickle.load(f)
+    except (pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+        return None
+    if ((content.get('version') != CACHE_VERSION) |
+        (content.get('fingerprint') != fingerprint)):
+        return None
+    return content['gazetteer']
+
+
+def get_gazetteer(path, gs_paths, sub_track, min_upper, labels):
+    '''
+    DESCRIPTION: load the compiled gazetteer stored in path. If it does not
+              exist or it is outdated, compile it again and store it.
+
+    OUTPUT: gazetteer: python dict (see build_gazetteer).
+            rebuilt: bool. Whether the gazetteer had to be compiled.
+    '''
+    fingerprint = gazetteer_fingerprint(gs_paths, min_upper, labels)
+    gazetteer = load_gazetteer(path, fingerprint)
+    if gazetteer is not None:
+        return gazetteer, False
+
+    gazetteer = build_gazetteer(gs_paths, sub_track, min_upper, labels)
+    save_gazetteer(path, gazetteer, fingerprint)
+    return gazetteer, True
@@ -6,154 +6,66 @@ Created on Mon Jan 13 16:39:02 2020
 @author: antonio
 """
 
-import re
-import pandas as pd
-import itertools
-import os
 import time
 import argparse
-from utils import (format_ann_info, format_text_info, tokenize_span, normalize_tokens,
-                   normalize_str, eliminate_contained_annots)
+import sys
+from matcher import Matcher
+from gazetteer import (build_gazetteer, gazetteer_fingerprint, save_gazetteer,
+                       MIN_UPPER, LABELS)
+from output import open_writer
+from corpus import read_files, iter_documents
+from metrics import RunMetrics, clock
+from manifest import Manifest, manifest_fingerprint, iter_incremental
+from evaluate import read_gold, Scorer, format_scores
 
-from parse_inputs import parse_tsv
 
-
-
-def store_prediction(pos_matrix, predictions, off0, off1, original_label, 
-                     df_annot, original_annot, txt):
-                                        
-    # 1. Eliminate old annotations if the new one contains them
-    pos_matrix, predictions = eliminate_contained_annots(pos_matrix, predictions, off0, off1)
-    
-    # 2. STORE NEW PREDICTION
-    predictions.append([txt[off0:off1], off0, off1, original_label])   
-    pos_matrix.append([off0, off1])
-        
-    return predictions, pos_matrix
-
-def check_surroundings(txt, span, original_annot, n_chars, n_words, original_label,
-                       predictions, pos_matrix):
+def iter_predictions(datapath, matcher, workers=1, chunksize=64, metrics=None,
+                     manifest=None, mapped=False, max_memory=0):
     '''
-    DESCRIPTION: explore the surroundings of the match.
-              Do not care about extra whitespaces or punctuation signs in 
-              the middle of the annotation.
+    DESCRIPTION: find the annotations present in every document of datapath
+              (directory of text files or corpus file, see iter_documents).
+              Predictions are yielded as soon as every document is processed,
+              in reading order.
+              If metrics (RunMetrics) is given, reading is timed and the 
+              DocStats of every document are yielded too.
+              If manifest (Manifest) is given, the stored predictions of 
+              unchanged documents are reused (see iter_incremental).
+              If mapped, text files are memory-mapped and matched in chunks.
+              If max_memory (bytes) is given, workers match within that 
+              memory budget (see Matcher.match_batch).
+    
+    OUTPUT: generator of (doc_id, predictions) tuples, or (doc_id, 
+              predictions, stats) tuples if metrics is given.
     '''
-    
-    ## 1. Get normalized surroundings ##
-    large_span = txt[max(0, span[0]-n_chars):min(span[1]+n_chars, len(txt))]
-
-    # remove half-catched words
-    first_space = re.search('( |\n)', large_span).span()[1]
-    last_space = (len(large_span) - re.search('( |\n)', large_span[::-1]).span()[0])
-    large_span_reg = large_span[first_space:last_space]
-    
-    # Tokenize text span 
-    token_span2id, id2token_span_pos, token_spans = tokenize_span(large_span_reg,
-                                                                  n_words)
-    # Normalize
-    original_annotation_processed = normalize_str(original_annot, min_upper)
-    token_span_processed2token_span = normalize_tokens(token_spans, min_upper)
-    
-    ## 2. Match ##
-    try:
-        res = token_span_processed2token_span[original_annotation_processed]
-        id_ = token_span2id[res]
-        pos = id2token_span_pos[id_]
-        off0 = (pos[0] + first_space + max(0, span[0]-n_chars))
-        off1 = (pos[1] + first_space + max(0, span[0]-n_chars))
-        
-        # Check new annotation is not contained in a previously stored new annotation
-        if not any([(item[0]<=off0) & (off1<= item[1]) for item in pos_matrix]):
-            # STORE PREDICTION and eliminate old predictions contained in the new one.
-            predictions, pos_matrix = \
-                store_prediction(pos_matrix, predictions, off0, off1,
-                                 original_label, df_annot, original_annot, txt)
-    except: 
-        pass
-    
-    return predictions, pos_matrix
+    docs = iter_documents(datapath, mapped)
+    if metrics is not None:
+        docs = metrics.timed('read', docs)
+    if manifest is not None:
+        return iter_incremental(docs, manifest, matcher, workers, chunksize,
+                                with_stats=(metrics is not None),
+                                max_memory=max_memory)
+    return matcher.match_batch(docs, workers, chunksize, 
+                               with_stats=(metrics is not None),
+                               max_memory=max_memory)
 
 def find_predictions(datapath, min_upper, annot2label, annot2annot_processed, 
-                         annotations_final, df_annot):
+                         annotations_final, token2annots, df_annot, engine='legacy',
+                         workers=1, chunksize=64, trie=None, unigrams=None):
     start = time.time()
     
-    predictions_dict = {}
-    for root, dirs, files in os.walk(datapath):
-        for filename in files:
-            print(filename)
-            
-            #### 0. Initialize, etc. ####
-            predictions = []
-            pos_matrix = []
-             
-            #### 1. Get text ####
-            txt = open(os.path.join(root,filename)).read()
+    matcher = Matcher({'min_upper': min_upper,
+                       'annot2label': annot2label,
+                       'annot2annot_processed': annot2annot_processed,
+                       'annotations_final': annotations_final,
+                       'token2annots': token2annots,
+                       'trie': trie,
+                       'unigrams': unigrams}, engine)
     
-            #### 2. Format text information ####
-            words_final, words_processed2pos = format_text_info(txt, min_upper)
-            
-            #### 3. Intersection ####
-            # Generate candidates
-            words_in_annots = words_final.intersection(annotations_final)            
-             
-            #### 4. For every token of the intersection, get all original 
-            #### annotations associated to it and all matches in text.
-            #### Then, check surroundings of all those matches to check if any
-            #### of the original annotations is in the text ####
-            # For every token
-            for match in words_in_annots:
-                
-                # Get annotations where this token is present
-                original_annotations = [k for k,v in annot2annot_processed.items() if match in v]
-                # Get text locations where this token is present
-                match_text_locations = words_processed2pos[match]
-
-                # For every original annotation where this token is present:
-                for original_annot in original_annotations:
-                    original_label = annot2label[original_annot]
-                    n_chars = len(original_annot)
-                    n_words = len(original_annot.split())
-                    
-                    if len(original_annot.split()) > 1:
-                        # For every match of the token in text, check its 
-                        # surroundings and generate predictions
-                        try:
-                            for span in match_text_locations:   
-                                predictions, pos_matrix = \
-                                    check_surroundings(txt, span,original_annot,
-                                                       n_chars, n_words,original_label,
-                                                       predictions, pos_matrix)
-                        except:
-                            pass
-                                                              
-                    # If original_annotation is just the token, no need to 
-                    # check the surroundings
-                    elif len(original_annot.split()) == 1:
-                        for span in match_text_locations:
-                            # Check span is surrounded by spaces or punctuation signs &
-                            # span is not contained in a previously stored prediction
-                            try:
-                                if (((txt[span[0]-1].isalnum() == False) & 
-                                     (txt[span[1]].isalnum()==False)) & 
-                                    (not any([(item[0]<=span[0]) & (span[1]<=item[1]) 
-                                              for item in pos_matrix]))):
-                                    
-                                    # STORE PREDICTION and eliminate old predictions
-                                    # contained in the new one
-                                 predictions, pos_matrix = \
-                                        store_prediction(pos_matrix, predictions,
-                                                         span[0], span[1],
-                                                         original_label, df_annot,
-                                                         original_annot, txt)
-                            except:
-                                pass
- 
-            #### 5. Remove duplicates ####
-            predictions.sort()
-            predictions_no_duplicates = [k for k,_ in itertools.groupby(predictions)]
-                        
-            # Final appends
-            predictions_dict[filename] = predictions_no_duplicates
+    predictions_dict = {}
+    for filename, predictions in matcher.match_batch(read_files(datapath), workers,
+                                                     chunksize):
+        print(filename)
+        predictions_dict[filename] = predictions.to_list()
                 
     total_t = time.time() - start
     
@@ -170,11 +82,53 @@ def parse_arguments():
     parser.add_argument("-gs2", "--gs_path2", required = False, dest = "gs_path2", 
                         default = "", help = "path to a second GS file")
     parser.add_argument("-data", "--data_path", required = True, dest = "data_path", 
-                        help = "path to text files")
+                        help = "path to text files directory, or to a JSONL or TSV "
+                        "corpus file of (tweet_id, text), optionally gzip-compressed")
     parser.add_argument("-out", "--out_path", required = True, dest = "out_path", 
                         help = "path to output predictions")
     parser.add_argument("-t", "--sub_track", required = True, dest = "sub_track", 
                         help = "sub_track number (1 or 2 for code prediction, 3 for Explainable AI")
+    parser.add_argument("-e", "--engine", required = False, dest = "engine",
+                        default = "legacy", choices = ["legacy", "trie"],
+                        help = "matching engine: legacy (check surroundings of every "
+                        "token occurrence) or trie (token-level trie, one pass per document)")
+    parser.add_argument("-w", "--workers", required = False, dest = "workers",
+                        default = 1, type = int, help = "number of worker processes")
+    parser.add_argument("-gz", "--gazetteer", required = False, dest = "gazetteer_path",
+                        default = "", help = "path to the compiled gazetteer. "
+                        "It is compiled again if the GS files have changed")
+    parser.add_argument("-m", "--metrics", required = False, dest = "metrics_path",
+                        default = "", help = "path to output JSON with stage timings, "
+                        "counters and slowest documents")
+    parser.add_argument("--metrics_top", required = False, dest = "metrics_top",
+                        default = 20, type = int, 
+                        help = "number of slowest documents in the metrics")
+    parser.add_argument("--metrics_docs", required = False, dest = "metrics_docs",
+                        default = "", help = "path to output JSONL with the "
+                        "metrics of every document")
+    parser.add_argument("-mf", "--manifest", required = False, dest = "manifest_path",
+                        default = "", help = "path to the manifest of an incremental "
+                        "run. Unchanged documents since the previous run are not "
+                        "matched again")
+    parser.add_argument("-c", "--chunk_size", required = False, dest = "chunk_size",
+                        default = 0, type = int, help = "match documents longer than "
+                        "this number of characters in overlapping chunks (0: never)")
+    parser.add_argument("--mmap", required = False, dest = "mapped",
+                        action = "store_true", help = "memory-map the text files of "
+                        "the data directory instead of reading them. They are matched "
+                        "in chunks (of 1M bytes if --chunk_size is not given)")
+    parser.add_argument("-eval", "--eval_gs", required = False, dest = "eval_path",
+                        default = "", help = "path to a GS file to score the predictions "
+                        "against (precision, recall and F1 of the sub-track)")
+    parser.add_argument("-f", "--out_format", required = False, dest = "out_format",
+                        default = "tsv", choices = ["tsv", "npz"], help = "format of "
+                        "the output file: TSV, or NumPy npz archive of typed columns "
+                        "(see output.py)")
+    parser.add_argument("--max_memory", required = False, dest = "max_memory",
+                        default = 0, type = int, help = "memory budget of the main "
+                        "process in MB, with workers: results waiting for slower "
+                        "documents are spilled to temporary files over it (0: no "
+                        "budget)")
     
     args = parser.parse_args()
     gs_path = args.gs_path
@@ -182,70 +136,106 @@ def parse_arguments():
     data_path = args.data_path
     out_path = args.out_path
     sub_track = int(args.sub_track)
-    
-    return gs_path, data_path, out_path, sub_track, gs_path2
-
-if __name__ == '__main__':
-    ######## GET GS INFORMATION ########    
-    # Get DataFrame   
-    gs_path, data_path, out_path, sub_track, dev_path = parse_arguments()
+    engine = args.engine
+    workers = args.workers
+    gazetteer_path = args.gazetteer_path
+    metrics_path = args.metrics_path
+    metrics_top = args.metrics_top
+    metrics_docs = args.metrics_docs
+    manifest_path = args.manifest_path
+    chunk_size = args.chunk_size
+    mapped = args.mapped
+    eval_path = args.eval_path
+    out_format = args.out_format
+    max_memory = args.max_memory * (1 << 20)
+    
+    return (gs_path, data_path, out_path, sub_track, gs_path2, engine, workers,
+            gazetteer_path, metrics_path, metrics_top, metrics_docs, manifest_path,
+            chunk_size, mapped, eval_path, out_format, max_memory)
 
-    print('\n\nParsing input files...\n\n')
-    df_annot = parse_tsv(gs_path, sub_track)
-    
-    if dev_path != "":
-        df_dev = parse_tsv(dev_path, sub_track)
-        df_annot = pd.concat([df_annot, df_dev], ignore_index=True)
-            
-    df_annot = df_annot.loc[df_annot['type'].isin(['PROFESION', 'SITUACION_LABORAL'])]
+def parse_compile_arguments():
     
-    ######## FORMAT ANN INFORMATION #########
-    print('\n\nExtracting original annotations...\n\n')
-    min_upper = 3
-    annot2label, annot2annot_processed, annotations_final = format_ann_info(df_annot, min_upper)
+    # DESCRIPTION: Parse command line arguments of the compile subcommand
     
+    parser = argparse.ArgumentParser(prog='lookup.py compile',
+                                     description='compile the GS annotations')
+    parser.add_argument("-gs", "--gs_path", required = True, dest = "gs_path", 
+                        help = "path to GS file")
+    parser.add_argument("-gs2", "--gs_path2", required = False, dest = "gs_path2", 
+                        default = "", help = "path to a second GS file")
+    parser.add_argument("-out", "--out_path", required = True, dest = "out_path", 
+                        help = "path to output compiled gazetteer")
+    parser.add_argument("-t", "--sub_track", required = False, dest = "sub_track", 
+                        default = 2, help = "sub_track number")
     
-    ######## FIND MATCHES IN TEXT ########
-    print('\n\nPredicting codes...\n\n')
-    total_t, predictions_dict = \
-        find_predictions(data_path, min_upper, annot2label, annot2annot_processed,
-                         annotations_final, df_annot)
-    print('Elapsed time: {}s'.format(round(total_t, 3)))
+    args = parser.parse_args(sys.argv[2:])
     
-    ######## FORMAT OUTPUT ########
-    df = pd.DataFrame(columns =['ref', 'pos0', 'pos1', 'label', 'doc'])
-    for filename in predictions_dict.keys():
-        if predictions_dict[filename]:
-            df_this = pd.DataFrame(predictions_dict[filename], 
-                                   columns=['ref', 'pos0', 'pos1', 'label'])
-            df_this['doc'] = filename[:-4] # remove file extension .txt
-            
-            df = df.append(df_this)
+    return args.gs_path, args.out_path, int(args.sub_track), args.gs_path2
+
+if __name__ == '__main__':
+    ######## COMPILE GS INFORMATION ########
+    if sys.argv[1:2] == ['compile']:
+        gs_path, out_path, sub_track, dev_path = parse_compile_arguments()
+        gs_paths = [gs_path] + ([dev_path] if dev_path != "" else [])
+        
+        print('\n\nCompiling annotations...\n\n')
+        gazetteer = build_gazetteer(gs_paths, sub_track, MIN_UPPER, LABELS)
+        save_gazetteer(out_path, gazetteer,
+                       gazetteer_fingerprint(gs_paths, MIN_UPPER, LABELS))
+        sys.exit(0)
     
-    files_to_predict = set(map(lambda x: '.'.join(x.split('.')[:-1]), os.listdir(data_path)))
-    files_annotated = set(df.doc.tolist())
-    unannotated = files_to_predict - files_annotated
+    ######## GET GS INFORMATION ########    
+    (gs_path, data_path, out_path, sub_track, dev_path, engine, workers,
+     gazetteer_path, metrics_path, metrics_top, metrics_docs, 
+     manifest_path, chunk_size, mapped, eval_path, out_format, 
+     max_memory) = parse_arguments()
+    gs_paths = [gs_path] + ([dev_path] if dev_path != "" else [])
+    metrics = RunMetrics(metrics_top, metrics_docs) if metrics_path != "" else None
+    scorer = Scorer(read_gold([eval_path], sub_track), sub_track) if eval_path != "" else None
     
-    if sub_track == 1:
-        df_final = df[['doc']].drop_duplicates().copy()
-        df_final['label'] = 1
-        df_no_pred = pd.DataFrame(dict(zip(unannotated, [0]*len(unannotated))).items(), 
-                                  columns=['doc', 'label'])
-        df_final = df_final.append(df_no_pred)
-        df_final.columns = ['tweet_id', 'label']
-        
-    elif sub_track == 2: 
-        df_final = df[['doc', 'pos0','pos1','label','ref']].copy()
-        df_no_pred = pd.DataFrame(dict(zip(unannotated, ['-']*len(unannotated))).items(), 
-                                  columns=['doc', 'pos0'])
-        df_no_pred['pos1']  = '-'
-        df_no_pred['label']  = '-'
-        df_no_pred['ref']  = '-'
-        df_final = df_final.append(df_no_pred)
-        df_final.columns = ['tweet_id', 'begin', 'end', 'type', 'extraction']
-    else:
-        raise ValueError('Incorrect sub-track value')
-        
-    ######## SAVE OUTPUT ########
-    df_final.to_csv(out_path, sep='\t', index=False, header=True)
+    print('\n\nExtracting original annotations...\n\n')
+    t_gazetteer = clock()
+    matcher = Matcher.from_tsv(gs_paths, MIN_UPPER, LABELS, engine, sub_track,
+                               gazetteer_path, chunk_size)
+    if metrics is not None:
+        metrics.add_time('gazetteer', t_gazetteer)
     
+    ######## FIND MATCHES IN TEXT AND SAVE OUTPUT ########
+    print('\n\nPredicting codes...\n\n')
+    start = time.time()
+    manifest = None
+    if manifest_path != "":
+        manifest = Manifest(manifest_path, manifest_fingerprint(
+            gazetteer_fingerprint(gs_paths, MIN_UPPER, LABELS), engine, chunk_size,
+            mapped))
+    with open_writer(out_path, sub_track, out_format) as writer:
+        for result in iter_predictions(data_path, matcher, workers, metrics=metrics,
+                                       manifest=manifest, mapped=mapped,
+                                       max_memory=max_memory):
+            doc_id, predictions = result[0], result[1]
+            print(doc_id)
+            if scorer is not None:
+                scorer.add(doc_id, predictions)
+            if metrics is None:
+                writer.write(doc_id, predictions)
+            else:
+                if result[2] is not None:
+                    metrics.add_document(doc_id, result[2])
+                t_output = clock()
+                writer.write(doc_id, predictions)
+                metrics.add_time('output', t_output)
+    if manifest is not None:
+        manifest.compact()
+        print('Reused {} documents, matched {}'.format(manifest.n_reused, manifest.n_new))
+        if metrics is not None:
+            metrics.count('documents_reused', manifest.n_reused)
+    print('Elapsed time: {}s'.format(round(time.time() - start, 3)))
+    if scorer is not None:
+        print(format_scores(scorer.result()))
+    if (metrics is not None) and (metrics.rejection_rate() is not None):
+        print('Prefilter rejected {} of {} texts ({:.1%})'.format(
+            metrics.counts['prefilter_rejected'], metrics.counts['prefilter_checked'],
+            metrics.rejection_rate()))
+    if metrics is not None:
+        metrics.save(metrics_path)
+        print('Metrics written to {}'.format(metrics_path))
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Incremental runs: reuse the predictions of documents that did not change
+since a previous run.
+
+The manifest is a JSONL file. The first line holds the fingerprint of
+everything the predictions depend on (GS files, min_upper, labels, engine,
+chunking). Every other line holds the id, the content hash and the
+predictions of one document. Lines are appended as documents are matched,
+so that a run that crashes partway through is resumed by the next one. At
+the end of a complete run, the manifest is rewritten with the documents of
+the run only.
+
+If the fingerprint changed, the previous manifest is discarded and every
+document is matched again.
+"""
+import os
+import json
+import hashlib
+from collections import deque
+from records import Predictions
+from chunks import MappedText
+
+# Increase when the matching changes the predictions of a document
+MANIFEST_VERSION = 1
+
+# Number of new entries written between flushes of the manifest file
+FLUSH_EVERY = 256
+
+
+def manifest_fingerprint(gazetteer_fingerprint, engine, chunk_size=0, mapped=False):
+    '''
+    DESCRIPTION: hash of everything the stored predictions depend on.
+
+    INPUT: gazetteer_fingerprint: output of gazetteer.gazetteer_fingerprint.
+           engine: 'legacy' or 'trie'.
+           chunk_size: int. Chunk size of long documents (0: never chunked).
+           mapped: bool. Whether text files are memory-mapped and matched
+              in chunks.
+    '''
+    return hashlib.sha256(json.dumps([MANIFEST_VERSION, gazetteer_fingerprint,
+                                      engine, chunk_size, mapped]).encode('utf-8')).hexdigest()
+
+
+def content_hash(txt):
+    if isinstance(txt, MappedText):
+        return txt.content_hash()
+    return hashlib.sha1(txt.encode('utf-8')).hexdigest()
+
+
+class Manifest():
+    '''
+    DESCRIPTION: previous predictions of every document, by content hash.
+
+    INPUT: path: str with the path to the manifest (created if it does not
+              exist).
+           fingerprint: output of manifest_fingerprint.
+    '''
+    def __init__(self, path, fingerprint):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.entries = {}
+        self.seen = []
+        self.n_reused = 0
+        self.n_new = 0
+
+        if self.load():
+            self.file = open(path, 'a', encoding='utf-8')
+            # End the line half-written by a crashed run
+            if self.partial:
+                self.file.write('\n')
+        else:
+            self.file = open(path, 'w', encoding='utf-8')
+            self.write_line({'fingerprint': fingerprint})
+
+    def load(self):
+        '''
+        DESCRIPTION: read the entries of the manifest in path.
+
+        OUTPUT: bool. Whether the manifest exists and has the same
+                  fingerprint.
+        '''
+        self.partial = False
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path, encoding='utf-8') as f:
+            for n, line in enumerate(f):
+                self.partial = not line.endswith('\n')
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Line half-written by a crashed run
+                    continue
+                if n == 0:
+                    if record.get('fingerprint') != self.fingerprint:
+                        return False
+                    continue
+                self.entries[record['doc_id']] = (record['hash'],
+                                                  Predictions.from_rows(record['predictions']))
+        return True
+
+    def write_line(self, record):
+        self.file.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    def get(self, doc_id, digest):
+        '''
+        OUTPUT: predictions: stored predictions of the document
+                  (records.Predictions), or None if it is new or its content
+                  changed.
+        '''
+        entry = self.entries.get(doc_id)
+        if (entry is None) or (entry[0] != digest):
+            return None
+        return entry[1]
+
+    def add(self, doc_id, digest, predictions):
+        self.entries[doc_id] = (digest, predictions)
+        self.write_line({'doc_id': doc_id, 'hash': digest,
+                         'predictions': predictions.to_list()})
+        self.n_new = self.n_new + 1
+        if self.n_new % FLUSH_EVERY == 0:
+            self.file.flush()
+
+    def compact(self):
+        '''
+        DESCRIPTION: rewrite the manifest with the documents of this run
+                  only. It is written to a temporary file first, so that a
+                  crash never leaves a half-written manifest.
+        '''
+        self.file.close()
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({'fingerprint': self.fingerprint}) + '\n')
+            for doc_id in self.seen:
+                digest, predictions = self.entries[doc_id]
+                f.write(json.dumps({'doc_id': doc_id, 'hash': digest,
+                                    'predictions': predictions.to_list()},
+                                   ensure_ascii=False) + '\n')
+        os.replace(tmp_path, self.path)
+
+    def close(self):
+        '''
+        DESCRIPTION: close the manifest without compacting it (incomplete
+                  run). The appended entries are kept for the next run.
+        '''
+        self.file.close()
+
+
+def iter_incremental(docs, manifest, matcher, workers=1, chunksize=64, with_stats=False,
+                     max_memory=0):
+    '''
+    DESCRIPTION: find the annotations present in every document, reusing the
+              predictions stored in the manifest for unchanged documents.
+              Only new or changed documents are sent to the matcher.
+
+    INPUT: docs: iterable of (doc_id, text) tuples.
+           manifest: Manifest.
+           matcher, workers, chunksize, with_stats, max_memory: see
+              Matcher.match_batch.
+
+    OUTPUT: generator of (doc_id, predictions) tuples, or (doc_id,
+              predictions, stats) tuples if with_stats (stats is None for
+              reused documents), in the same order as docs.
+    '''
+    # Documents read so far and not yielded yet, in order: (doc_id, digest,
+    # stored predictions or None if the document is being matched). With
+    # workers, it is filled by the thread that sends documents to the pool.
+    order = deque()
+
+    def pending():
+        for doc_id, txt in docs:
+            digest = content_hash(txt)
+            predictions = manifest.get(doc_id, digest)
+            order.append((doc_id, digest, predictions))
+            if predictions is None:
+                yield doc_id, txt
+
+    def reused(doc_id, predictions):
+        manifest.seen.append(doc_id)
+        manifest.n_reused = manifest.n_reused + 1
+        return (doc_id, predictions, None) if with_stats else (doc_id, predictions)
+
+    for result in matcher.match_batch(pending(), workers, chunksize, with_stats,
+                                      max_memory):
+        # Previous documents are reused ones
+        while order[0][2] is not None:
+            doc_id, _, predictions = order.popleft()
+            yield reused(doc_id, predictions)
+        doc_id, digest, _ = order.popleft()
+        manifest.add(doc_id, digest, result[1])
+        manifest.seen.append(doc_id)
+        yield result
+
+    while order:
+        doc_id, _, predictions = order.popleft()
+        yield reused(doc_id, predictions)
@@ -0,0 +1,523 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Match the GS annotations in texts held in memory.
+
+Matcher is built once from the GS annotations (a DataFrame, TSV files or a
+compiled gazetteer) and finds the annotations present in one text or in a 
+batch of (id, text) pairs, without touching the filesystem.
+"""
+import re
+import multiprocessing
+from bisect import bisect_left
+from utils import (format_text_info, tokenize_span, normalize_tokens, normalize_str,
+                   STOP_WORDS)
+from trie import build_trie, find_matches
+from prefilter import prefilter_keys, may_match
+from spans import SpanSet
+from records import Predictions, label_table
+from chunks import MappedText, iter_chunks, chunk_overlap, DEFAULT_CHUNK_SIZE
+from metrics import DocStats, clock
+from gazetteer import (compile_annotations, build_gazetteer, get_gazetteer, 
+                       update_gazetteer, max_chars, MIN_UPPER, LABELS)
+
+
+def check_surroundings(txt, span, original_annot, n_chars, n_words, original_label,
+                       spans, min_upper, original_annotation_processed=None, 
+                       stats=None, token_array=None):
+    '''
+    DESCRIPTION: explore the surroundings of the match.
+              Do not care about extra whitespaces or punctuation signs in 
+              the middle of the annotation.
+              If token_array (ngrams.TokenArray of txt) is given, the 
+              annotation is looked for in the window tokens directly, without
+              building all token combinations.
+              If stats (DocStats) is given, the n-gram generation is timed
+              and counted.
+    '''
+    
+    ## 1. Get normalized surroundings ##
+    large_span = txt[max(0, span[0]-n_chars):min(span[1]+n_chars, len(txt))]
+
+    # remove half-catched words. Without whitespaces, no word is whole.
+    first_space = re.search('( |\n)', large_span)
+    if first_space is None:
+        return
+    first_space = first_space.span()[1]
+    last_space = (len(large_span) - re.search('( |\n)', large_span[::-1]).span()[0])
+    large_span_reg = large_span[first_space:last_space]
+    
+    if original_annotation_processed is None:
+        original_annotation_processed = normalize_str(original_annot, min_upper)
+    if stats is not None:
+        start = clock()
+    
+    # Window tokens in the token array of the text
+    if token_array is not None:
+        lo, hi = token_array.window(first_space + max(0, span[0]-n_chars),
+                                    last_space + max(0, span[0]-n_chars))
+        if token_array.is_safe(lo, hi):
+            match = token_array.match(lo, hi, original_annotation_processed, n_words,
+                                      min_upper)
+            if stats is not None:
+                stats.add_time('ngrams', start)
+                stats.count('ngrams', max(0, hi - lo - n_words + 1))
+            if match is not None:
+                spans.add(match[0], match[1], original_label)
+            return
+    
+    # Tokenize text span 
+    token_span2id, id2token_span_pos, token_spans = tokenize_span(large_span_reg,
+                                                                  n_words)
+    # Normalize
+    token_span_processed2token_span = normalize_tokens(token_spans, min_upper)
+    if stats is not None:
+        stats.add_time('ngrams', start)
+        stats.count('ngrams', len(token_spans))
+    
+    ## 2. Match ##
+    try:
+        res = token_span_processed2token_span[original_annotation_processed]
+        id_ = token_span2id[res]
+        pos = id2token_span_pos[id_]
+        off0 = (pos[0] + first_space + max(0, span[0]-n_chars))
+        off1 = (pos[1] + first_space + max(0, span[0]-n_chars))
+        
+        # STORE PREDICTION if it is not contained in a previously stored one,
+        # and eliminate old predictions contained in the new one.
+        spans.add(off0, off1, original_label)
+    except: 
+        pass
+
+def check_occurrences(txt, locations, annotations, min_upper, token_array,
+                      stats=None):
+    '''
+    DESCRIPTION: explore the surroundings of every occurrence of a token for
+              all the multi-word annotations where it is present, with the
+              same matches as check_surroundings for every (annotation,
+              occurrence) pair.
+              The window of every annotation is delimited with a binary
+              search in the whitespaces of the text (TokenArray.spaces). If
+              it is safe, the annotation is looked up in its tokens;
+              otherwise, in the token combinations of the window of the
+              longest annotation (ngrams.NgramTable), normalized once for all
+              the annotations of the occurrence. In texts where every window
+              is safe, annotations that do not occur in the text are not
+              looked up.
+              If stats (DocStats) is given, the lookups are timed and the
+              n-grams counted.
+    
+    INPUT: txt: str with the text.
+           locations: list of (start, end) offsets of the token occurrences.
+           annotations: list of annotation records (records.Annotation) with
+              more than one word.
+           min_upper: int. Specifies the minimum number of characters of a word
+               to lowercase it (to prevent mistakes with acronyms).
+           token_array: ngrams.TokenArray of txt.
+    
+    OUTPUT: matches: python dict {annotation text: list of (off0, off1)}, in
+              the order of locations.
+    '''
+    from ngrams import NgramTable, annotation_key
+    
+    matches = dict((annotation.text, []) for annotation in annotations)
+    if token_array.unsafe[-1] == 0:
+        annotations = [annotation for annotation in annotations
+                       if token_array.find(annotation_key(annotation.processed))]
+    n_chars = max([annotation.n_chars for annotation in annotations], default=0)
+    n_words = max([annotation.n_words for annotation in annotations], default=0)
+    spaces = token_array.spaces
+    
+    def window(span, n_chars):
+        # Whitespaces around the window (see check_surroundings): first and
+        # last inside it
+        i = bisect_left(spaces, max(0, span[0]-n_chars))
+        j = bisect_left(spaces, min(span[1]+n_chars, len(txt))) - 1
+        return i, j
+    
+    for span in locations:
+        if not annotations:
+            break
+        if stats is not None:
+            start = clock()
+        
+        # Match every annotation in its own window
+        table = None
+        for annotation in annotations:
+            i, j = window(span, annotation.n_chars)
+            if i > j:
+                # No whitespace to remove half-catched words
+                continue
+            lo, hi = token_array.window(spaces[i] + 1, spaces[j] + 1)
+            if token_array.is_safe(lo, hi):
+                match = token_array.match(lo, hi, annotation.processed, 
+                                          annotation.n_words, min_upper)
+                if stats is not None:
+                    stats.count('ngrams', max(0, hi - lo - annotation.n_words + 1))
+            else:
+                if table is None:
+                    # Window of the longest annotation
+                    i, j = window(span, n_chars)
+                    table = NgramTable(token_array, *token_array.window(spaces[i] + 1,
+                                                                        spaces[j] + 1),
+                                       n_words, min_upper)
+                    if stats is not None:
+                        stats.count('ngrams', table.size)
+                match = table.match(lo, hi, annotation.processed, annotation.n_words)
+            if match is not None:
+                matches[annotation.text].append(match)
+        if stats is not None:
+            stats.add_time('ngrams', start)
+    return matches
+
+def match_candidates(txt, words_in_annots, words_processed2pos, token2annots, 
+                     min_upper, spans, stats=None):
+    '''
+    DESCRIPTION: check the surroundings of every occurrence of the candidate
+              tokens and store the annotations found in spans.
+    
+    INPUT: txt: str with the text.
+           words_in_annots: set of candidate tokens (intersection of the text
+               tokens and the annotation tokens).
+           words_processed2pos: output of format_text_info.
+           token2annots: output of format_ann_info.
+           min_upper: int. Specifies the minimum number of characters of a word
+               to lowercase it (to prevent mistakes with acronyms).
+           spans: SpanSet where the predictions are stored.
+           stats: DocStats to count the surroundings checks, or None.
+    '''
+    #### 4. For every token of the intersection, get all original 
+    #### annotations associated to it and all matches in text.
+    #### Then, check surroundings of all those matches to check if any
+    #### of the original annotations is in the text ####
+    # Tokens of the text, built the first time a surroundings check is needed
+    token_array = None
+    
+    # For every token
+    for match in words_in_annots:
+        
+        # Get annotations where this token is present
+        original_annotations = token2annots[match]
+        # Get text locations where this token is present
+        match_text_locations = words_processed2pos[match]
+
+        # Check the surroundings of every match of the token in text once
+        # for all the multi-word annotations where this token is present
+        multi_word = [annotation for annotation in original_annotations
+                      if annotation.n_words > 1]
+        if multi_word:
+            if token_array is None:
+                from ngrams import get_token_array
+                token_array = get_token_array(txt)
+            if stats is not None:
+                stats.count('surroundings_checks',
+                            len(match_text_locations) * len(multi_word))
+            found = check_occurrences(txt, match_text_locations, multi_word,
+                                      min_upper, token_array, stats)
+
+        # For every original annotation where this token is present:
+        for annotation in original_annotations:
+            
+            if annotation.n_words > 1:
+                # Generate predictions, annotation by annotation (of equal
+                # spans, the one with the first label is kept)
+                for off0, off1 in found[annotation.text]:
+                    spans.add(off0, off1, annotation.label)
+                                                      
+            # If original_annotation is just the token, no need to 
+            # check the surroundings
+            elif annotation.n_words == 1:
+                if stats is not None:
+                    stats.count('boundary_checks', len(match_text_locations))
+                for span in match_text_locations:
+                    # Check span is surrounded by spaces or punctuation signs
+                    try:
+                        if ((txt[span[0]-1].isalnum() == False) & 
+                            (txt[span[1]].isalnum()==False)):
+                            
+                            # STORE PREDICTION if it is not contained in a
+                            # previously stored one, and eliminate old 
+                            # predictions contained in the new one
+                            spans.add(span[0], span[1], annotation.label)
+                    except:
+                        pass
+
+def find_predictions_text(txt, min_upper, annotations_final, token2annots,
+                          engine='legacy', trie=None, unigrams=None, stats=None,
+                          labels=None, prefilter=None, stopwords=STOP_WORDS):
+    '''
+    DESCRIPTION: find the annotations present in one text.
+    
+    INPUT: txt: str with the text.
+           min_upper: int. Specifies the minimum number of characters of a word
+               to lowercase it (to prevent mistakes with acronyms).
+           annotations_final, token2annots: output of format_ann_info.
+           engine: 'legacy' or 'trie'.
+           trie, unigrams: output of build_trie (only for the trie engine).
+           stats: DocStats where stage timings and counters are recorded, or
+               None.
+           labels: label table of the annotations (see records.label_table).
+           prefilter: output of prefilter.prefilter_keys, or None to match
+               every text.
+           stopwords: set of words that are not indexed.
+    
+    OUTPUT: predictions: records.Predictions, sorted by (ref, off0, off1).
+    '''
+    #### 0. Initialize, etc. ####
+    spans = SpanSet(txt, labels)
+    if stats is not None:
+        start = clock()
+    
+    #### 1. Reject texts without any gazetteer token ####
+    rejected = (prefilter is not None) and (not may_match(txt, prefilter))
+    if stats is not None:
+        stats.add_time('prefilter', start)
+        stats.count('prefilter_checked')
+        stats.count('prefilter_rejected', int(rejected))
+        stats.count('chars', len(txt))
+        start = clock()
+    if rejected:
+        return spans.predictions()
+    
+    if engine == 'trie':
+        find_matches(txt, trie, unigrams, min_upper, spans, stopwords)
+        if stats is not None:
+            stats.add_time('trie_match', start)
+    else:
+        #### 2. Format text information ####
+        words_final, words_processed2pos = format_text_info(txt, min_upper, stopwords)
+        if stats is not None:
+            stats.add_time('format_text_info', start)
+            start = clock()
+        
+        #### 3. Intersection ####
+        # Generate candidates
+        words_in_annots = words_final.intersection(annotations_final)            
+        if stats is not None:
+            stats.add_time('intersection', start)
+            stats.count('candidate_tokens', len(words_in_annots))
+            start = clock()
+         
+        #### 4. For every token of the intersection, check surroundings of 
+        #### all its matches in text ####
+        match_candidates(txt, words_in_annots, words_processed2pos, token2annots,
+                         min_upper, spans, stats)
+        if stats is not None:
+            stats.add_time('check_surroundings', start)
+    
+    if stats is not None:
+        stats.count('predictions_kept', len(spans))
+        stats.count('predictions_rejected', spans.rejected)
+        stats.count('predictions_evicted', spans.evicted)
+ 
+    #### 5. Sorted predictions (stored spans never repeat) ####
+    return spans.predictions()
+
+
+# Matcher used by the worker processes of Matcher.match_batch. Set once per
+# worker by init_worker (with the fork start method, it is inherited from 
+# the parent process instead of pickled).
+_worker_matcher = None
+
+def init_worker(matcher):
+    global _worker_matcher
+    _worker_matcher = matcher
+
+def match_document(doc):
+    doc_id, txt = doc
+    return doc_id, _worker_matcher.match(txt)
+
+def match_documents(docs):
+    return [(doc_id, _worker_matcher.match(txt)) for doc_id, txt in docs]
+
+def match_document_stats(doc):
+    doc_id, txt = doc
+    stats = DocStats()
+    return doc_id, _worker_matcher.match(txt, stats), stats
+
+
+class Matcher():
+    '''
+    DESCRIPTION: find the GS annotations in texts.
+    
+    INPUT: gazetteer: python dict with the lookup structures (see 
+              gazetteer.build_gazetteer).
+           engine: 'legacy' (check surroundings of every token occurrence) or
+              'trie' (token-level trie, one pass per document).
+           chunk_size: int. Texts longer than chunk_size characters are
+              matched in overlapping chunks (see chunks.py). 0 to match
+              every text at once (except chunks.MappedText texts, always
+              matched in chunks).
+    '''
+    def __init__(self, gazetteer, engine='legacy', chunk_size=0):
+        if engine not in ['legacy', 'trie']:
+            raise ValueError('Incorrect engine value')
+        self.min_upper = gazetteer['min_upper']
+        self.engine = engine
+        self.chunk_size = chunk_size
+        self.gazetteer = self.prepare(gazetteer)
+    
+    def prepare(self, gazetteer):
+        '''
+        DESCRIPTION: add the structures of a gazetteer that are missing
+                  (e.g. the trie, if it was compiled without it).
+        '''
+        if 'labels' not in gazetteer:
+            gazetteer['labels'] = label_table(gazetteer['annot2label'])
+        if 'max_chars' not in gazetteer:
+            gazetteer['max_chars'] = max_chars(gazetteer)
+        if 'stopwords' not in gazetteer:
+            gazetteer['stopwords'] = STOP_WORDS
+        if 'prefilter' not in gazetteer:
+            gazetteer['prefilter'] = prefilter_keys(gazetteer['annotations_final'])
+        if (self.engine == 'trie') & (gazetteer['trie'] is None):
+            gazetteer['trie'], gazetteer['unigrams'] = \
+                build_trie(gazetteer['annot2label'], gazetteer['annot2annot_processed'],
+                           self.min_upper)
+        return gazetteer
+    
+    def swap(self, gazetteer):
+        '''
+        DESCRIPTION: replace the gazetteer at once. Texts being matched keep
+                  the gazetteer they started with.
+        '''
+        self.gazetteer = self.prepare(gazetteer)
+    
+    def update(self, add=(), remove=()):
+        '''
+        DESCRIPTION: add and remove annotations (see 
+                  gazetteer.update_gazetteer) and swap the new version in.
+        
+        OUTPUT: version: int. Version of the new gazetteer.
+        '''
+        gazetteer = update_gazetteer(self.gazetteer, add, remove)
+        self.swap(gazetteer)
+        return gazetteer['version']
+    
+    @classmethod
+    def from_dataframe(cls, df_annot, min_upper=MIN_UPPER, labels=LABELS, 
+                       engine='legacy', chunk_size=0):
+        '''
+        DESCRIPTION: build a Matcher from a DataFrame with the GS annotations
+                  (columns tweet_id, begin, end, type, extraction).
+        '''
+        df_annot = df_annot.loc[df_annot['type'].isin(labels)]
+        gazetteer = compile_annotations(df_annot, min_upper, 
+                                        with_trie=(engine == 'trie'))
+        return cls(gazetteer, engine, chunk_size)
+    
+    @classmethod
+    def from_tsv(cls, gs_paths, min_upper=MIN_UPPER, labels=LABELS, 
+                 engine='legacy', sub_track=2, gazetteer_path='', chunk_size=0):
+        '''
+        DESCRIPTION: build a Matcher from one or several GS TSV files. If
+                  gazetteer_path is given, the compiled gazetteer is loaded
+                  from there (and compiled again if it is outdated).
+        '''
+        if isinstance(gs_paths, str):
+            gs_paths = [gs_paths]
+        if gazetteer_path != '':
+            gazetteer, _ = get_gazetteer(gazetteer_path, gs_paths, sub_track, 
+                                         min_upper, labels)
+        else:
+            gazetteer = build_gazetteer(gs_paths, sub_track, min_upper, labels,
+                                        with_trie=(engine == 'trie'))
+        return cls(gazetteer, engine, chunk_size)
+    
+    def match(self, txt, stats=None):
+        '''
+        DESCRIPTION: find the annotations present in one text.
+        
+        INPUT: txt: str with the text, or chunks.MappedText.
+               stats: DocStats where stage timings and counters of the text
+                  are recorded, or None.
+        
+        OUTPUT: predictions: records.Predictions, sorted by (ref, off0, off1).
+                  Iterate over it (or call to_list) to get the [ref, off0,
+                  off1, label] lists.
+        '''
+        if stats is not None:
+            start = clock()
+        # The same gazetteer is used for the whole text, even if another one
+        # is swapped in meanwhile
+        gazetteer = self.gazetteer
+        overlap = chunk_overlap(gazetteer['max_chars'])
+        if isinstance(txt, MappedText):
+            predictions = self.match_chunks(txt.chunks(self.chunk_size or DEFAULT_CHUNK_SIZE,
+                                                       overlap), stats, gazetteer)
+        elif (self.chunk_size > 0) and (len(txt) > self.chunk_size):
+            predictions = self.match_chunks(iter_chunks(txt, self.chunk_size, overlap),
+                                            stats, gazetteer)
+        else:
+            predictions = self.match_text(txt, stats, gazetteer)
+        if stats is not None:
+            stats.time = clock() - start
+        return predictions
+    
+    def match_text(self, txt, stats=None, gazetteer=None):
+        if gazetteer is None:
+            gazetteer = self.gazetteer
+        return find_predictions_text(txt, self.min_upper, gazetteer['annotations_final'],
+                                     gazetteer['token2annots'], self.engine,
+                                     gazetteer['trie'], gazetteer['unigrams'], stats,
+                                     gazetteer['labels'], gazetteer['prefilter'],
+                                     gazetteer['stopwords'])
+    
+    def match_chunks(self, chunks, stats=None, gazetteer=None):
+        '''
+        DESCRIPTION: find the annotations present in a text split in chunks.
+        
+        INPUT: chunks: iterable of (offset, chunk, core0, core1) (see 
+                  chunks.iter_chunks).
+               stats: see match.
+               gazetteer: gazetteer to use (default: the current one).
+        
+        OUTPUT: predictions: records.Predictions with global offsets.
+        '''
+        if gazetteer is None:
+            gazetteer = self.gazetteer
+        rows = []
+        for offset, chunk, core0, core1 in chunks:
+            if stats is not None:
+                stats.count('chunks')
+            # Keep the predictions that start in the core: the chunk around
+            # the core holds all their context
+            for ref, off0, off1, label in self.match_text(chunk, stats, gazetteer):
+                if core0 <= off0 < core1:
+                    rows.append([ref, off0 + offset, off1 + offset, label])
+        return Predictions.from_rows(sorted(rows), gazetteer['labels'])
+    
+    def match_batch(self, docs, workers=1, chunksize=64, with_stats=False,
+                    max_memory=0):
+        '''
+        DESCRIPTION: find the annotations present in a batch of texts.
+        
+        INPUT: docs: iterable of (id, text) tuples. It is consumed lazily.
+               workers: int. Number of worker processes. The Matcher is sent
+                  once to every worker and texts are sent in chunks.
+               chunksize: int. Number of texts sent to a worker at once.
+               with_stats: bool. Whether to record the DocStats of every text.
+               max_memory: int. Memory budget in bytes (0: no budget). With 
+                  workers, texts are read a bounded number ahead and results
+                  waiting for previous ones are spilled to disk over the 
+                  budget (see spill.py). A single process keeps nothing.
+        
+        OUTPUT: generator of (id, predictions) tuples, or (id, predictions, 
+                  stats) tuples if with_stats, in the same order as docs.
+        '''
+        if (workers > 1) & (max_memory > 0):
+            from spill import iter_bounded
+            yield from iter_bounded(docs, self, workers, chunksize, max_memory,
+                                    with_stats)
+        elif workers > 1:
+            with multiprocessing.Pool(workers, initializer=init_worker, 
+                                      initargs=(self,)) as pool:
+                yield from pool.imap(match_document_stats if with_stats else 
+                                     match_document, docs, chunksize)
+        elif with_stats:
+            for doc_id, txt in docs:
+                stats = DocStats()
+                yield doc_id, self.match(txt, stats), stats
+        else:
+            for doc_id, txt in docs:
+                yield doc_id, self.match(txt)
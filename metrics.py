@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Optional instrumentation of lookup runs: wall time and call counts of every
+stage, counters (texts rejected by the prefilter, candidate tokens,
+surroundings checks, n-grams, predictions kept, rejected and evicted) and the
+slowest documents.
+
+DocStats is filled while one document is matched (also in worker processes,
+from where it is sent back with the predictions). RunMetrics aggregates the
+DocStats of all documents plus the run-level stages (gazetteer, read,
+output) and writes them to a JSON file.
+"""
+import json
+import heapq
+import time
+
+clock = time.perf_counter
+
+
+class Stats():
+    '''
+    DESCRIPTION: stage timings and counters.
+              times: python dict {stage: seconds}.
+              calls: python dict {stage: number of timed calls}.
+              counts: python dict {counter: int}.
+    '''
+    def __init__(self):
+        self.times = {}
+        self.calls = {}
+        self.counts = {}
+
+    def add_time(self, stage, start):
+        '''
+        INPUT: stage: str with the stage name.
+               start: value of clock() when the stage started.
+        '''
+        self.times[stage] = self.times.get(stage, 0.0) + (clock() - start)
+        self.calls[stage] = self.calls.get(stage, 0) + 1
+
+    def count(self, counter, n=1):
+        self.counts[counter] = self.counts.get(counter, 0) + n
+
+
+class DocStats(Stats):
+    '''
+    DESCRIPTION: timings and counters of one document. time is the total
+              matching time.
+    '''
+    def __init__(self):
+        Stats.__init__(self)
+        self.time = 0.0
+
+
+class RunMetrics(Stats):
+    '''
+    DESCRIPTION: timings and counters of a whole run.
+
+    INPUT: top: int. Number of slowest documents kept.
+           docs_path: str. Path to write one JSON line per document ('' to
+              keep only the aggregated metrics and the slowest documents).
+    '''
+    def __init__(self, top=20, docs_path=''):
+        Stats.__init__(self)
+        self.start = clock()
+        self.top = top
+        self.n_docs = 0
+        self.slowest = []
+        self.docs_file = open(docs_path, 'w', encoding='utf-8') if docs_path != '' else None
+
+    def timed(self, stage, iterable):
+        '''
+        DESCRIPTION: iterate over iterable, timing every step as stage (for
+                  instance, reading the documents).
+        '''
+        iterator = iter(iterable)
+        while True:
+            start = clock()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            self.add_time(stage, start)
+            yield item
+
+    def add_document(self, doc_id, stats):
+        '''
+        DESCRIPTION: add the DocStats of one document.
+        '''
+        self.n_docs = self.n_docs + 1
+        for stage, seconds in stats.times.items():
+            self.times[stage] = self.times.get(stage, 0.0) + seconds
+            self.calls[stage] = self.calls.get(stage, 0) + stats.calls[stage]
+        for counter, n in stats.counts.items():
+            self.count(counter, n)
+
+        record = {'doc_id': doc_id, 'time': stats.time, 'stages': stats.times,
+                  'calls': stats.calls, 'counts': stats.counts}
+        if self.docs_file is not None:
+            self.docs_file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        item = (stats.time, self.n_docs, record)
+        if len(self.slowest) < self.top:
+            heapq.heappush(self.slowest, item)
+        elif item > self.slowest[0]:
+            heapq.heapreplace(self.slowest, item)
+
+    def rejection_rate(self):
+        '''
+        OUTPUT: fraction of the matched texts (documents or chunks) rejected
+                  by the prefilter, or None if none was matched.
+        '''
+        checked = self.counts.get('prefilter_checked', 0)
+        return self.counts.get('prefilter_rejected', 0) / checked if checked else None
+
+    def to_dict(self):
+        wall_time = clock() - self.start
+        return {'wall_time': wall_time,
+                'documents': self.n_docs,
+                'docs_per_sec': self.n_docs / wall_time if wall_time else None,
+                'prefilter_rejection_rate': self.rejection_rate(),
+                'stages': {stage: {'time': self.times[stage], 'calls': self.calls[stage]}
+                           for stage in self.times},
+                'counts': self.counts,
+                'slowest': [record for _, _, record in sorted(self.slowest, reverse=True)]}
+
+    def save(self, path):
+        if self.docs_file is not None:
+            self.docs_file.close()
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, indent=2, ensure_ascii=False)
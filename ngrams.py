@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Array-backed tokens of a text, to match multi-word annotations in the
+surroundings of their tokens without building every token combination.
+
+check_surroundings used to tokenize the window around every (token
+occurrence x candidate annotation) pair, build all its 1..n_words token
+combinations (adjacent_combs) and normalize all of them (normalize_tokens).
+Instead, the text is tokenized once: token offsets and normalized token ids
+are stored in arrays. The occurrences of a normalized annotation in the
+whole text are found once with vectorized comparisons, and the tokens of
+every window are a slice of the arrays, found with a binary search.
+
+Windows whose tokens are not safe (see TokenArray) are matched with their
+normalized token combinations (NgramTable), as check_surroundings does. The
+table of the largest window around a token occurrence is built once and
+shared by every annotation checked there.
+"""
+import re
+import functools
+from bisect import bisect_left, bisect_right
+import numpy as np
+from utils import (tokenize, remove_accents, normalize_tokens, PUNCT_TABLE,
+                   WHITESPACE, NORMALIZATION_CACHE_SIZE, TokenizedText)
+
+
+# Separators of the words of a window (see check_surroundings)
+WINDOW_SPACE = re.compile('( |\n)')
+
+
+def token_key(token):
+    '''
+    DESCRIPTION: normalized token, as normalize_tokens normalizes it
+              (lowercase, no punctuation, no accents). It is lowercased again
+              after removing accents, so that token combinations that are
+              not lowercased by normalize_tokens (not longer than min_upper)
+              are found too.
+    '''
+    return remove_accents(token.lower().translate(PUNCT_TABLE)).lower()
+
+
+@functools.lru_cache(maxsize=NORMALIZATION_CACHE_SIZE)
+def annotation_key(annotation_processed):
+    '''
+    OUTPUT: tuple of the normalized words of an annotation (output of
+              normalize_str), as they are looked up in TokenArray.find.
+    '''
+    return tuple(word.lower() for word in annotation_processed.split(' '))
+
+
+def normalize_combination(combination, min_upper):
+    '''
+    DESCRIPTION: normalized form of a token combination, as normalize_tokens
+              normalizes it.
+    '''
+    if len(combination) > min_upper:
+        combination = combination.lower()
+    return remove_accents(WHITESPACE.sub(' ', combination).strip().translate(PUNCT_TABLE))
+
+
+class TokenArray():
+    '''
+    DESCRIPTION: tokens of a text (see utils.tokenize).
+              tokens, starts, ends: token strings and offsets.
+              ids: NumPy array with the id of the normalized form of every
+              token (see token_key).
+              unsafe: number of tokens before every token index whose
+              normalized form has whitespaces (some characters, like ´, are
+              decomposed into a whitespace and an accent). Combinations of
+              these tokens are normalized into more words than tokens, so
+              windows with them are matched by check_surroundings as before.
+              spaces: offsets of the spaces and newlines of the text, that
+              delimit the windows of check_surroundings.
+
+    INPUT: txt: str with the text.
+    '''
+    def __init__(self, txt):
+        tokens = tokenize(txt)
+        self.tokens = [token for _, _, token in tokens]
+        self.starts = [start for start, _, _ in tokens]
+        self.ends = [end for _, end, _ in tokens]
+
+        keys = [token_key(token) for token in self.tokens]
+        self.vocab = {}
+        self.ids = np.array([self.vocab.setdefault(key, len(self.vocab)) for key in keys],
+                            dtype=np.int64)
+        self.unsafe = [0]
+        for key in keys:
+            self.unsafe.append(self.unsafe[-1] + (' ' in key))
+        self.spaces = [m.start() for m in WINDOW_SPACE.finditer(txt)]
+
+        # Start token indices of every normalized annotation found
+        self.occurrences = {}
+
+    def find(self, words):
+        '''
+        DESCRIPTION: find the sequences of tokens whose normalized forms are
+                  words.
+
+        INPUT: words: tuple of normalized words.
+
+        OUTPUT: starts: sorted list of the start token index of every
+                  sequence.
+        '''
+        if words in self.occurrences:
+            return self.occurrences[words]
+
+        ids = [self.vocab.get(word) for word in words]
+        if (None in ids) | (len(ids) > len(self.ids)):
+            starts = []
+        else:
+            # Candidates for the first word, filtered by every next word
+            candidates = np.flatnonzero(self.ids[:len(self.ids) - len(ids) + 1] == ids[0])
+            for j in range(1, len(ids)):
+                candidates = candidates[self.ids[candidates + j] == ids[j]]
+            starts = candidates.tolist()
+        self.occurrences[words] = starts
+        return starts
+
+    def window(self, off0, off1):
+        '''
+        DESCRIPTION: tokens inside [off0, off1).
+
+        OUTPUT: lo, hi: token indices of the first token and after the last
+                  token.
+        '''
+        return bisect_left(self.starts, off0), bisect_right(self.ends, off1)
+
+    def is_safe(self, lo, hi):
+        return self.unsafe[hi] == self.unsafe[lo]
+
+    def match(self, lo, hi, annotation_processed, n_words, min_upper):
+        '''
+        DESCRIPTION: find a normalized annotation in the tokens lo:hi, as
+                  the lookup of annotation_processed in the normalized token
+                  combinations of check_surroundings does: when several
+                  combinations are normalized to it, the same one is chosen.
+
+        INPUT: lo, hi: output of window. The window must be safe.
+               annotation_processed: output of normalize_str.
+               n_words: maximum number of tokens in a combination.
+               min_upper: int. Specifies the minimum number of characters of a
+                  word to lowercase it (to prevent mistakes with acronyms).
+
+        OUTPUT: (off0, off1) offsets of the match, or None.
+        '''
+        words = annotation_key(annotation_processed)
+        m = len(words)
+        if m > n_words:
+            return None
+        starts = self.find(words)
+        i0 = bisect_left(starts, lo)
+        i1 = bisect_right(starts, hi - m)
+        if i0 >= i1:
+            return None
+
+        # Token combinations found, by first occurrence. Every combination
+        # keeps its last occurrence, as token_span2id does.
+        combination2start = {}
+        for start in starts[i0:i1]:
+            combination2start[' '.join(self.tokens[start:start + m])] = start
+        if len(combination2start) == 1:
+            # Same lookup, without the intermediate dicts of normalize_tokens
+            res = next(iter(combination2start))
+            if normalize_combination(res, min_upper) != annotation_processed:
+                res = None
+        else:
+            res = normalize_tokens(list(combination2start), min_upper).get(annotation_processed)
+        if res is None:
+            return None
+        start = combination2start[res]
+        return self.starts[start], self.ends[start + m - 1]
+
+
+def get_token_array(txt):
+    '''
+    DESCRIPTION: TokenArray of a text. It only depends on the text, so it is
+              kept in utils.TokenizedText texts and shared by every match.
+    '''
+    if not isinstance(txt, TokenizedText):
+        return TokenArray(txt)
+    if txt.token_array is None:
+        txt.token_array = TokenArray(txt)
+    return txt.token_array
+
+
+class NgramTable():
+    '''
+    DESCRIPTION: normalized token combinations of the tokens lo:hi of a
+              TokenArray, of up to n_words tokens (see utils.adjacent_combs).
+              It is built once for a window and looked up for several
+              annotations, each one in its own part of the window.
+
+    INPUT: token_array: TokenArray.
+           lo, hi: output of TokenArray.window.
+           n_words: maximum number of tokens in a combination.
+           min_upper: int. Specifies the minimum number of characters of a
+              word to lowercase it (to prevent mistakes with acronyms).
+    '''
+    def __init__(self, token_array, lo, hi, n_words, min_upper):
+        self.token_array = token_array
+        self.min_upper = min_upper
+        self.size = 0
+        # {normalized combination: list of (first token, after last token,
+        # combination)}, in the order of adjacent_combs
+        self.key2combinations = {}
+        tokens = token_array.tokens
+        for a in range(lo, hi):
+            combination = tokens[a]
+            for b in range(a + 1, min(a + 1 + n_words, hi + 1)):
+                if b > a + 1:
+                    combination = combination + ' ' + tokens[b - 1]
+                key = normalize_combination(combination, self.min_upper)
+                self.key2combinations.setdefault(key, []).append((a, b, combination))
+                self.size = self.size + 1
+
+    def match(self, lo, hi, annotation_processed, n_words):
+        '''
+        DESCRIPTION: find a normalized annotation in the combinations of the
+                  tokens lo:hi (inside the tokens of the table) of up to
+                  n_words tokens, as check_surroundings finds it in the
+                  combinations of those tokens: when several combinations
+                  are normalized to it, the same one is chosen.
+
+        OUTPUT: (off0, off1) offsets of the match, or None.
+        '''
+        # Combinations found, by first occurrence. Every combination keeps
+        # its last occurrence, as token_span2id does.
+        combination2tokens = {}
+        for a, b, combination in self.key2combinations.get(annotation_processed, []):
+            if (lo <= a) & (b <= hi) & (b - a <= n_words):
+                combination2tokens[combination] = (a, b)
+        if not combination2tokens:
+            return None
+        res = normalize_tokens(list(combination2tokens), self.min_upper)[annotation_processed]
+        a, b = combination2tokens[res]
+        return self.token_array.starts[a], self.token_array.ends[b - 1]
@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Write predictions to the output file: TSV (default, the format of the
+ProfNER evaluation), or binary columns (npz) for other pipelines.
+
+The npz file is an uncompressed NumPy .npz archive, written in row groups
+while the documents are matched, so that rows are not accumulated in
+memory. Every row group has one array per column (<column>_<group>):
++ Sub-track 2: tweet_id, extraction (UTF-8 strings: <column>_data, uint8
+  bytes, and <column>_offsets, int64 offsets of every string), begin and
+  end (int32) and type (int16 code in the type_dictionary strings).
+  Documents without predictions have one row with begin, end and type -1
+  and an empty extraction, as the '-' rows of the TSV.
++ Sub-track 1: tweet_id and label (int8).
+The meta array has one str: a JSON object with the sub-track, the columns,
+the number of rows and of row groups. np.load reads the file as any .npz
+archive, and ColumnarReader memory-maps its arrays instead of reading them.
+"""
+import csv
+import json
+import mmap
+import struct
+import zipfile
+
+# Columns of the output of every sub-track
+HEADERS = {1: ['tweet_id', 'label'],
+           2: ['tweet_id', 'begin', 'end', 'type', 'extraction']}
+
+
+def prediction_rows(doc, predictions, sub_track):
+    '''
+    DESCRIPTION: output rows of one document (see PredictionWriter).
+
+    INPUT: doc: str with the document identifier (tweet_id).
+           predictions: records.Predictions (or list of [ref, off0, off1,
+              label]). Label names are only looked up here.
+           sub_track: 1 or 2.
+
+    OUTPUT: rows: list of rows (lists) with the columns of HEADERS[sub_track].
+    '''
+    if sub_track == 1:
+        return [[doc, 1 if predictions else 0]]
+    if predictions:
+        return [[doc, off0, off1, label, ref] for ref, off0, off1, label in predictions]
+    return [[doc, '-', '-', '-', '-']]
+
+
+class PredictionWriter():
+    '''
+    DESCRIPTION: write the predictions of every document to the output TSV
+              as soon as they are available, so that nothing is accumulated
+              in memory.
+              Sub-track 1: one row per document, (tweet_id, label), with
+              label 1 if the document has predictions and 0 otherwise.
+              Sub-track 2: one row per prediction, (tweet_id, begin, end,
+              type, extraction), or a row with '-' placeholders if the
+              document has no predictions.
+    '''
+    HEADERS = HEADERS
+
+    def __init__(self, out_path, sub_track):
+        if sub_track not in self.HEADERS:
+            raise ValueError('Incorrect sub-track value')
+        self.sub_track = sub_track
+        self.file = open(out_path, 'w', newline='', encoding='utf-8')
+        self.writer = csv.writer(self.file, delimiter='\t', lineterminator='\n')
+        self.writer.writerow(self.HEADERS[sub_track])
+
+    def write(self, doc, predictions):
+        '''
+        INPUT: doc: str with the document identifier (tweet_id).
+               predictions: see prediction_rows.
+        '''
+        self.writer.writerows(prediction_rows(doc, predictions, self.sub_track))
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# Number of rows of a row group of the npz output
+ROW_GROUP_SIZE = 1 << 16
+
+
+def string_arrays(strings):
+    '''
+    OUTPUT: data: uint8 NumPy array with the UTF-8 bytes of all strings.
+            offsets: int64 NumPy array with the start of every string in
+              data, and the end of the last one.
+    '''
+    import numpy as np
+    encoded = [string.encode('utf-8') for string in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(string) for string in encoded], out=offsets[1:])
+    return np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets
+
+
+class StringColumn():
+    '''
+    DESCRIPTION: strings stored as UTF-8 bytes and offsets (see
+              string_arrays), decoded when they are accessed.
+    '''
+    def __init__(self, data, offsets):
+        self.data = data
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return bytes(self.data[self.offsets[i]:self.offsets[i + 1]]).decode('utf-8')
+
+    def to_list(self):
+        data = bytes(self.data)
+        offsets = self.offsets.tolist()
+        return [data[offsets[i]:offsets[i + 1]].decode('utf-8') for i in range(len(self))]
+
+
+class ColumnarWriter():
+    '''
+    DESCRIPTION: write the predictions of every document to an npz file of
+              typed columns (see the module docstring), with the same rows
+              and methods as PredictionWriter.
+
+    INPUT: out_path: str with the path to the output file.
+           sub_track: 1 or 2.
+           row_group_size: int. Number of rows buffered before they are
+              written as a row group.
+    '''
+    def __init__(self, out_path, sub_track, row_group_size=ROW_GROUP_SIZE):
+        if sub_track not in HEADERS:
+            raise ValueError('Incorrect sub-track value')
+        self.sub_track = sub_track
+        self.row_group_size = row_group_size
+        self.zip = zipfile.ZipFile(out_path, 'w', zipfile.ZIP_STORED, allowZip64=True)
+        self.columns = dict((column, []) for column in HEADERS[sub_track])
+        self.types = {}
+        self.n_rows = 0
+        self.n_row_groups = 0
+
+    def save(self, name, array):
+        import numpy as np
+        with self.zip.open(name + '.npy', 'w', force_zip64=True) as f:
+            np.lib.format.write_array(f, np.ascontiguousarray(array), allow_pickle=False)
+
+    def write(self, doc, predictions):
+        '''
+        INPUT: doc: str with the document identifier (tweet_id).
+               predictions: see prediction_rows.
+        '''
+        columns = self.columns
+        if self.sub_track == 1:
+            columns['tweet_id'].append(doc)
+            columns['label'].append(1 if predictions else 0)
+        elif not predictions:
+            for column, value in zip(HEADERS[2], (doc, -1, -1, -1, '')):
+                columns[column].append(value)
+        else:
+            for ref, off0, off1, label in predictions:
+                columns['tweet_id'].append(doc)
+                columns['begin'].append(off0)
+                columns['end'].append(off1)
+                columns['type'].append(self.types.setdefault(label, len(self.types)))
+                columns['extraction'].append(ref)
+        if len(columns['tweet_id']) >= self.row_group_size:
+            self.flush()
+
+    def flush(self):
+        '''
+        DESCRIPTION: write the buffered rows as a row group.
+        '''
+        import numpy as np
+        n = len(self.columns['tweet_id'])
+        if n == 0:
+            return
+        dtypes = {'begin': np.int32, 'end': np.int32, 'type': np.int16, 'label': np.int8}
+        suffix = '_{:06d}'.format(self.n_row_groups)
+        for column, values in self.columns.items():
+            if column in dtypes:
+                self.save(column + suffix, np.array(values, dtype=dtypes[column]))
+            else:
+                data, offsets = string_arrays(values)
+                self.save(column + '_data' + suffix, data)
+                self.save(column + '_offsets' + suffix, offsets)
+            values.clear()
+        self.n_rows = self.n_rows + n
+        self.n_row_groups = self.n_row_groups + 1
+
+    def close(self):
+        import numpy as np
+        self.flush()
+        if self.sub_track == 2:
+            data, offsets = string_arrays(sorted(self.types, key=self.types.get))
+            self.save('type_dictionary_data', data)
+            self.save('type_dictionary_offsets', offsets)
+        self.save('meta', np.array(json.dumps({'sub_track': self.sub_track,
+                                                'columns': HEADERS[self.sub_track],
+                                                'rows': self.n_rows,
+                                                'row_groups': self.n_row_groups})))
+        self.zip.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ColumnarReader():
+    '''
+    DESCRIPTION: columns of an npz file written by ColumnarWriter. The file
+              is memory-mapped: arrays are views of the mapped file, and only
+              the pages that are accessed are read.
+
+    INPUT: path: str with the path to the npz file.
+    '''
+    def __init__(self, path):
+        import numpy as np
+        self.np = np
+        self.file = open(path, 'rb')
+        self.zip = zipfile.ZipFile(self.file)
+        self.buffer = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        meta = json.loads(self.array('meta').item())
+        self.sub_track = meta['sub_track']
+        self.columns = meta['columns']
+        self.n_rows = meta['rows']
+        self.n_row_groups = meta['row_groups']
+        self.types = []
+        if self.sub_track == 2:
+            self.types = StringColumn(self.array('type_dictionary_data'),
+                                      self.array('type_dictionary_offsets')).to_list()
+
+    def array(self, name):
+        '''
+        OUTPUT: NumPy array of a member of the archive, without copying it.
+        '''
+        np = self.np
+        info = self.zip.getinfo(name + '.npy')
+        if info.compress_type != zipfile.ZIP_STORED:
+            raise ValueError('Compressed member: {}'.format(name))
+        # Local file header: fixed 30 bytes, then file name and extra field
+        name_length, extra_length = struct.unpack(
+            '<HH', self.buffer[info.header_offset + 26:info.header_offset + 30])
+        self.file.seek(info.header_offset + 30 + name_length + extra_length)
+        version = np.lib.format.read_magic(self.file)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(self.file)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(self.file)
+        count = 1
+        for n in shape:
+            count = count * n
+        return np.frombuffer(self.buffer, dtype=dtype, count=count,
+                             offset=self.file.tell()).reshape(shape)
+
+    def row_group(self, i):
+        '''
+        OUTPUT: python dict {column: NumPy array, or StringColumn for the
+                  tweet_id and extraction columns} of the row group i.
+        '''
+        suffix = '_{:06d}'.format(i)
+        group = {}
+        for column in self.columns:
+            if column in ['tweet_id', 'extraction']:
+                group[column] = StringColumn(self.array(column + '_data' + suffix),
+                                             self.array(column + '_offsets' + suffix))
+            else:
+                group[column] = self.array(column + suffix)
+        return group
+
+    def column(self, name):
+        '''
+        OUTPUT: a whole column: NumPy array, or list of str for the tweet_id
+                  and extraction columns.
+        '''
+        groups = [self.row_group(i)[name] for i in range(self.n_row_groups)]
+        if name in ['tweet_id', 'extraction']:
+            return [value for group in groups for value in group.to_list()]
+        if len(groups) == 1:
+            return groups[0]
+        return self.np.concatenate(groups) if groups else self.np.zeros(0, dtype=self.np.int32)
+
+    def rows(self):
+        '''
+        DESCRIPTION: rows of the file, as the rows of the TSV output (see
+                  prediction_rows).
+
+        OUTPUT: generator of lists.
+        '''
+        for i in range(self.n_row_groups):
+            group = self.row_group(i)
+            columns = [group[column].to_list() if isinstance(group[column], StringColumn)
+                       else group[column].tolist() for column in self.columns]
+            for row in zip(*columns):
+                row = list(row)
+                if (self.sub_track == 2) and (row[3] < 0):
+                    row = [row[0], '-', '-', '-', '-']
+                elif self.sub_track == 2:
+                    row[3] = self.types[row[3]]
+                yield row
+
+    def close(self):
+        '''
+        DESCRIPTION: unmap and close the file. Arrays that are still
+                  referenced keep the mapping alive until they are released.
+        '''
+        try:
+            self.buffer.close()
+        except BufferError:
+            pass
+        self.zip.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_writer(out_path, sub_track, out_format='tsv'):
+    '''
+    DESCRIPTION: writer of the output file (PredictionWriter for 'tsv',
+              ColumnarWriter for 'npz').
+    '''
+    if out_format == 'npz':
+        return ColumnarWriter(out_path, sub_track)
+    if out_format != 'tsv':
+        raise ValueError('Incorrect output format: {}'.format(out_format))
+    return PredictionWriter(out_path, sub_track)
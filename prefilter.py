@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Cheap first pass that rejects the documents sharing no token with the
+gazetteer, before they are tokenized and their offsets indexed.
+
+Both engines only predict an annotation if a normalized word of the text
+(see utils.index_words) is one of its words (annotations_final). Words and
+gazetteer tokens are compared here through a coarser key, their fold: every
+character is lowercased, its accents removed and lowercased again, and
+punctuation signs are dropped. The fold of a word of the text is the fold
+of its normalized form, so a text whose folded words are all missing from
+the set of folded gazetteer tokens cannot have any prediction.
+
+The words of the text are found with str.lower and str.split, and their
+folds are cached, instead of the regular expressions and per-token
+normalization of format_text_info. The first word found in the set ends the
+check.
+"""
+import string
+import functools
+from utils import remove_accents, NORMALIZATION_CACHE_SIZE
+
+
+class FoldTable(dict):
+    '''
+    DESCRIPTION: translation table (for str.translate) from every character
+              to its fold. Whitespaces are kept. Entries are computed the
+              first time a character is found.
+    '''
+    def __missing__(self, code):
+        char = chr(code)
+        if char.isspace():
+            value = char
+        else:
+            # remove_accents keeps printable ASCII characters (uppercase ones
+            # and whitespaces among them)
+            value = ''.join(x for x in remove_accents(char.lower()).lower()
+                            if (x not in string.punctuation) & (not x.isspace()))
+        self[code] = value
+        return value
+
+FOLD_TABLE = FoldTable()
+
+
+def fold(txt):
+    return txt.translate(FOLD_TABLE)
+
+# Words repeat across documents
+fold_word = functools.lru_cache(maxsize=NORMALIZATION_CACHE_SIZE)(fold)
+
+
+def prefilter_keys(tokens):
+    '''
+    DESCRIPTION: hash set of the folded gazetteer tokens.
+
+    INPUT: tokens: iterable of normalized gazetteer tokens (annotations_final).
+
+    OUTPUT: keys: frozenset of str, or None if a token has an empty fold
+              (e.g. it has no latin characters): its occurrences could not
+              be told apart, so no document is rejected.
+    '''
+    # Normalized tokens may have whitespaces from remove_accents (e.g. of
+    # an acute accent sign), dropped by the fold of a word of the text
+    keys = frozenset(''.join(fold(token).split()) for token in tokens)
+    if '' in keys:
+        return None
+    return keys
+
+
+def may_match(txt, keys):
+    '''
+    DESCRIPTION: whether a text can have predictions.
+
+    INPUT: txt: str with the text.
+           keys: output of prefilter_keys.
+
+    OUTPUT: bool. False only if no folded word of the text is a key.
+    '''
+    if keys is None:
+        return True
+    # Lowercasing first does not change the folds, and most words are then
+    # found in the cache
+    return not keys.isdisjoint(map(fold_word, txt.lower().split()))
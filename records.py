@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Compact records of the gazetteer annotations and of the predictions.
+
+Labels are interned: annotations and predictions store the small integer id
+of their label in the label table of the gazetteer (the sorted tuple of its
+label names). Label strings are only looked up when predictions are written.
+
+Annotations are slotted objects, shared by all the tokens of the inverted
+index. The predictions of a document are stored in one array of offsets and
+label ids, and their references (the text of every prediction) are
+concatenated in a single string: the reference of a prediction is as long as
+its span, so it is sliced back from the offsets.
+"""
+from array import array
+
+
+def label_table(annot2label):
+    '''
+    DESCRIPTION: label table of a gazetteer.
+
+    INPUT: annot2label: python dict with every unmodified annotation and
+              its label.
+
+    OUTPUT: labels: sorted tuple of label names. The id of a label is its
+              position in the tuple.
+    '''
+    return tuple(sorted(set(annot2label.values())))
+
+
+class Annotation():
+    '''
+    DESCRIPTION: gazetteer annotation.
+              text: unmodified annotation.
+              label: label id (see label_table).
+              n_chars, n_words: number of characters and words of text.
+              processed: normalized annotation (see utils.normalize_str).
+              anchors: list of its normalized words that are not stopwords
+              or single-character words (see utils.format_ann_info).
+    '''
+    __slots__ = ('text', 'label', 'n_chars', 'n_words', 'processed', 'anchors')
+
+    def __init__(self, text, label, n_chars, n_words, processed, anchors):
+        self.text = text
+        self.label = label
+        self.n_chars = n_chars
+        self.n_words = n_words
+        self.processed = processed
+        self.anchors = anchors
+
+    def __reduce__(self):
+        return Annotation, (self.text, self.label, self.n_chars, self.n_words,
+                            self.processed, self.anchors)
+
+    def __repr__(self):
+        return 'Annotation({!r}, {})'.format(self.text, self.label)
+
+
+class Predictions():
+    '''
+    DESCRIPTION: predictions of one document, sorted by (ref, off0, off1).
+              Iterating over it yields [ref, off0, off1, label] lists, with
+              the label name.
+              refs: str with the concatenated references.
+              spans: array with the (off0, off1, label id) of every
+              prediction, one after the other.
+              names: label table (see label_table).
+    '''
+    __slots__ = ('refs', 'spans', 'names')
+
+    def __init__(self, refs, spans, names):
+        self.refs = refs
+        self.spans = spans
+        self.names = names
+
+    @classmethod
+    def from_rows(cls, rows, names=None):
+        '''
+        DESCRIPTION: build the record from a sorted list of [ref, off0, off1,
+                  label] (e.g. read from a manifest).
+
+        INPUT: rows: list of [ref, off0, off1, label name].
+               names: label table, or None to build it from rows.
+        '''
+        if names is None:
+            names = tuple(sorted(set(row[3] for row in rows)))
+        label2id = {name: i for i, name in enumerate(names)}
+        spans = array('q')
+        for ref, off0, off1, label in rows:
+            spans.extend((off0, off1, label2id[label]))
+        return cls(''.join(row[0] for row in rows), spans, names)
+
+    def __len__(self):
+        return len(self.spans) // 3
+
+    def __iter__(self):
+        spans = self.spans
+        i = 0
+        for j in range(0, len(spans), 3):
+            off0, off1 = spans[j], spans[j + 1]
+            yield [self.refs[i:i + off1 - off0], off0, off1, self.names[spans[j + 2]]]
+            i = i + off1 - off0
+
+    def __eq__(self, other):
+        if isinstance(other, Predictions):
+            other = other.to_list()
+        return self.to_list() == other
+
+    def __reduce__(self):
+        return Predictions, (self.refs, self.spans, self.names)
+
+    def __repr__(self):
+        return 'Predictions({!r})'.format(self.to_list())
+
+    def to_list(self):
+        '''
+        OUTPUT: predictions: sorted list of [ref, off0, off1, label].
+        '''
+        return list(self)
@@ -0,0 +1,356 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Long-running matching service, for online tagging.
+
+The gazetteer is loaded once, when the server starts, and sent once to a
+pool of worker processes. Batches of documents are matched there, so the
+event loop keeps accepting and answering requests meanwhile.
+
+Minimal HTTP/1.1 (with keep-alive) over TCP or a Unix socket, standard
+library only:
++ POST /match: JSON body {"sub_track": 1 or 2, "documents": [{"tweet_id"
+  (or "id"): ..., "text": ...}]}. Response: {"sub_track": ..., "columns":
+  [...], "rows": [...]}, with the same rows as the output TSV of lookup.py.
++ POST /gazetteer: JSON body {"add": [[annotation, label], ...], "remove":
+  [annotation, ...]}. Response: {"version": ..., "annotations": ...}.
++ GET /health: {"status": "ok", "pending": documents being matched,
+  "version": gazetteer version}.
+
+The gazetteer can be updated without stopping the server: POST /gazetteer
+applies a delta (see gazetteer.update_gazetteer) and SIGHUP compiles it
+again from the GS files. The new gazetteer is sent to a new pool of worker
+processes, which receives the following batches, while the batches already
+sent to the previous pool finish there with the previous gazetteer.
+
+Backpressure: a request with more than --max_batch documents or a body
+larger than --max_body bytes is answered with 413, and a request arriving
+when --max_pending documents are already being matched is answered with 503
+(and Retry-After), instead of being queued without limit.
+
+Usage:
+$> python server.py -gs gold_standard.tsv -gz gazetteer.pkl -w 4 --port 8000
+$> curl -d '{"sub_track": 2, "documents": [{"tweet_id": "1", "text": "..."}]}' localhost:8000/match
+$> curl -d '{"add": [["camarera de piso", "PROFESION"]], "remove": ["paro"]}' localhost:8000/gazetteer
+$> kill -HUP <server pid>
+"""
+import sys
+import json
+import functools
+import signal
+import asyncio
+import argparse
+import concurrent.futures
+from http import HTTPStatus
+from matcher import Matcher, init_worker, match_documents
+from gazetteer import MIN_UPPER, LABELS
+from output import HEADERS, prediction_rows
+from corpus import get_id
+
+
+class BadRequest(Exception):
+    '''
+    DESCRIPTION: request that cannot be served, with its HTTP status.
+    '''
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def parse_batch(body, max_batch):
+    '''
+    DESCRIPTION: read the documents of a /match request.
+
+    INPUT: body: bytes with the JSON body.
+           max_batch: int. Maximum number of documents.
+
+    OUTPUT: sub_track: 1 or 2.
+            docs: list of (doc_id, text) tuples.
+    '''
+    try:
+        request = json.loads(body)
+        sub_track = int(request.get('sub_track', 2))
+        docs = [(get_id(record, 'request'), str(record['text']))
+                for record in request['documents']]
+    except (ValueError, KeyError, TypeError, AttributeError) as e:
+        raise BadRequest(HTTPStatus.BAD_REQUEST, 'Invalid request: {}'.format(e))
+    if sub_track not in HEADERS:
+        raise BadRequest(HTTPStatus.BAD_REQUEST, 'Incorrect sub-track value')
+    if len(docs) > max_batch:
+        raise BadRequest(HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                         'More than {} documents'.format(max_batch))
+    return sub_track, docs
+
+
+def parse_update(body, labels):
+    '''
+    DESCRIPTION: read the annotations of a /gazetteer request.
+
+    INPUT: body: bytes with the JSON body.
+           labels: list of accepted labels.
+
+    OUTPUT: add: list of (annotation, label) tuples.
+            remove: list of annotations.
+    '''
+    try:
+        request = json.loads(body)
+        add = [(str(annotation), str(label)) for annotation, label in request.get('add', [])]
+        remove = [str(annotation) for annotation in request.get('remove', [])]
+    except (ValueError, TypeError, AttributeError) as e:
+        raise BadRequest(HTTPStatus.BAD_REQUEST, 'Invalid request: {}'.format(e))
+    for annotation, label in add:
+        if label not in labels:
+            raise BadRequest(HTTPStatus.BAD_REQUEST, 'Incorrect label: {}'.format(label))
+        if annotation.strip() == '':
+            raise BadRequest(HTTPStatus.BAD_REQUEST, 'Empty annotation')
+    return add, remove
+
+
+class MatchServer():
+    '''
+    DESCRIPTION: HTTP server that matches batches of documents in a pool of
+              worker processes.
+
+    INPUT: matcher: Matcher, sent once to every worker.
+           workers: int. Number of worker processes.
+           chunksize: int. Number of documents sent to a worker at once. The
+              chunks of a batch are matched in parallel.
+           max_batch: int. Maximum number of documents of a request.
+           max_pending: int. Maximum number of documents being matched.
+           max_body: int. Maximum size of a request body (bytes).
+           reload: function that compiles the gazetteer again (on SIGHUP),
+              or None.
+           labels: list of labels accepted by /gazetteer.
+    '''
+    def __init__(self, matcher, workers=1, chunksize=64, max_batch=1000,
+                 max_pending=10000, max_body=1 << 24, reload=None, labels=LABELS):
+        self.matcher = matcher
+        self.workers = workers
+        self.chunksize = chunksize
+        self.max_batch = max_batch
+        self.max_pending = max_pending
+        self.max_body = max_body
+        self.pending = 0
+        self.reload = reload
+        self.labels = labels
+        # Gazetteer updates are applied one at a time
+        self.lock = asyncio.Lock()
+        self.pool = self.start_pool()
+
+    def start_pool(self):
+        return concurrent.futures.ProcessPoolExecutor(
+            self.workers, initializer=init_worker, initargs=(self.matcher,))
+
+    async def swap(self, build):
+        '''
+        DESCRIPTION: build a new gazetteer in a thread, so the event loop
+                  keeps serving, and swap in a worker pool that uses it.
+
+        INPUT: build: function that swaps the new gazetteer in self.matcher.
+
+        OUTPUT: version: int. Version of the new gazetteer.
+        '''
+        async with self.lock:
+            await asyncio.get_running_loop().run_in_executor(None, build)
+            old_pool, self.pool = self.pool, self.start_pool()
+        # Batches already sent to the old pool finish there
+        old_pool.shutdown(wait=False)
+        return self.matcher.gazetteer['version']
+
+    def reload_gazetteer(self):
+        '''
+        DESCRIPTION: compile the gazetteer again and swap it in.
+        '''
+        gazetteer = self.reload()
+        gazetteer['version'] = self.matcher.gazetteer['version'] + 1
+        self.matcher.swap(gazetteer)
+
+    async def on_reload(self):
+        try:
+            version = await self.swap(self.reload_gazetteer)
+            print('Gazetteer reloaded (version {})'.format(version), flush=True)
+        except Exception as e:
+            print('Gazetteer not reloaded: {!r}'.format(e), file=sys.stderr, flush=True)
+
+    async def match(self, sub_track, docs):
+        '''
+        DESCRIPTION: match a batch in the worker pool.
+
+        OUTPUT: response: python dict with the output rows.
+        '''
+        loop = asyncio.get_running_loop()
+        chunks = [docs[i:i + self.chunksize] for i in range(0, len(docs), self.chunksize)]
+        results = await asyncio.gather(*[loop.run_in_executor(self.pool, match_documents,
+                                                              chunk) for chunk in chunks])
+        rows = []
+        for result in results:
+            for doc_id, predictions in result:
+                rows.extend(prediction_rows(doc_id, predictions, sub_track))
+        return {'sub_track': sub_track, 'columns': HEADERS[sub_track], 'rows': rows}
+
+    async def route(self, method, path, body):
+        '''
+        OUTPUT: status: HTTPStatus.
+                response: python dict (JSON body).
+                headers: python dict with extra response headers.
+        '''
+        if (method == 'GET') & (path == '/health'):
+            return HTTPStatus.OK, {'status': 'ok', 'pending': self.pending,
+                                   'version': self.matcher.gazetteer['version']}, {}
+        if path not in ['/match', '/gazetteer']:
+            return HTTPStatus.NOT_FOUND, {'error': 'Not found'}, {}
+        if method != 'POST':
+            return HTTPStatus.METHOD_NOT_ALLOWED, {'error': 'Use POST'}, {'Allow': 'POST'}
+
+        if path == '/gazetteer':
+            add, remove = parse_update(body, self.labels)
+            version = await self.swap(functools.partial(self.matcher.update, add, remove))
+            return HTTPStatus.OK, {'version': version, 'annotations':
+                                   len(self.matcher.gazetteer['annot2label'])}, {}
+
+        sub_track, docs = parse_batch(body, self.max_batch)
+        if self.pending + len(docs) > self.max_pending:
+            return (HTTPStatus.SERVICE_UNAVAILABLE, {'error': 'Server busy'},
+                    {'Retry-After': '1'})
+        self.pending = self.pending + len(docs)
+        try:
+            response = await self.match(sub_track, docs)
+        finally:
+            self.pending = self.pending - len(docs)
+        return HTTPStatus.OK, response, {}
+
+    async def handle(self, reader, writer):
+        '''
+        DESCRIPTION: serve the requests of one connection.
+        '''
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b'\r\n\r\n')
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError,
+                        ConnectionError):
+                    break
+                request_line, *header_lines = head.decode('latin-1').rstrip('\r\n').split('\r\n')
+                headers = dict((k.strip().lower(), v.strip()) for k, v in
+                               (line.split(':', 1) for line in header_lines if ':' in line))
+                keep_alive = ((headers.get('connection', '').lower() != 'close') &
+                              request_line.endswith('HTTP/1.1'))
+                extra = {}
+                try:
+                    try:
+                        method, target, _ = request_line.split(' ', 2)
+                        length = int(headers.get('content-length', 0))
+                    except ValueError:
+                        raise BadRequest(HTTPStatus.BAD_REQUEST, 'Malformed request')
+                    if length > self.max_body:
+                        # The body is not read: the connection cannot be reused
+                        keep_alive = False
+                        raise BadRequest(HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                                         'Body larger than {} bytes'.format(self.max_body))
+                    body = await reader.readexactly(length)
+                    status, response, extra = await self.route(method, target.split('?')[0],
+                                                               body)
+                except BadRequest as e:
+                    status, response = e.status, {'error': str(e)}
+                except asyncio.IncompleteReadError:
+                    break
+                except Exception as e:
+                    status, response = HTTPStatus.INTERNAL_SERVER_ERROR, {'error': repr(e)}
+
+                payload = json.dumps(response, ensure_ascii=False).encode('utf-8')
+                lines = ['HTTP/1.1 {} {}'.format(status.value, status.phrase),
+                         'Content-Type: application/json; charset=utf-8',
+                         'Content-Length: {}'.format(len(payload)),
+                         'Connection: {}'.format('keep-alive' if keep_alive else 'close')]
+                lines.extend('{}: {}'.format(k, v) for k, v in extra.items())
+                writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + payload)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host='127.0.0.1', port=8000, socket_path=''):
+        '''
+        DESCRIPTION: serve until SIGINT or SIGTERM. SIGHUP reloads the
+                  gazetteer (if there is a reload function).
+        '''
+        if socket_path != '':
+            server = await asyncio.start_unix_server(self.handle, socket_path)
+            address = socket_path
+        else:
+            server = await asyncio.start_server(self.handle, host, port)
+            address = '{}:{}'.format(*server.sockets[0].getsockname()[:2])
+
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+        if self.reload is not None:
+            loop.add_signal_handler(signal.SIGHUP,
+                                    lambda: asyncio.ensure_future(self.on_reload()))
+        print('Listening on {}'.format(address), flush=True)
+        async with server:
+            await stop.wait()
+        self.pool.shutdown()
+
+
+def parse_arguments():
+
+    # DESCRIPTION: Parse command line arguments
+
+    parser = argparse.ArgumentParser(description='matching server')
+    parser.add_argument("-gs", "--gs_path", required = True, dest = "gs_path",
+                        help = "path to GS file")
+    parser.add_argument("-gs2", "--gs_path2", required = False, dest = "gs_path2",
+                        default = "", help = "path to a second GS file")
+    parser.add_argument("-gz", "--gazetteer", required = False, dest = "gazetteer_path",
+                        default = "", help = "path to the compiled gazetteer. "
+                        "It is compiled again if the GS files have changed")
+    parser.add_argument("-e", "--engine", required = False, dest = "engine",
+                        default = "legacy", choices = ["legacy", "trie"],
+                        help = "matching engine")
+    parser.add_argument("-c", "--chunk_size", required = False, dest = "chunk_size",
+                        default = 0, type = int, help = "match documents longer than "
+                        "this number of characters in overlapping chunks (0: never)")
+    parser.add_argument("-w", "--workers", required = False, dest = "workers",
+                        default = 1, type = int, help = "number of worker processes")
+    parser.add_argument("--chunksize", required = False, dest = "chunksize",
+                        default = 64, type = int,
+                        help = "number of documents sent to a worker at once")
+    parser.add_argument("--host", required = False, dest = "host",
+                        default = "127.0.0.1", help = "address to listen on")
+    parser.add_argument("--port", required = False, dest = "port",
+                        default = 8000, type = int, help = "port to listen on (0: any)")
+    parser.add_argument("--socket", required = False, dest = "socket_path",
+                        default = "", help = "path to a Unix socket to listen on, "
+                        "instead of host and port")
+    parser.add_argument("--max_batch", required = False, dest = "max_batch",
+                        default = 1000, type = int,
+                        help = "maximum number of documents of a request")
+    parser.add_argument("--max_pending", required = False, dest = "max_pending",
+                        default = 10000, type = int, help = "maximum number of "
+                        "documents being matched. Further requests get 503")
+    parser.add_argument("--max_body", required = False, dest = "max_body",
+                        default = 1 << 24, type = int,
+                        help = "maximum size of a request body (bytes)")
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_arguments()
+    gs_paths = [args.gs_path] + ([args.gs_path2] if args.gs_path2 != "" else [])
+
+    print('\n\nExtracting original annotations...\n\n', file=sys.stderr)
+    def reload():
+        return Matcher.from_tsv(gs_paths, MIN_UPPER, LABELS, args.engine, 2,
+                                args.gazetteer_path, args.chunk_size).gazetteer
+
+    matcher = Matcher(reload(), args.engine, args.chunk_size)
+
+    server = MatchServer(matcher, args.workers, args.chunksize, args.max_batch,
+                         args.max_pending, args.max_body, reload, LABELS)
+    asyncio.run(server.serve(args.host, args.port, args.socket_path))
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Set of predictions of one document, where no prediction is contained in
+another one.
+
+A new prediction is discarded if it is contained in a stored one, and it
+evicts the stored predictions it contains. Therefore, stored spans never
+nest: sorted by start offset, they are also sorted by end offset. Then, both
+the containment query and the evicted predictions are found with a binary
+search, instead of a scan over all stored spans.
+
+Of several predictions of the same span, the one with the first label is
+kept, whatever the order they are added in (e.g. by the legacy and the trie
+engines, or by texts with a different order of candidate tokens).
+"""
+from array import array
+from bisect import bisect_left, bisect_right
+from records import Predictions
+
+
+class SpanSet():
+    '''
+    DESCRIPTION: predictions of one document.
+              starts, ends, labels: arrays with the stored spans (offsets
+              and label ids), sorted by offsets.
+              rejected, evicted: number of predictions discarded because they
+              were contained in a stored one, or removed because a new one
+              contained them.
+
+    INPUT: txt: str with the text of the document.
+           names: label table of the gazetteer (see records.label_table).
+    '''
+    def __init__(self, txt, names):
+        self.txt = txt
+        self.names = names
+        self.starts = array('q')
+        self.ends = array('q')
+        self.labels = array('H')
+        self.rejected = 0
+        self.evicted = 0
+
+    def __len__(self):
+        return len(self.starts)
+
+    def contains(self, off0, off1):
+        '''
+        DESCRIPTION: check whether [off0, off1) is contained in a stored span.
+                  Among the spans starting at or before off0, the last one
+                  has the largest end.
+        '''
+        i = bisect_right(self.starts, off0) - 1
+        return (i >= 0) and (off1 <= self.ends[i])
+
+    def add(self, off0, off1, label):
+        '''
+        DESCRIPTION: store a new prediction, unless it is contained in a
+                  stored one. Stored predictions contained in the new one are
+                  removed.
+
+        INPUT: off0, off1: offsets of the prediction.
+               label: label id.
+
+        OUTPUT: bool. Whether the prediction was stored.
+        '''
+        if self.contains(off0, off1):
+            self.rejected = self.rejected + 1
+            # Same span: keep the first label
+            i = bisect_right(self.starts, off0) - 1
+            if (self.starts[i] == off0) & (self.ends[i] == off1):
+                self.labels[i] = min(self.labels[i], label)
+            return False
+
+        # Spans contained in the new one: starting at or after off0 and
+        # ending at or before off1. They are contiguous.
+        lo = bisect_left(self.starts, off0)
+        hi = bisect_right(self.ends, off1, lo)
+        self.evicted = self.evicted + (hi - lo)
+        self.starts[lo:hi] = array('q', [off0])
+        self.ends[lo:hi] = array('q', [off1])
+        self.labels[lo:hi] = array('H', [label])
+        return True
+
+    def predictions(self):
+        '''
+        OUTPUT: predictions: records.Predictions, sorted by (ref, off0, off1).
+                  Stored spans never repeat, so no de-duplication is needed.
+        '''
+        txt, starts, ends = self.txt, self.starts, self.ends
+        # Spans with the same reference and start also have the same end
+        order = sorted(range(len(starts)), key=lambda i: (txt[starts[i]:ends[i]], starts[i]))
+        spans = array('q')
+        for i in order:
+            spans.extend((starts[i], ends[i], self.labels[i]))
+        return Predictions(''.join(txt[starts[i]:ends[i]] for i in order), spans,
+                           self.names)
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Match huge corpora with several workers within a memory budget.
+
+With several workers, Matcher.match_batch yields the predictions in reading
+order with pool.imap: the pool reads documents ahead without limit, and the
+results of the documents matched before a slow one are kept until it is
+done. Both grow with the size of the corpus.
+
+iter_bounded reads a bounded number of documents ahead of the ones being
+matched, and collects the results in any order (pool.imap_unordered) in a
+SpillBuffer, numbered in reading order. Results are yielded as soon as all
+the previous ones were. When the resident memory of the process goes over
+the budget, the results that cannot be yielded yet are written, sorted, to
+a temporary run file, and read back one by one when their turn comes: the
+output is the same as with pool.imap.
+"""
+import os
+import sys
+import heapq
+import pickle
+import shutil
+import tempfile
+import threading
+import multiprocessing
+from matcher import init_worker, match_document, match_document_stats
+
+# Results added between two checks of the resident memory
+CHECK_EVERY = 64
+
+# Maximum number of run files. Over it, the smallest half are merged.
+MAX_RUNS = 64
+
+
+def resident_memory():
+    '''
+    OUTPUT: resident set size of the process in bytes (peak resident set
+              size on systems without /proc, 0 if it is not available).
+    '''
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return 0
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+class RunFile():
+    '''
+    DESCRIPTION: results spilled to disk, sorted by number, read back one
+              by one.
+              head: number of the next result, or None at the end.
+              size: number of results written.
+
+    INPUT: path: str with the path to the run file.
+           records: sorted iterable of (number, result) tuples.
+    '''
+    def __init__(self, path, records):
+        self.path = path
+        self.size = 0
+        with open(path, 'wb') as f:
+            for record in records:
+                pickle.dump(record, f, protocol=pickle.HIGHEST_PROTOCOL)
+                self.size = self.size + 1
+        self.file = open(path, 'rb')
+        self.head, self.result = None, None
+        self.advance()
+
+    def advance(self):
+        try:
+            self.head, self.result = pickle.load(self.file)
+        except EOFError:
+            self.head, self.result = None, None
+
+    def pop(self):
+        result = self.result
+        self.advance()
+        return result
+
+    def __iter__(self):
+        # Remaining records
+        while self.head is not None:
+            head = self.head
+            yield head, self.pop()
+
+    def close(self):
+        self.file.close()
+        os.remove(self.path)
+
+
+class SpillBuffer():
+    '''
+    DESCRIPTION: results numbered in reading order, added in any order and
+              taken in reading order. Results that cannot be taken yet are
+              kept in memory until the resident memory of the process goes
+              over max_memory, and spilled to sorted run files then.
+
+    INPUT: max_memory: int. Memory budget in bytes.
+           directory: str with the directory of the run files (default: the
+              temporary directory of the system).
+    '''
+    def __init__(self, max_memory, directory=None):
+        self.max_memory = max_memory
+        self.directory = tempfile.mkdtemp(prefix='lookup-spill-', dir=directory)
+        self.results = {}
+        # Heap of (head, id, RunFile)
+        self.runs = []
+        self.next = 0
+        self.n_added = 0
+        self.n_runs = 0
+        self.n_spilled = 0
+
+    def add(self, number, result):
+        self.results[number] = result
+        self.n_added = self.n_added + 1
+        # Results are taken as soon as they can, so those left wait for a
+        # slower document. They are spilled in runs of CHECK_EVERY or more.
+        if ((self.n_added % CHECK_EVERY == 0) & (len(self.results) >= CHECK_EVERY) and
+            (resident_memory() > self.max_memory)):
+            self.spill()
+
+    def spill(self):
+        '''
+        DESCRIPTION: write the results in memory to a new run file.
+        '''
+        records = sorted(self.results.items(), key=lambda record: record[0])
+        self.results = {}
+        self.push(self.new_run(records))
+        self.n_spilled = self.n_spilled + len(records)
+        if len(self.runs) > MAX_RUNS:
+            # Merge the smallest runs, so that few files are open and every
+            # result is merged a few times only
+            runs = heapq.nsmallest(MAX_RUNS // 2, [run for _, _, run in self.runs],
+                                   key=lambda run: run.size)
+            merged = set(map(id, runs))
+            self.runs = [entry for entry in self.runs if entry[1] not in merged]
+            heapq.heapify(self.runs)
+            self.push(self.new_run(heapq.merge(*runs, key=lambda record: record[0])))
+            for run in runs:
+                run.close()
+
+    def new_run(self, records):
+        path = os.path.join(self.directory, 'run_{:06d}.pkl'.format(self.n_runs))
+        self.n_runs = self.n_runs + 1
+        return RunFile(path, records)
+
+    def push(self, run):
+        if run.head is None:
+            run.close()
+        else:
+            heapq.heappush(self.runs, (run.head, id(run), run))
+
+    def ready(self):
+        '''
+        OUTPUT: generator of the results whose previous results were all
+                  taken, in reading order.
+        '''
+        while True:
+            if self.next in self.results:
+                result = self.results.pop(self.next)
+            elif self.runs and (self.runs[0][0] == self.next):
+                _, _, run = heapq.heappop(self.runs)
+                result = run.pop()
+                self.push(run)
+            else:
+                return
+            self.next = self.next + 1
+            yield result
+
+    def close(self):
+        for _, _, run in self.runs:
+            run.close()
+        self.runs = []
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def match_numbered(item):
+    number, doc = item
+    return number, match_document(doc)
+
+def match_numbered_stats(item):
+    number, doc = item
+    return number, match_document_stats(doc)
+
+
+def iter_bounded(docs, matcher, workers, chunksize=64, max_memory=0,
+                 with_stats=False, directory=None):
+    '''
+    DESCRIPTION: find the annotations present in a batch of texts with
+              several worker processes, within a memory budget (see the
+              module docstring). At most 2 * workers * chunksize texts are
+              read ahead of the results.
+
+    INPUT: docs, workers, chunksize, with_stats: see Matcher.match_batch.
+           matcher: Matcher.
+           max_memory: int. Memory budget of the process in bytes.
+           directory: str with the directory of the run files (default: the
+              temporary directory of the system).
+
+    OUTPUT: generator of (id, predictions) tuples, or (id, predictions,
+              stats) tuples if with_stats, in the same order as docs.
+    '''
+    # Texts read and not matched yet. Pool.imap_unordered reads docs from a
+    # thread of the pool, which waits here until results are taken.
+    slots = threading.Semaphore(2 * workers * max(chunksize, 1))
+    stopped = threading.Event()
+
+    def numbered():
+        for number, doc in enumerate(docs):
+            slots.acquire()
+            if stopped.is_set():
+                return
+            yield number, doc
+
+    buffer = SpillBuffer(max_memory, directory)
+    try:
+        with multiprocessing.Pool(workers, initializer=init_worker,
+                                  initargs=(matcher,)) as pool:
+            try:
+                for number, result in pool.imap_unordered(
+                        match_numbered_stats if with_stats else match_numbered,
+                        numbered(), chunksize):
+                    slots.release()
+                    buffer.add(number, result)
+                    yield from buffer.ready()
+            finally:
+                # Let the thread of the pool stop reading, if it waits
+                stopped.set()
+                slots.release()
+    finally:
+        buffer.close()
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Sweep of gazetteer configurations on one corpus, for model selection.
+
+Every combination of the given min_upper values, stopword lists, label sets
+and engines is a configuration. The GS files are parsed once and the corpus
+is read and tokenized once (utils.TokenizedText, with the token arrays of
+the legacy engine). Then the configurations are run in parallel in worker
+processes: each one builds its gazetteer and matches every document with
+the shared tokens.
+
+For every configuration, out_dir/<name>.tsv has its predictions (as the
+output of lookup.py) and out_dir/<name>.json its configuration, timings and,
+with -eval, scores (see evaluate.py). out_dir/summary.json has them all,
+together with the time spent reading and tokenizing the corpus.
+
+Usage:
+$> python sweep.py -gs gold_standard.tsv -data datapath/ -out_dir sweep/ -t 2 -w 4 --min_upper 2 3 4 --stopwords default none --labels PROFESION,SITUACION_LABORAL PROFESION -eval dev_gold_standard.tsv
+"""
+import os
+import json
+import argparse
+import itertools
+import multiprocessing
+from utils import TokenizedText
+from ngrams import get_token_array
+from stopwords import STOP_WORDS
+from matcher import Matcher
+from gazetteer import compile_annotations, MIN_UPPER, LABELS
+from corpus import iter_documents
+from output import PredictionWriter
+from evaluate import read_gold, Scorer
+from metrics import clock
+
+
+def load_stopwords(name):
+    '''
+    DESCRIPTION: stopword list of a configuration.
+
+    INPUT: name: 'default' (stopwords.STOP_WORDS), 'none' or path to a file
+              with one stopword per line.
+
+    OUTPUT: stopwords: frozenset of str.
+    '''
+    if name == 'default':
+        return STOP_WORDS
+    if name == 'none':
+        return frozenset()
+    with open(name, encoding='utf-8') as f:
+        return frozenset(line.strip() for line in f if line.strip())
+
+
+def stopword_names(stopwords):
+    '''
+    DESCRIPTION: short name of every stopword list, for configuration names:
+              the file name without extension, numbered when several lists
+              have the same one (e.g. a/stop.txt and b/stop.txt are stop
+              and stop-2).
+
+    OUTPUT: names: python dict {stopword list name: short name}.
+    '''
+    names = {}
+    for words in stopwords:
+        if words in names:
+            continue
+        name = os.path.splitext(os.path.basename(words))[0]
+        short, n = name, 1
+        while short in names.values():
+            n = n + 1
+            short = '{}-{}'.format(name, n)
+        names[words] = short
+    return names
+
+
+def make_configs(min_uppers, stopwords, label_sets, engines):
+    '''
+    DESCRIPTION: every combination of the swept parameters. Repeated
+              combinations are kept once.
+
+    INPUT: min_uppers: list of int.
+           stopwords: list of stopword list names (see load_stopwords).
+           label_sets: list of lists of annotation types kept.
+           engines: list of engines.
+
+    OUTPUT: configs: list of python dicts with name (unique), min_upper,
+              stopwords, labels and engine.
+    '''
+    short = stopword_names(stopwords)
+    configs = {}
+    for min_upper, words, labels, engine in itertools.product(min_uppers, stopwords,
+                                                              label_sets, engines):
+        name = 'mu{}_sw-{}_{}_{}'.format(min_upper, short[words], '+'.join(labels), engine)
+        configs.setdefault(name, {'name': name, 'min_upper': min_upper,
+                                  'stopwords': words, 'labels': labels,
+                                  'engine': engine})
+    return list(configs.values())
+
+
+def load_corpus(data_path, token_arrays=True):
+    '''
+    DESCRIPTION: read and tokenize the documents once.
+
+    INPUT: data_path: see corpus.iter_documents.
+           token_arrays: bool. Whether to build the token arrays of the
+              legacy engine too.
+
+    OUTPUT: docs: list of (doc_id, utils.TokenizedText) tuples.
+    '''
+    docs = [(doc_id, TokenizedText(txt)) for doc_id, txt in iter_documents(data_path)]
+    if token_arrays:
+        for _, txt in docs:
+            get_token_array(txt)
+    return docs
+
+
+# State shared by the configurations (GS rows, tokenized corpus, gold
+# standard and output options). Set once per worker by init_sweep (with the
+# fork start method, it is inherited from the parent process instead of
+# pickled).
+_sweep = None
+
+def init_sweep(state):
+    global _sweep
+    _sweep = state
+
+def run_config(config):
+    '''
+    DESCRIPTION: build the gazetteer of a configuration, match the corpus and
+              write its predictions and timings.
+
+    OUTPUT: result: python dict with the configuration, the number of
+              annotations, documents and predictions, the timings
+              (gazetteer, match, output), docs_per_sec and scores (None
+              without gold standard).
+    '''
+    times = {'gazetteer': 0.0, 'match': 0.0, 'output': 0.0}
+    start = clock()
+    df_annot = _sweep['df_annot']
+    df_annot = df_annot.loc[df_annot['type'].isin(config['labels'])].copy()
+    gazetteer = compile_annotations(df_annot, config['min_upper'],
+                                    with_trie=(config['engine'] == 'trie'),
+                                    stopwords=load_stopwords(config['stopwords']))
+    matcher = Matcher(gazetteer, config['engine'])
+    times['gazetteer'] = clock() - start
+
+    scorer = None
+    if _sweep['gold'] is not None:
+        scorer = Scorer(_sweep['gold'], _sweep['sub_track'])
+    n_predictions = 0
+    out_path = os.path.join(_sweep['out_dir'], config['name'] + '.tsv')
+    with PredictionWriter(out_path, _sweep['sub_track']) as writer:
+        for doc_id, txt in _sweep['docs']:
+            start = clock()
+            predictions = matcher.match(txt)
+            times['match'] = times['match'] + clock() - start
+            start = clock()
+            writer.write(doc_id, predictions)
+            times['output'] = times['output'] + clock() - start
+            n_predictions = n_predictions + len(predictions)
+            if scorer is not None:
+                scorer.add(doc_id, predictions)
+
+    n_docs = len(_sweep['docs'])
+    result = {'config': config,
+              'annotations': len(gazetteer['annot2label']),
+              'documents': n_docs,
+              'predictions': n_predictions,
+              'times': times,
+              'docs_per_sec': n_docs / times['match'] if times['match'] else None,
+              'scores': scorer.result() if scorer is not None else None}
+    with open(os.path.join(_sweep['out_dir'], config['name'] + '.json'), 'w',
+              encoding='utf-8') as f:
+        json.dump(result, f, indent=2, ensure_ascii=False)
+    return result
+
+
+def run_sweep(configs, state, workers=1):
+    '''
+    DESCRIPTION: run every configuration, in parallel if workers > 1.
+
+    OUTPUT: generator of the results of run_config, as they finish.
+    '''
+    if workers > 1:
+        with multiprocessing.Pool(min(workers, len(configs)), initializer=init_sweep,
+                                  initargs=(state,)) as pool:
+            yield from pool.imap_unordered(run_config, configs)
+    else:
+        init_sweep(state)
+        for config in configs:
+            yield run_config(config)
+
+
+def parse_arguments():
+
+    # DESCRIPTION: Parse command line arguments
+
+    parser = argparse.ArgumentParser(description='sweep of gazetteer configurations')
+    parser.add_argument("-gs", "--gs_path", required = True, dest = "gs_path",
+                        help = "path to GS file")
+    parser.add_argument("-gs2", "--gs_path2", required = False, dest = "gs_path2",
+                        default = "", help = "path to a second GS file")
+    parser.add_argument("-data", "--data_path", required = True, dest = "data_path",
+                        help = "path to text files directory, or to a JSONL or TSV "
+                        "corpus file of (tweet_id, text), optionally gzip-compressed")
+    parser.add_argument("-out_dir", "--out_dir", required = True, dest = "out_dir",
+                        help = "directory of the output predictions and summaries")
+    parser.add_argument("-t", "--sub_track", required = True, dest = "sub_track",
+                        type = int, choices = [1, 2], help = "sub_track number")
+    parser.add_argument("-w", "--workers", required = False, dest = "workers",
+                        default = 1, type = int, help = "number of worker processes "
+                        "(configurations run in parallel)")
+    parser.add_argument("-eval", "--eval_gs", required = False, dest = "eval_path",
+                        default = "", help = "path to a GS file to score every "
+                        "configuration against")
+    parser.add_argument("--min_upper", required = False, dest = "min_uppers",
+                        default = [MIN_UPPER], type = int, nargs = "+",
+                        help = "min_upper values")
+    parser.add_argument("--stopwords", required = False, dest = "stopwords",
+                        default = ["default"], nargs = "+", help = "stopword lists: "
+                        "default, none or path to a file with one stopword per line")
+    parser.add_argument("--labels", required = False, dest = "label_sets",
+                        default = [",".join(LABELS)], nargs = "+",
+                        help = "sets of annotation types kept, comma-separated")
+    parser.add_argument("-e", "--engine", required = False, dest = "engines",
+                        default = ["legacy"], nargs = "+", choices = ["legacy", "trie"],
+                        help = "matching engines")
+
+    args = parser.parse_args()
+    args.label_sets = [labels.split(',') for labels in args.label_sets]
+    return args
+
+
+if __name__ == '__main__':
+    import pandas as pd
+    from parse_inputs import parse_tsv
+
+    args = parse_arguments()
+    gs_paths = [args.gs_path] + ([args.gs_path2] if args.gs_path2 != "" else [])
+    configs = make_configs(args.min_uppers, args.stopwords, args.label_sets, args.engines)
+    os.makedirs(args.out_dir, exist_ok=True)
+
+    print('\n\nExtracting original annotations...\n\n')
+    df_annot = pd.concat([parse_tsv(path, args.sub_track) for path in gs_paths],
+                         ignore_index=True)
+    gold = read_gold([args.eval_path], args.sub_track) if args.eval_path != "" else None
+
+    print('\n\nTokenizing corpus...\n\n')
+    start = clock()
+    docs = load_corpus(args.data_path, token_arrays=('legacy' in args.engines))
+    t_corpus = clock() - start
+    print('{} documents tokenized in {:.3f}s'.format(len(docs), t_corpus))
+
+    print('\n\nRunning {} configurations...\n\n'.format(len(configs)))
+    state = {'df_annot': df_annot, 'docs': docs, 'gold': gold,
+             'out_dir': args.out_dir, 'sub_track': args.sub_track}
+    start = clock()
+    results = []
+    for result in run_sweep(configs, state, args.workers):
+        results.append(result)
+        times = result['times']
+        scores = result['scores']
+        print('{}: {} annotations, {} predictions, gazetteer {:.3f}s, match {:.3f}s{}'.format(
+            result['config']['name'], result['annotations'], result['predictions'],
+            times['gazetteer'], times['match'],
+            ', F1 {:.4f}'.format(scores['overall']['f1']) if scores is not None else ''))
+    # Same order as the configurations
+    order = [config['name'] for config in configs]
+    results.sort(key=lambda result: order.index(result['config']['name']))
+
+    with open(os.path.join(args.out_dir, 'summary.json'), 'w', encoding='utf-8') as f:
+        json.dump({'documents': len(docs), 'corpus_time': t_corpus,
+                   'sweep_time': clock() - start, 'workers': args.workers,
+                   'configurations': results}, f, indent=2, ensure_ascii=False)
+    print('Summary written to {}'.format(os.path.join(args.out_dir, 'summary.json')))
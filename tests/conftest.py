@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Shared fixtures: a small gazetteer built from a DataFrame of GS annotations.
+"""
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+ANNOTATIONS = [('médico', 'PROFESION'),
+               ('médico de familia', 'PROFESION'),
+               ('jefe de policía', 'PROFESION'),
+               ('policía', 'PROFESION'),
+               ('sin trabajo', 'SITUACION_LABORAL'),
+               ('en paro', 'SITUACION_LABORAL'),
+               ('ERTE', 'SITUACION_LABORAL')]
+
+
+def make_gazetteer(annotations=ANNOTATIONS, min_upper=3, with_trie=True):
+    '''
+    DESCRIPTION: compile a gazetteer from a list of (extraction, type).
+    '''
+    import pandas as pd
+    from gazetteer import compile_annotations
+    df = pd.DataFrame({'tweet_id': '1', 'begin': 0, 'end': 1,
+                       'type': [label for _, label in annotations],
+                       'extraction': [annot for annot, _ in annotations]})
+    return compile_annotations(df, min_upper, with_trie)
+
+
+@pytest.fixture
+def gazetteer():
+    return make_gazetteer()
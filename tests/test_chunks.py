@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Chunked matching (chunks.py, Matcher.match_chunks) has the same output as
+matching the whole document.
+"""
+import pytest
+from matcher import Matcher
+from chunks import MappedText
+from corpus import read_files
+
+# Words separated by tabs and non-breaking spaces: the windows around them
+# have no whitespace to remove half-catched words
+TEXT = ('El\tmédico\tde\tfamilia\testá\xa0sin\xa0trabajo. ' * 3 +
+        'Ayer el médico de familia habló con el jefe de policía, '
+        'que sigue sin trabajo.\n' * 4 +
+        'Otro\tjefe\tde\tpolicía\ten\xa0paro por el ERTE. ' * 3 +
+        'El médico de familia y el jefe de policía están en paro.')
+
+
+@pytest.mark.parametrize('engine', ['legacy', 'trie'])
+def test_chunked_tabs(gazetteer, engine):
+    whole = Matcher(gazetteer, engine).match(TEXT).to_list()
+    assert ['médico de familia', 125, 142, 'PROFESION'] in whole
+    for chunk_size in range(1, 120):
+        chunked = Matcher(gazetteer, engine, chunk_size).match(TEXT).to_list()
+        assert chunked == whole, chunk_size
+
+
+@pytest.mark.parametrize('engine', ['legacy', 'trie'])
+@pytest.mark.parametrize('newline', ['\n', '\r\n'])
+def test_mapped(gazetteer, engine, newline, tmp_path):
+    txt = TEXT.replace('\n', newline)
+    path = tmp_path / 'doc.txt'
+    path.write_bytes(txt.encode('utf-8'))
+    # Read files have the offsets of the file, as mapped ones
+    [(_, read)] = read_files(str(tmp_path))
+    assert read == txt
+    whole = Matcher(gazetteer, engine).match(read).to_list()
+    for chunk_size in [1, 16, 64, 1 << 20]:
+        mapped = Matcher(gazetteer, engine, chunk_size).match(MappedText(str(path)))
+        assert mapped.to_list() == whole, chunk_size
+
+
+def test_long_tokens():
+    from chunks import chunk_bounds, chunk_overlap
+    from utils import tokenize
+    # URLs and words followed by emojis, far longer than the overlap
+    txt = ' '.join(['el médico' + '\U0001f637' * 300, 'de familia',
+                    'https://example.org/' + 'a' * 500, 'jefe de policía'] * 4)
+    overlap = chunk_overlap(17)
+    tokens = tokenize(txt)
+    for chunk_size in [1, 10, 100, 400]:
+        for s, a, b, e in chunk_bounds(txt, chunk_size, overlap):
+            # Every window that reaches the core is inside the chunk
+            for start, end, _ in tokens:
+                if (start - overlap < b) & (end + overlap > a):
+                    assert s <= max(0, start - overlap)
+                    assert min(end + overlap, len(txt)) <= e
@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+A gazetteer updated with a delta (gazetteer.update_gazetteer) matches the
+same as the updated annotations compiled again.
+"""
+import pytest
+from matcher import Matcher
+from gazetteer import update_gazetteer
+from conftest import make_gazetteer, ANNOTATIONS
+
+TEXT = ('El Médico de familia y el médico de guardia, sin trabajo por el ERTE. '
+        'El jefe de policía está en paro y el MEDICO también. ')
+
+
+@pytest.mark.parametrize('engine', ['legacy', 'trie'])
+def test_delta(engine):
+    base = [('Médico', 'SITUACION_LABORAL')] + ANNOTATIONS[1:]
+    # Case variants of single-word entries under other labels, a relabelled
+    # entry, a removed one and a new label that sorts before the others
+    add = [('médico', 'PROFESION'),
+           ('MEDICO', 'ENFERMEDAD'),
+           ('erte', 'PROFESION'),
+           ('jefe de policía', 'ENFERMEDAD')]
+    remove = ['en paro']
+    annotations = dict(base)
+    for annot in remove:
+        del annotations[annot]
+    annotations.update(add)
+
+    updated = update_gazetteer(make_gazetteer(base), add, remove)
+    compiled = make_gazetteer(list(annotations.items()))
+    assert updated['labels'] == compiled['labels']
+    expected = Matcher(compiled, engine).match(TEXT).to_list()
+    assert ['médico', 26, 32, 'ENFERMEDAD'] in expected
+    assert Matcher(updated, engine).match(TEXT).to_list() == expected
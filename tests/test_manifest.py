@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Incremental runs (manifest.py) reuse the predictions of unchanged documents
+and have the same output as a full run.
+"""
+from matcher import Matcher
+from manifest import Manifest, manifest_fingerprint, iter_incremental
+
+TEXTS = ['El médico de familia está sin trabajo. ',
+         'Nada que ver',
+         'el jefe de policía y el médico en paro por el ERTE ']
+
+
+def run(path, fingerprint, docs, matcher, workers=1):
+    manifest = Manifest(path, fingerprint)
+    results = [(doc_id, predictions.to_list())
+               for doc_id, predictions in iter_incremental(docs, manifest, matcher,
+                                                           workers, 2)]
+    manifest.compact()
+    return results, manifest
+
+
+def test_reuse(gazetteer, tmp_path):
+    path = str(tmp_path / 'manifest.jsonl')
+    matcher = Matcher(gazetteer)
+    fingerprint = manifest_fingerprint('gazetteer', 'legacy')
+    docs = [(str(i), txt) for i, txt in enumerate(TEXTS * 3)]
+    full = [(doc_id, matcher.match(txt).to_list()) for doc_id, txt in docs]
+
+    results, manifest = run(path, fingerprint, docs, matcher)
+    assert results == full
+    assert (manifest.n_reused, manifest.n_new) == (0, len(docs))
+
+    # One document changed, one removed and one added
+    docs[4] = ('4', 'El jefe de policía ')
+    docs = docs[1:] + [('new', 'el médico sin trabajo ')]
+    full = [(doc_id, matcher.match(txt).to_list()) for doc_id, txt in docs]
+    # The run after it reuses every document
+    for workers in [1, 2]:
+        results, manifest = run(path, fingerprint, docs, matcher, workers)
+        assert results == full
+        assert manifest.n_new == (2 if workers == 1 else 0)
+        assert manifest.n_reused == len(docs) - manifest.n_new
+
+
+def test_fingerprint(gazetteer, tmp_path):
+    path = str(tmp_path / 'manifest.jsonl')
+    docs = [(str(i), txt) for i, txt in enumerate(TEXTS)]
+    fingerprint = manifest_fingerprint('gazetteer', 'legacy')
+    run(path, fingerprint, docs, Matcher(gazetteer))
+    # A run with another chunk size matches every document again
+    for other in [manifest_fingerprint('gazetteer', 'legacy', 16),
+                  manifest_fingerprint('gazetteer', 'legacy', 16, True),
+                  manifest_fingerprint('gazetteer', 'trie')]:
+        assert other != fingerprint
+        _, manifest = run(path, other, docs, Matcher(gazetteer, chunk_size=16))
+        assert manifest.n_reused == 0
+        fingerprint = other
+    _, manifest = run(path, fingerprint, docs, Matcher(gazetteer, chunk_size=16))
+    assert manifest.n_reused == len(docs)
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+check_occurrences finds the same matches as check_surroundings for every
+(annotation, occurrence) pair, and Matcher.match_batch the same as
+Matcher.match.
+"""
+import pytest
+from matcher import Matcher, check_occurrences, check_surroundings
+from ngrams import get_token_array
+from utils import format_text_info
+from conftest import make_gazetteer
+
+ANNOTATIONS = [('médico de familia', 'PROFESION'),
+               ('médico', 'PROFESION'),
+               ('jefe de policía', 'PROFESION'),
+               ('jefe  !en', 'PROFESION'),
+               ('a´b médico', 'PROFESION'),
+               ('sin trabajo', 'SITUACION_LABORAL'),
+               ('trabajo temporal', 'SITUACION_LABORAL')]
+
+TEXTS = ['El médico de familia está sin trabajo temporal. El médico de familia.\n',
+         'El\tmédico\tde\tfamilia, el jefe de\tpolicía y el jefe en paro ',
+         'Un a´b médico, un a´b MEDICO y un médico de\xa0familia sin trabajo ',
+         'médico médico de médico de familia de familia trabajo sin trabajo ']
+
+
+class Found():
+    '''
+    DESCRIPTION: records the matches of check_surroundings, in order.
+    '''
+    def __init__(self):
+        self.matches = []
+
+    def add(self, off0, off1, label):
+        self.matches.append((off0, off1))
+
+
+@pytest.mark.parametrize('txt', TEXTS)
+def test_check_occurrences(txt):
+    gazetteer = make_gazetteer(ANNOTATIONS)
+    words_final, words_processed2pos = format_text_info(txt, 3)
+    token_array = get_token_array(txt)
+    n_checked = 0
+    for token in words_final.intersection(gazetteer['annotations_final']):
+        locations = words_processed2pos[token]
+        annotations = [annotation for annotation in gazetteer['token2annots'][token]
+                       if annotation.n_words > 1]
+        found = check_occurrences(txt, locations, annotations, 3, token_array)
+        for annotation in annotations:
+            expected = Found()
+            for span in locations:
+                check_surroundings(txt, span, annotation.text, annotation.n_chars,
+                                   annotation.n_words, annotation.label, expected, 3,
+                                   annotation.processed)
+            assert found[annotation.text] == expected.matches, annotation.text
+            n_checked = n_checked + len(expected.matches)
+    assert n_checked > 0
+
+
+def test_match_batch(gazetteer):
+    docs = [(str(i), txt) for i, txt in enumerate(TEXTS * 3)]
+    matcher = Matcher(gazetteer)
+    expected = [(doc_id, matcher.match(txt).to_list()) for doc_id, txt in docs]
+    for workers in [1, 2]:
+        found = [(doc_id, predictions.to_list())
+                 for doc_id, predictions in matcher.match_batch(docs, workers, 2)]
+        assert found == expected
@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+The npz output (output.ColumnarWriter) reads back as the rows of the TSV
+output.
+"""
+import pytest
+from matcher import Matcher
+from output import ColumnarWriter, ColumnarReader, prediction_rows
+
+TEXTS = ['El médico de familia está sin trabajo. ',
+         'Nada que ver',
+         'el jefe de policía y el médico en paro por el ERTE ',
+         '']
+
+
+@pytest.mark.parametrize('sub_track', [1, 2])
+@pytest.mark.parametrize('row_group_size', [1, 3, 1 << 16])
+def test_round_trip(gazetteer, tmp_path, sub_track, row_group_size):
+    matcher = Matcher(gazetteer)
+    path = str(tmp_path / 'out.npz')
+    expected = []
+    with ColumnarWriter(path, sub_track, row_group_size) as writer:
+        for i, txt in enumerate(TEXTS * 2):
+            predictions = matcher.match(txt)
+            writer.write(str(i), predictions)
+            expected.extend(prediction_rows(str(i), predictions, sub_track))
+    with ColumnarReader(path) as reader:
+        assert reader.sub_track == sub_track
+        assert list(reader.rows()) == expected
+    assert reader.buffer.closed
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Results spilled to run files (spill.py) are taken in reading order.
+"""
+import os
+import random
+import spill
+from matcher import Matcher
+
+
+def test_spill_buffer(monkeypatch, tmp_path):
+    # Spill every 2 results and merge runs often
+    monkeypatch.setattr(spill, 'CHECK_EVERY', 2)
+    monkeypatch.setattr(spill, 'MAX_RUNS', 4)
+    numbers = list(range(1, 500))
+    random.Random(0).shuffle(numbers)
+    buffer = spill.SpillBuffer(1, str(tmp_path))
+    taken = []
+    # The first result comes last: nothing can be taken before
+    for number in numbers + [0]:
+        buffer.add(number, {'number': number})
+        taken.extend(result['number'] for result in buffer.ready())
+        assert len(buffer.runs) <= spill.MAX_RUNS
+    assert buffer.n_spilled > 0
+    assert buffer.n_runs > spill.MAX_RUNS
+    assert taken == list(range(500))
+    buffer.close()
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_iter_bounded(gazetteer, monkeypatch):
+    monkeypatch.setattr(spill, 'CHECK_EVERY', 2)
+    texts = ['El médico de familia está sin trabajo. ', 'Nada que ver',
+             'el jefe de policía y el médico en paro por el ERTE ']
+    docs = [(str(i), texts[i % 3] * (i % 7)) for i in range(200)]
+    matcher = Matcher(gazetteer)
+    expected = [(doc_id, matcher.match(txt).to_list()) for doc_id, txt in docs]
+    found = [(doc_id, predictions.to_list())
+             for doc_id, predictions in matcher.match_batch(iter(docs), 2, 3,
+                                                            max_memory=1)]
+    assert found == expected
@@ -0,0 +1,17 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Configurations of a sweep (sweep.make_configs) have unique names, so that
+no output file overwrites another one.
+"""
+from sweep import make_configs
+
+
+def test_unique_names():
+    stopwords = ['default', 'a/stop.txt', 'b/stop.txt', 'stop-2.txt', 'a/stop.txt']
+    configs = make_configs([3, 3], stopwords, [['PROFESION']], ['legacy', 'trie'])
+    names = [config['name'] for config in configs]
+    assert len(names) == len(set(names)) == 4 * 2
+    assert [config['stopwords'] for config in configs if config['engine'] == 'trie'] == \
+        ['default', 'a/stop.txt', 'b/stop.txt', 'stop-2.txt']
+    assert 'mu3_sw-stop-2_PROFESION_legacy' in names
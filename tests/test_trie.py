@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+The trie engine (trie.py) finds the same annotations as the legacy engine.
+"""
+import random
+import pytest
+from matcher import Matcher
+from conftest import make_gazetteer
+
+ANNOTATIONS = [('jefe de policía', 'PROFESION'),
+               ('jefe  !en', 'PROFESION'),
+               ('a´b médico', 'PROFESION'),
+               ('médico', 'PROFESION'),
+               ('Médico de familia', 'SITUACION_LABORAL'),
+               ('médico de familia', 'PROFESION'),
+               ('en paro', 'SITUACION_LABORAL'),
+               ('A B', 'SITUACION_LABORAL')]
+
+TEXTS = ['El jefe de\tpolicía está en\xa0paro.',
+         'jefe\tde\tpolicía, jefe  en paro y jefe de policía',
+         'Un a´b MEDICO y un a´b médico de guardia',
+         'el médico de familia, el Médico De Familia',
+         'A B, a b y A  B',
+         '']
+
+
+def matches(gazetteer, txt):
+    return [Matcher(gazetteer, engine).match(txt).to_list()
+            for engine in ['legacy', 'trie']]
+
+
+@pytest.mark.parametrize('txt', TEXTS)
+def test_same_matches(txt):
+    legacy, trie = matches(make_gazetteer(ANNOTATIONS), txt)
+    assert legacy == trie
+
+
+def test_spacing_accents():
+    legacy, trie = matches(make_gazetteer(ANNOTATIONS), 'Un a´b MEDICO hoy')
+    assert ['a´b MEDICO', 3, 13, 'PROFESION'] in trie
+    assert legacy == trie
+
+
+def test_equal_spans():
+    # The first label is kept, whatever the order of the GS annotations
+    for annotations in [ANNOTATIONS, ANNOTATIONS[::-1]]:
+        for predictions in matches(make_gazetteer(annotations), 'el médico de familia hoy'):
+            assert predictions == [['médico de familia', 3, 20, 'PROFESION']]
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_random(seed):
+    rnd = random.Random(seed)
+    alphabet = list('abcdeñóúBCDE´¨.,;:¡!¿?-/#@') + [' '] * 4 + ['\t', '\n', '\xa0']
+
+    def word():
+        return ''.join(rnd.choice(alphabet) for _ in range(rnd.randint(1, 6))).strip()
+
+    for _ in range(40):
+        annotations = [' '.join(word() for _ in range(rnd.randint(1, 3)))
+                       for _ in range(rnd.randint(1, 8))]
+        annotations = [(annot, rnd.choice(['PROFESION', 'SITUACION_LABORAL']))
+                       for annot in set(annotations) if annot.strip()]
+        if not annotations:
+            continue
+        gazetteer = make_gazetteer(annotations)
+        for _ in range(5):
+            pieces = [rnd.choice(annotations)[0] if rnd.random() < 0.4 else word()
+                      for _ in range(rnd.randint(1, 10))]
+            txt = rnd.choice([' ', '\n', '\t', '  ']).join(pieces)
+            legacy, trie = matches(gazetteer, txt)
+            assert legacy == trie, (txt, annotations)
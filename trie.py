@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Token-level trie matching engine.
+
+The gazetteer is compiled once into a trie of normalized tokens. Then, every
+document is tokenized once and the trie is walked from every token, instead
+of re-tokenizing a window of text for every (token occurrence, annotation)
+pair as check_surroundings does.
+
+The matches are the same as those of the legacy engine, but for one case:
+in the window of a token occurrence, check_surroundings finds one match of
+every annotation (the last token combination normalized to it). When two
+matches of the same annotation share a window (e.g. they overlap), the
+legacy engine may miss one of them, and the trie finds both.
+"""
+import re
+from utils import (remove_accents, tokenize, index_words,
+                   annotation_record, PUNCT_TABLE, STOP_WORDS)
+from records import label_table
+
+# Key that marks the end of a gazetteer entry inside a trie node
+END = None
+
+
+def build_trie(annot2label, annot2annot_processed, min_upper):
+    '''
+    DESCRIPTION: compile the gazetteer into a token-level trie (multi-word
+              annotations) and a dictionary (single-word annotations).
+
+    INPUT: annot2label: python dict with every unmodified annotation and
+              its label.
+           annot2annot_processed: python dict with every unmodified annotation
+              and the words it has normalized.
+           min_upper: int. Specifies the minimum number of characters of a word
+               to lowercase it (to prevent mistakes with acronyms).
+
+    OUTPUT: trie: nested python dict {normalized word: child node}, with
+              the words of the normalized annotations (see
+              utils.normalize_str). Nodes where an annotation ends store,
+              under the key END, the list of records.Annotation that end
+              there.
+            unigrams: python dict relating the normalized token of every
+              single-word annotation with its label id.
+    '''
+    label2id = {label: i for i, label in enumerate(label_table(annot2label))}
+    trie = {}
+    unigrams = {}
+    # Sorted, so that the trie does not depend on dictionary order
+    for annot in sorted(annot2annot_processed):
+        anchors = annot2annot_processed[annot]
+        if not anchors:
+            # No token of this annotation can be a candidate.
+            continue
+        label = label2id[annot2label[annot]]
+        if len(annot.split()) == 1:
+            # Of equal spans, the first label is kept (see spans.py)
+            for token in anchors:
+                unigrams[token] = min(unigrams.get(token, label), label)
+            continue
+        annotation = annotation_record(annot, label, anchors, min_upper)
+        node = trie
+        for token in annotation.processed.split(' '):
+            node = node.setdefault(token, {})
+        node.setdefault(END, []).append(annotation)
+    return trie, unigrams
+
+
+def window_contains(txt, s0, s1, n_chars, p0, p1):
+    '''
+    DESCRIPTION: check whether the window that check_surroundings explores
+              around the token occurrence (s0, s1) contains the span (p0, p1).
+    '''
+    w0 = max(0, s0 - n_chars)
+    w1 = min(s1 + n_chars, len(txt))
+    large_span = txt[w0:w1]
+    first_space = re.search('( |\n)', large_span)
+    if first_space is None:
+        return False
+    last_space = len(large_span) - re.search('( |\n)', large_span[::-1]).span()[0]
+    return (w0 + first_space.span()[1] <= p0) & (p1 <= w0 + last_space)
+
+
+def is_reachable(txt, key2pos, p0, p1, n_chars, anchors):
+    '''
+    DESCRIPTION: a multi-word match spanning (p0, p1) is only found if one
+              of the tokens of the annotation occurs close enough to it
+              (see check_surroundings).
+    '''
+    for anchor in anchors:
+        for s0, s1 in key2pos.get(anchor, []):
+            if ((s0 - n_chars <= p0) & (p1 <= s1 + n_chars) and
+                window_contains(txt, s0, s1, n_chars, p0, p1)):
+                return True
+    return False
+
+
+def find_matches(txt, trie, unigrams, min_upper, spans, stopwords=STOP_WORDS):
+    '''
+    DESCRIPTION: find all gazetteer entries in a text in one pass over its
+              tokens. Matches contained in another match are discarded by 
+              spans, as in the legacy engine.
+
+    INPUT: txt: str with the text.
+           trie, unigrams: output of build_trie.
+           min_upper: int. Specifies the minimum number of characters of a word
+               to lowercase it (to prevent mistakes with acronyms).
+           spans: SpanSet where the matches are stored.
+           stopwords: set of words that are not indexed.
+    '''
+    tokens = tokenize(txt)
+    # Normalized tokens, split in the words of the trie: the normalization
+    # of some characters (e.g. spacing accents) has whitespaces. As in
+    # check_surroundings, token combinations of up to min_upper characters
+    # are not lowercased.
+    normalized = [remove_accents(token.lower().translate(PUNCT_TABLE)).split(' ')
+                  for _, _, token in tokens]
+    cased = [remove_accents(token.translate(PUNCT_TABLE)).split(' ')
+             if len(token) <= min_upper else None for _, _, token in tokens]
+    key2pos = index_words(tokens, min_upper, stopwords)
+
+    candidates = []
+    
+    # Single-word annotations: occurrence must be surrounded by non 
+    # alphanumeric characters
+    for key in sorted(unigrams.keys() & key2pos.keys()):
+        for start, end in key2pos[key]:
+            try:
+                if ((txt[start-1].isalnum() == False) &
+                    (txt[end].isalnum() == False)):
+                    candidates.append((start, end, unigrams[key]))
+            except IndexError:
+                pass
+
+    # Multi-word annotations: walk the trie from every token
+    for i in range(len(tokens)):
+        for words, short in ((normalized, False), (cased, True)):
+            node = trie
+            n_chars = -1
+            for j in range(i, len(tokens)):
+                n_chars = n_chars + 1 + tokens[j][1] - tokens[j][0]
+                if short & (n_chars > min_upper):
+                    break
+                for word in words[j]:
+                    node = node.get(word)
+                    if node is None:
+                        break
+                if node is None:
+                    break
+                if short == (n_chars <= min_upper):
+                    p0 = tokens[i][0]
+                    p1 = tokens[j][1]
+                    for annotation in node.get(END, []):
+                        if is_reachable(txt, key2pos, p0, p1, annotation.n_chars,
+                                        annotation.anchors):
+                            candidates.append((p0, p1, annotation.label))
+
+    # Keep the longest matches
+    for off0, off1, label in candidates:
+        spans.add(off0, off1, label)
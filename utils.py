@@ -7,12 +7,53 @@ Created on Mon Jan 13 18:10:50 2020
 """
 import unicodedata
 import string
-from spacy.lang.es import STOP_WORDS
+import functools
+from stopwords import STOP_WORDS
+from records import Annotation, label_table
 import re
 
+# Maximum number of strings kept by every normalization cache
+NORMALIZATION_CACHE_SIZE = 1 << 16
 
+# Translation table to remove punctuation signs
+PUNCT_TABLE = str.maketrans('', '', string.punctuation)
+
+WHITESPACE = re.compile(r'\s+')
+
+class AccentTable(dict):
+    '''
+    DESCRIPTION: translation table (for str.translate) from every character
+              to the printable characters of its NFKD decomposition. Entries
+              are computed the first time a character is found.
+    '''
+    def __missing__(self, code):
+        value = ''.join(x for x in unicodedata.normalize('NFKD', chr(code)) 
+                        if x in string.printable)
+        self[code] = value
+        return value
+
+ACCENT_TABLE = AccentTable()
+
+
+@functools.lru_cache(maxsize=NORMALIZATION_CACHE_SIZE)
 def remove_accents(data):
-    return ''.join(x for x in unicodedata.normalize('NFKD', data) if x in string.printable)
+    # Same as keeping the printable characters of the NFKD decomposition of
+    # the whole string: non-printable characters (combining marks) are
+    # removed, so their canonical reordering does not matter.
+    return data.translate(ACCENT_TABLE)
+
+def normalization_cache_info():
+    '''
+    DESCRIPTION: hits, misses and size of the normalization caches.
+    
+    OUTPUT: python dict {function name: functools CacheInfo}
+    '''
+    return {'remove_accents': remove_accents.cache_info(),
+            'normalize_str': normalize_str.cache_info()}
+
+def clear_normalization_cache():
+    remove_accents.cache_clear()
+    normalize_str.cache_clear()
 
 def Flatten(ul):
     '''
@@ -29,19 +70,24 @@ def Flatten(ul):
     return fl
 
 
-def format_ann_info(df_annot, min_upper):
+def format_ann_info(df_annot, min_upper, stopwords=STOP_WORDS):
     '''
     DESCRIPTION: Build useful Python dicts from DataFrame with info from TSV file
     
     INPUT: df_annot: pandas DataFrame with 4 columns: 'filename', 'label', 'code', 'span'
            min_upper: int. Specifies the minimum number of characters of a word
                to lowercase it (to prevent mistakes with acronyms).
+           stopwords: set of words that are not indexed.
     
     OUTPUT: annot2label: python dict with every unmodified annotation and 
               its label.
             annot2annot_processed: python dict with every unmodified annotation
               and the words it has normalized.
             annotations_final: set of word in annotations.
+            token2annots: python dict (inverted index) relating every word in
+              annotations_final with the annotations that contain it. Every 
+              annotation is stored once, as a records.Annotation (with the id
+              of its label in records.label_table(annot2label)).
     '''
     df_annot.columns = ['filename', 'pos0', 'pos1', 'label', 'span']
     df_annot = df_annot.drop(['pos0', 'pos1'], axis=1)
@@ -53,38 +99,144 @@ def format_ann_info(df_annot, min_upper):
     
     annot2annot = dict(zip(set_annotations, set_annotations))
     
-    # Split values: {'one': 'three two'} must be {'one': ['three', 'two']}   
-    annot2annot_split = annot2annot.copy()
-    annot2annot_split = dict((k, v.split()) for k,v in annot2annot_split.items())
-    
-    # Do not store stopwords or single-character words as values
-    for k, v in annot2annot_split.items():
-        annot2annot_split[k] = list(filter(lambda x: x not in STOP_WORDS, v))
-    for k, v in annot2annot_split.items():
-        annot2annot_split[k] = list(filter(lambda x: len(x) > 1, v))
-    
-    # Trim punctuation or multiple spaces
-    annot2annot_trim = annot2annot.copy()
-    for k, v in annot2annot_split.items():
-        annot2annot_trim[k] = list(map(lambda x: x.strip(string.punctuation + ' '), v))
-        
-    # Lower case values
-    annot2annot_lower = annot2annot_trim.copy()
-    for k, v in annot2annot_trim.items():
-        annot2annot_lower[k] = list(map(lambda x: x.lower() if len(x) > min_upper else x, v))
-    
-    # remove accents from annotations
-    annot2annot_processed = annot2annot_lower.copy()
-    for k, v in annot2annot_lower.items():
-        annot2annot_processed[k] = list(map(lambda x: remove_accents(x), v))
+    # Normalized words of every annotation
+    annot2annot_processed = dict((k, annotation_words(k, min_upper, stopwords))
+                                 for k in annot2annot)
         
     # Get list of all processed words in annotations (except STOPWORDS or single-character)
     annotations_final = set(Flatten(list(annot2annot_processed.values())))
     
-    return annot2label, annot2annot_processed, annotations_final
+    # Inverted index: every word in annotations and the annotations where 
+    # it is present
+    label2id = {label: i for i, label in enumerate(label_table(annot2label))}
+    token2annots = {}
+    for k, v in annot2annot_processed.items():
+        entry = annotation_record(k, label2id[annot2label[k]], v, min_upper)
+        for token in dict.fromkeys(v):
+            token2annots.setdefault(token, []).append(entry)
+    
+    return annot2label, annot2annot_processed, annotations_final, token2annots
+
+
+def annotation_words(annot, min_upper, stopwords=STOP_WORDS):
+    '''
+    DESCRIPTION: normalized words of an annotation, as stored in 
+              annot2annot_processed (see format_ann_info).
+    
+    INPUT: annot: str with the unmodified annotation.
+           min_upper: int. Specifies the minimum number of characters of a word
+               to lowercase it (to prevent mistakes with acronyms).
+           stopwords: set of words that are not stored.
+    
+    OUTPUT: words: list of str.
+    '''
+    # Split: 'three two' must be ['three', 'two']
+    words = annot.split()
+    
+    # Do not store stopwords or single-character words
+    words = [x for x in words if (x not in stopwords) & (len(x) > 1)]
+    
+    # Trim punctuation or multiple spaces
+    words = [x.strip(string.punctuation + ' ') for x in words]
+    
+    # Lower case words and remove accents
+    return [remove_accents(x.lower() if len(x) > min_upper else x) for x in words]
+
+
+def annotation_record(annot, label, words, min_upper):
+    '''
+    DESCRIPTION: compact record of an annotation (records.Annotation). It
+              shares the annotation string when it is already normalized,
+              and the list of words of annot2annot_processed.
+    
+    INPUT: annot: str with the unmodified annotation.
+           label: label id (see records.label_table).
+           words: output of annotation_words.
+           min_upper: int. Specifies the minimum number of characters of a word
+               to lowercase it (to prevent mistakes with acronyms).
+    '''
+    processed = normalize_str(annot, min_upper)
+    return Annotation(annot, label, len(annot), len(annot.split()),
+                      annot if processed == annot else processed, words)
 
 
-def format_text_info(txt, min_upper):
+def tokenize(txt):
+    '''
+    DESCRIPTION: split a text into tokens in one pass. Tokens are sequences of
+              non-whitespace characters that are not only punctuation signs,
+              without initial and final punctuation.
+    
+    INPUT: txt: str with the text to tokenize.
+    
+    OUTPUT: tokens: list of (start, end, token) tuples, in text order. The 
+              position of a token in the list is its token index.
+    '''
+    if isinstance(txt, TokenizedText):
+        return txt.tokens
+    tokens = []
+    for m in re.finditer(r'\S+', txt):
+        m_end, m_start, m_group, _ = strip_punct(m.end(), m.start(), m.group(), 0)
+        if m_group:
+            tokens.append((m_start, m_end, m_group))
+    return tokens
+
+
+class TokenizedText(str):
+    '''
+    DESCRIPTION: text that keeps its tokens, to be matched several times
+              (e.g. with several gazetteer configurations, see sweep.py)
+              without tokenizing it again. It is used as a str.
+              tokens: output of tokenize (not to be modified).
+              token_array: ngrams.TokenArray of the text, built the first
+              time it is needed (see ngrams.get_token_array).
+    
+    INPUT: txt: str with the text.
+    '''
+    def __new__(cls, txt):
+        self = str.__new__(cls, txt)
+        self.tokens = tokenize(str(txt))
+        self.token_array = None
+        return self
+
+
+def normalize_word(word, min_upper, stopwords=STOP_WORDS):
+    '''
+    DESCRIPTION: normalize a word of a text: lowercase it and remove accents
+              if it is longer than min_upper characters.
+    
+    INPUT: stopwords: set of words that are not indexed.
+    
+    OUTPUT: word_processed: str, or None for stopwords and single-character 
+              words.
+    '''
+    if (len(word) <= 1) | (word.lower() in stopwords):
+        return None
+    if len(word) > min_upper:
+        return remove_accents(word.lower())
+    return word
+
+
+def index_words(tokens, min_upper, stopwords=STOP_WORDS):
+    '''
+    DESCRIPTION: relate every normalized word (see normalize_word) with the 
+              positions of its occurrences.
+    
+    INPUT: tokens: output of tokenize.
+           min_upper: int. Specifies the minimum number of characters of a word
+               to lowercase it (to prevent mistakes with acronyms).
+           stopwords: set of words that are not indexed.
+    
+    OUTPUT: words_processed2pos: python dict {normalized word: [(start, end)]}
+    '''
+    words_processed2pos = {}
+    for start, end, word in tokens:
+        word_processed = normalize_word(word, min_upper, stopwords)
+        if word_processed is not None:
+            words_processed2pos.setdefault(word_processed, []).append((start, end))
+    return words_processed2pos
+
+
+def format_text_info(txt, min_upper, stopwords=STOP_WORDS):
     '''
     DESCRIPTION: 
     1. Obtain list of words of interest in text (no STPW and longer than 1 character)
@@ -95,6 +247,7 @@ def format_text_info(txt, min_upper):
     INPUT: txt: str with the text to format.
            min_upper: int. Specifies the minimum number of characters of a word
                to lowercase it (to prevent mistakes with acronyms).
+           stopwords: set of words that are not indexed.
     
     OUTPUT: words_processed2pos: dictionary relating the word normalzied (trimmed,
                 removed stpw, lowercased, removed accents) and its position in
@@ -102,29 +255,8 @@ def format_text_info(txt, min_upper):
             words_final: set of words in text.
     '''
     
-    # Get individual words and their position in original txt
-    words = txt.split()
-    
-    # Remove beginning and end punctuation and whitespaces. 
-    words_no_punctuation = list(map(lambda x: x.strip(string.punctuation + ' '), words))
-    
-    # Remove stopwords and single-character words
-    large_words = list(filter(lambda x: len(x) > 1, words_no_punctuation))
-    words_no_stw = set(filter(lambda x: x.lower() not in STOP_WORDS, large_words))
-    
-    # Create dict with words and their positions in text
-    words2pos = {}
-    for word in words_no_stw:
-        occurrences = list(re.finditer(re.escape(word), txt))
-        if len(occurrences) == 0:
-            print(word)
-            raise ValueError('ERROR: ORIGINAL WORD NOT FOUND IN ORIGINAL TEXT')
-        pos = list(map(lambda x: x.span(), occurrences))
-        words2pos[word] = pos
-
-    # lowercase words and remove accents from words
-    words_processed2pos = dict((remove_accents(k.lower()), v) if len(k) > min_upper else 
-                                (k,v) for k,v in words2pos.items())
+    # Tokenize text, normalize words and get their positions in one pass
+    words_processed2pos = index_words(tokenize(txt), min_upper, stopwords)
     
     # Set of transformed words
     words_final = set(words_processed2pos)
@@ -133,7 +265,7 @@ def format_text_info(txt, min_upper):
 
 
 
-def adjacent_combs(text, tokens2pos, n_words):
+def adjacent_combs(tokens, n_words):
     '''
     DESCRIPTION: obtain all token combinations in a text. The maximum number
     of tokens in a combination is given by n_words.
@@ -141,9 +273,7 @@ def adjacent_combs(text, tokens2pos, n_words):
     output: [buenos, buenos días, buenos días míster, días, días míster, 
     días míster jones, míster, míster jones, jones]
     
-    INPUT: text: string with full text
-           tokens2pos: dictionary relating every token with its position in 
-                  text. {tokens: (start, end)}
+    INPUT: tokens: output of tokenize.
            n_words: maximum number of tokens in a combination
     
     OUTPUT: id2token_span: dictionary relating every token combination with an ID.
@@ -151,53 +281,17 @@ def adjacent_combs(text, tokens2pos, n_words):
                   (identified by an ID) with its position in the text.
             token_spans: list of token combinations.'''
     
-    tokens = []
-    for m in re.finditer(r'\S+', text):
-        if all([i in string.punctuation for i in m.group()])==False:
-            tokens.append(m.group())
-
-    tokens_trim = list(map(lambda x: x.strip(string.punctuation), tokens))
     id2token_span = {}
     id2token_span_pos = {}
     count = 0
     
-    tokens = tokens_trim
-    
-    for a in range(0, len(tokens)+1):
+    for a in range(0, len(tokens)):
         for b in range(a+1, min(a + 1 + n_words, len(tokens)+1)):
             count = count + 1
             
-            # Obtain combinations
-            tokens_group = tokens[a:b] # Extract token group
-            tokens_group = list(filter(None, tokens_group)) # remove empty elements
-            
-            if tokens_group:
-                
-                # Extract previous token
-                token_prev = '' 
-                if a>0:
-                    c = 1
-                    token_prev = tokens_trim[a-c:a][0]
-                    # If token_prev is an empty space, it may be because there
-                    # where a double empty space in the original text
-                    while (token_prev == '') & (a>1):
-                        c = c+1
-                        token_prev = tokens_trim[a-c:a][0]
-                        
-                id2token_span[count] = tokens_group
-                
-                # Extract start and end positions
-                if len(tokens_group) == 1:
-                    pos = list(filter(lambda x: x[2] == token_prev, tokens2pos[tokens_group[0]]))
-                    beg_pos = pos[0][0]
-                    end_pos = pos[0][1]
-                else:
-                    beg =  list(filter(lambda x: x[2] == token_prev, tokens2pos[tokens_group[0]]))
-                    end = list(filter(lambda x: x[2] == tokens_group[-2], tokens2pos[tokens_group[-1]]))
-                    beg_pos = beg[0][0]
-                    end_pos = end[0][1]
-                    
-                id2token_span_pos[count] = (beg_pos, end_pos) 
+            # Obtain combinations and their start and end positions
+            id2token_span[count] = [token for _, _, token in tokens[a:b]]
+            id2token_span_pos[count] = (tokens[a][0], tokens[b-1][1])
 
     token_spans = list(map(lambda x: ' '.join(x), id2token_span.values()))
     
@@ -206,40 +300,23 @@ def adjacent_combs(text, tokens2pos, n_words):
 
 def strip_punct(m_end, m_start, m_group, exit_bool):
     '''
-    DESCRIPTION: remove recursively final and initial punctuation from 
-              string and update start and end offset.
+    DESCRIPTION: remove final and initial punctuation from string and update
+              start and end offset.
     
-    INPUT: exit_bool: boolean value to tell whether to continue with the 
-                      recursivety.
+    INPUT: exit_bool: kept for compatibility, not used.
           m_end: end offset
           m_start: start offset
           m_group: string
     
-    OUTPUT: exit_bool: boolean value to tell whether to continue with the 
-                      recursivety.
+    OUTPUT: exit_bool: always 1.
           m_end: end offset
           m_start: start offset
-          m_group: string
+          m_group: string (empty if it only had punctuation signs)
     '''
-    
-    if m_group[-1] in string.punctuation:
-        m_end = m_end - 1
-        m_group = m_group[0:-1]
-        m_start = m_start
-        exit_bool = 0
-    elif m_group[0] in string.punctuation:
-        m_end = m_end
-        m_group = m_group[1:]
-        m_start = m_start + 1
-        exit_bool = 0
-    else: 
-        m_end = m_end
-        m_group = m_group
-        m_start = m_start
-        exit_bool = 1
-    if exit_bool == 0:
-        m_end, m_start, m_group, exit_bool = strip_punct(m_end, m_start, m_group, exit_bool)
-    return m_end, m_start, m_group, exit_bool
+    m_start = m_start + len(m_group) - len(m_group.lstrip(string.punctuation))
+    m_group = m_group.strip(string.punctuation)
+    m_end = m_start + len(m_group)
+    return m_end, m_start, m_group, 1
 
 
 def tokenize_span(text, n_words):
@@ -257,28 +334,8 @@ def tokenize_span(text, n_words):
     #         token_spans: list of token combinations
     '''
     
-    tokens2pos = {}
-    
-    # Split text into tokens (words), obtain their position and the previous token.
-    m_last = ''
-    for m in re.finditer(r'\S+', text):
-        if all([i in string.punctuation for i in m.group()])==False:
-            exit_bool = 0
-            
-            # remove recursively final and initial punctuation
-            m_end, m_start, m_group, exit_bool = strip_punct(m.end(), m.start(), 
-                                                             m.group(), exit_bool)
-                
-            # fill dictionary
-            if m_group in tokens2pos.keys():
-                tokens2pos[m_group].append([m_start, m_end, m_last])
-            else:
-                tokens2pos[m_group] = [[m_start, m_end, m_last]]
-            m_last = m_group
-        
     # Obtain token combinations
-    id2token_span, id2token_span_pos, token_spans = adjacent_combs(text, 
-                                                                   tokens2pos,
+    id2token_span, id2token_span_pos, token_spans = adjacent_combs(tokenize(text),
                                                                    n_words)
     
     # Reverse dict (no problem, keys and values are unique)
@@ -297,17 +354,18 @@ def normalize_tokens(token_spans, min_upper):
                                        (k,v) for k,v in token_span2token_span.items())
 
     # Remove whitespaces
-    token_span_bs2token_span = dict((re.sub('\s+', ' ', k).strip(), v) for k,v 
+    token_span_bs2token_span = dict((WHITESPACE.sub(' ', k).strip(), v) for k,v 
                                     in token_span_lower2token_span.items())
 
     # Remove punctuation
-    token_span_punc2token_span = dict((k.translate(str.maketrans('', '', string.punctuation)), v) for k,v in token_span_bs2token_span.items())
+    token_span_punc2token_span = dict((k.translate(PUNCT_TABLE), v) for k,v in token_span_bs2token_span.items())
     
     # Remove accents
     token_span_processed2token_span = dict((remove_accents(k), v) for k,v in token_span_punc2token_span.items())
     
     return token_span_processed2token_span
 
+@functools.lru_cache(maxsize=NORMALIZATION_CACHE_SIZE)
 def normalize_str(annot, min_upper):
     '''
     DESCRIPTION: normalize annotation: lowercase, remove extra whitespaces, 
@@ -324,27 +382,12 @@ def normalize_str(annot, min_upper):
     annot_lower = ' '.join(list(map(lambda x: x.lower() if len(x)>min_upper else x, annot.split(' '))))
     
     # Remove whitespaces
-    annot_bs = re.sub('\s+', ' ', annot_lower).strip()
+    annot_bs = WHITESPACE.sub(' ', annot_lower).strip()
 
     # Remove punctuation
-    annot_punct = annot_bs.translate(str.maketrans('', '', string.punctuation))
+    annot_punct = annot_bs.translate(PUNCT_TABLE)
     
     # Remove accents
     annot_processed = remove_accents(annot_punct)
     
     return annot_processed
-
-
-def eliminate_contained_annots(pos_matrix, new_annotations, off0, off1):
-    '''
-    DESCRIPTION: function to be used when a new annotation is found. 
-              It check whether this new annotation contains in it an already 
-              discovered annotation. In that case, the old annotation is 
-              redundant, since the new one contains it. Then, the function
-              removes the old annotation.
-    '''
-    to_eliminate = [pos for item, pos in zip(pos_matrix, range(0, len(new_annotations))) if (off0<=item[0]) & (item[1]<=off1)]
-    new_annotations = [item for item, pos in zip(new_annotations, range(0, len(new_annotations))) if pos not in to_eliminate]
-    pos_matrix = [item for item in pos_matrix if not (off0<=item[0]) & (item[1]<=off1)]
-    
-    return pos_matrix, new_annotations
\ No newline at end of file